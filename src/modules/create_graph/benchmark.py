@@ -0,0 +1,318 @@
+"""
+Benchmark of the graph creation steps on synthetic map data.
+Run from the src folder:
+    python -m modules.create_graph.benchmark haversine --nodes 100000 --posts 1000
+    python -m modules.create_graph.benchmark spatial --nodes 100000 --posts 1000
+    python -m modules.create_graph.benchmark osm --nodes 1000000 --workers 4
+    python -m modules.create_graph.benchmark neighbours --side 100 --posts 100
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import io
+import multiprocessing
+import os
+import struct
+import tempfile
+import time
+import xml.sax
+import zlib
+
+import numpy as np
+
+from .data_parser.parse_osm import OsmParsers
+from .data_parser.parse_pbf import PbfParser
+from .data_parser.stream_osm import OsmStreamParser, peak_rss_mb
+from .neighbours_finder import NeighboursFinder
+from .pojo.search_node import SearchNode
+from .utils import utils
+from ..utils.spatial_index import SpatialIndex
+
+# bounding box of the SLO-CRO use case, synthetic points are drawn inside it
+MIN_LAT, MAX_LAT = 42.4, 46.9
+MIN_LON, MAX_LON = 13.3, 19.4
+
+
+def random_points(n, seed):
+    """n uniformly drawn (lat, lon) points inside the bounding box"""
+    rng = np.random.default_rng(seed)
+    return rng.uniform(MIN_LAT, MAX_LAT, n), rng.uniform(MIN_LON, MAX_LON, n)
+
+
+def nearest_loop(lats, lons, query_lats, query_lons):
+    """Nearest point for every query with calcDistance in a Python loop, as align_nodes_and_posts did"""
+    indexes = []
+    for query_lat, query_lon in zip(query_lats, query_lons):
+        min_dist = float('inf')
+        min_idx = -1
+        for idx, (lat, lon) in enumerate(zip(lats, lons)):
+            dist = utils.calcDistance(query_lat, query_lon, lat, lon)
+            if dist < min_dist:
+                min_dist = dist
+                min_idx = idx
+        indexes.append(min_idx)
+    return np.array(indexes)
+
+
+def run_haversine(n_nodes, n_posts, loop_posts, chunk_size, seed):
+    """Nearest node for every post: Python loop on loop_posts posts, extrapolated to all, against utils.nearest"""
+    lats, lons = random_points(n_nodes, seed)
+    post_lats, post_lons = random_points(n_posts, seed + 1)
+    loop_posts = min(loop_posts, n_posts)
+    print("{} nodes x {} posts".format(n_nodes, n_posts))
+
+    start_time = time.time()
+    loop_indexes = nearest_loop(lats.tolist(), lons.tolist(), post_lats[:loop_posts].tolist(),
+                                post_lons[:loop_posts].tolist())
+    loop_time = (time.time() - start_time) * n_posts / loop_posts
+
+    start_time = time.time()
+    indexes, _ = utils.nearest(lats, lons, post_lats, post_lons, chunk_size=chunk_size)
+    vector_time = time.time() - start_time
+
+    if not np.array_equal(loop_indexes, indexes[:loop_posts]):
+        raise ValueError('Vectorized nearest nodes differ from the Python loop')
+    print("{:<12} {:>10}".format("method", "wall"))
+    print("{:<12} {:>10.3f} (extrapolated from {} posts)".format("loop", loop_time, loop_posts))
+    print("{:<12} {:>10.3f}".format("numpy", vector_time))
+    print("speed-up {:.0f}x".format(loop_time / vector_time))
+
+
+def run_spatial(n_nodes, n_posts, chunk_size, seed):
+    """Nearest node for every post: utils.nearest against building and querying the spatial index"""
+    lats, lons = random_points(n_nodes, seed)
+    post_lats, post_lons = random_points(n_posts, seed + 1)
+    print("{} nodes x {} posts".format(n_nodes, n_posts))
+
+    start_time = time.time()
+    indexes, _ = utils.nearest(lats, lons, post_lats, post_lons, chunk_size=chunk_size)
+    vector_time = time.time() - start_time
+
+    start_time = time.time()
+    index = SpatialIndex(lats, lons)
+    build_time = time.time() - start_time
+    start_time = time.time()
+    labels, _ = index.query_many(post_lats, post_lons)
+    query_time = time.time() - start_time
+
+    if not np.array_equal(indexes, labels):
+        raise ValueError('Spatial index nearest nodes differ from utils.nearest')
+    print("{:<12} {:>10}".format("method", "wall"))
+    print("{:<12} {:>10.3f}".format("numpy", vector_time))
+    print("{:<12} {:>10.3f}".format("tree build", build_time))
+    print("{:<12} {:>10.3f}".format("tree query", query_time))
+
+
+def synthetic_map(n_nodes, road_share, seed):
+    """Coordinates of n_nodes nodes in units of 1e-7 degrees and ways as (node ids, tag), road_share of the nodes are
+    on highway ways of 10 nodes, the rest on buildings"""
+    rng = np.random.default_rng(seed)
+    lats, lons = random_points(n_nodes, seed)
+    lats, lons = np.round(lats * 1e7).astype(np.int64), np.round(lons * 1e7).astype(np.int64)
+    n_road = int(n_nodes * road_share)
+    ways = []
+    for start in range(0, n_road - 1, 9):  # consecutive ways share their end nodes
+        highway = "residential" if rng.random() < 0.9 else "footway"
+        ways.append((list(range(start + 1, min(start + 10, n_road) + 1)), ("highway", highway)))
+    for start in range(n_road, n_nodes - 3, 4):
+        ways.append((list(range(start + 1, start + 5)), ("building", "yes")))
+    return lats, lons, ways
+
+
+def write_osm_fixture(osm_path, n_nodes, road_share, seed):
+    """Synthetic .osm file of synthetic_map"""
+    lats, lons, ways = synthetic_map(n_nodes, road_share, seed)
+    with open(osm_path, "w", encoding="utf8") as osm_file:
+        osm_file.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6">\n')
+        for i in range(n_nodes):
+            osm_file.write('  <node id="{}" lat="{:.7f}" lon="{:.7f}" version="1"/>\n'.format(
+                i + 1, lats[i] / 1e7, lons[i] / 1e7))
+        for way_id, (refs, (key, value)) in enumerate(ways, 1):
+            osm_file.write('  <way id="{}">\n'.format(way_id))
+            osm_file.write(''.join('    <nd ref="{}"/>\n'.format(ref) for ref in refs))
+            osm_file.write('    <tag k="{}" v="{}"/>\n  </way>\n'.format(key, value))
+        osm_file.write('</osm>\n')
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _field(field, payload):
+    """Length delimited field, or a varint field for ints"""
+    if isinstance(payload, int):
+        return _varint(field << 3) + _varint(payload)
+    return _varint(field << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _packed(values, signed=False, delta=False):
+    values = np.diff(values, prepend=0) if delta else np.asarray(values)
+    if signed:
+        values = (values << 1) ^ (values >> 63)
+    return b''.join(_varint(int(v)) for v in values)
+
+
+def _write_blob(pbf_file, blob_type, data):
+    blob = _field(2, len(data)) + _field(3, zlib.compress(data))
+    header = _field(1, blob_type.encode()) + _field(3, len(blob))
+    pbf_file.write(struct.pack(">I", len(header)) + header + blob)
+
+
+def write_pbf_fixture(pbf_path, n_nodes, road_share, seed, block_size=8000):
+    """Synthetic .pbf file of synthetic_map, dense nodes and ways in blocks of block_size"""
+    lats, lons, ways = synthetic_map(n_nodes, road_share, seed)
+    strings = ["", "highway", "residential", "footway", "building", "yes"]
+    string_table = _field(1, b''.join(_field(1, s.encode()) for s in strings))
+    with open(pbf_path, "wb") as pbf_file:
+        _write_blob(pbf_file, "OSMHeader", _field(4, b"OsmSchema-V0.6") + _field(4, b"DenseNodes"))
+        for start in range(0, n_nodes, block_size):
+            ids = np.arange(start + 1, min(start + block_size, n_nodes) + 1)
+            dense = _field(1, _packed(ids, True, True)) + \
+                _field(8, _packed(lats[start:start + block_size], True, True)) + \
+                _field(9, _packed(lons[start:start + block_size], True, True))
+            _write_blob(pbf_file, "OSMData", string_table + _field(2, _field(2, dense)))
+        for start in range(0, len(ways), block_size):
+            group = b''.join(_field(3, _field(1, way_id) + _field(2, _packed([strings.index(key)])) +
+                                    _field(3, _packed([strings.index(value)])) + _field(8, _packed(refs, True, True)))
+                             for way_id, (refs, (key, value)) in enumerate(ways[start:start + block_size], start + 1))
+            _write_blob(pbf_file, "OSMData", string_table + _field(2, group))
+
+
+def parse_osm(parser, osm_path, workers=1):
+    """Parse the file with the SAX parser, the streaming parser or the PBF parser, in a fresh process for the
+    peak RSS"""
+    start_time = time.time()
+    if parser == "sax":
+        sax_parser = xml.sax.make_parser()
+        sax_parser.setFeature(xml.sax.handler.feature_namespaces, 0)
+        handler = OsmParsers()
+        sax_parser.setContentHandler(handler)
+        sax_parser.parse(osm_path)
+        road_nodes, segments = len({i for way in handler.ways for i in way.ids}), len(handler.ways)
+    else:
+        handler = PbfParser(workers=workers) if parser == "pbf" else OsmStreamParser()
+        handler.parse(osm_path)
+        road_nodes, segments = len(handler.node_ids), len(handler.way_start)
+    return time.time() - start_time, peak_rss_mb(), road_nodes, segments
+
+
+def run_osm(n_nodes, road_share, parsers, workers, seed):
+    """Parse time, throughput and peak RSS of the OSM parsers on a synthetic fixture, the PBF parser reads the same
+    map from a .pbf file"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = {"osm": os.path.join(tmp_dir, "fixture.osm"), "pbf": os.path.join(tmp_dir, "fixture.osm.pbf")}
+        write_osm_fixture(paths["osm"], n_nodes, road_share, seed)
+        if "pbf" in parsers:
+            write_pbf_fixture(paths["pbf"], n_nodes, road_share, seed)
+        print("{} nodes".format(n_nodes))
+        print("{:<8} {:>10} {:>10} {:>10} {:>12} {:>10} {:>10}".format(
+            "parser", "size MB", "road nodes", "segments", "wall", "MB/s", "peak RSS"))
+        context = multiprocessing.get_context("spawn")
+        for parser in parsers:
+            path = paths["pbf" if parser == "pbf" else "osm"]
+            size = os.path.getsize(path) / 1024 ** 2
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                elapsed, rss, road_nodes, segments = executor.submit(parse_osm, parser, path, workers).result()
+            print("{:<8} {:>10.1f} {:>10} {:>10} {:>12.3f} {:>10.1f} {:>10.1f}".format(
+                parser, size, road_nodes, segments, elapsed, size / elapsed, rss))
+
+
+def grid_road_graph(side, n_posts, seed):
+    """side x side grid of road nodes with edges of 0.1 to 0.5 km, n_posts of the nodes are posts. Returns the
+    SearchNode map, the edge map and the post id -> node id map"""
+    rng = np.random.default_rng(seed)
+    n_nodes = side * side
+    post_nodes = set(rng.choice(n_nodes, n_posts, replace=False).tolist())
+    nodes = {}
+    map_posts_to_nodes = {}
+    for node_id in range(n_nodes):
+        if node_id in post_nodes:
+            post_id = "P{}".format(node_id)
+            nodes[node_id] = SearchNode(node_id, post_id, True)
+            map_posts_to_nodes[post_id] = node_id
+        else:
+            nodes[node_id] = SearchNode(node_id, None, False)
+    edges = {node_id: {} for node_id in range(n_nodes)}
+    for node_id in range(n_nodes):
+        for neighbour_id in (node_id + 1 if (node_id + 1) % side else None, node_id + side):
+            if neighbour_id is not None and neighbour_id < n_nodes:
+                weight = float(rng.uniform(0.1, 0.5))
+                edges[node_id][neighbour_id] = {"weight": weight}
+                edges[neighbour_id][node_id] = {"weight": weight}
+    return nodes, edges, map_posts_to_nodes
+
+
+def run_neighbours(side, n_posts, loop_posts, eps, seed):
+    """Neighbouring posts on a grid road graph: the front search of loop_posts posts, extrapolated to all, against one
+    multi-source Dijkstra"""
+    nodes, edges, map_posts_to_nodes = grid_road_graph(side, n_posts, seed)
+    loop_posts = min(loop_posts, n_posts)
+    print("{} road nodes, {} posts".format(len(nodes), n_posts))
+    finder = NeighboursFinder()
+
+    start_time = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for node_id in list(map_posts_to_nodes.values())[:loop_posts]:
+            finder.search_near_posts(nodes, edges, None, node_id, map_posts_to_nodes, eps)
+    front_time = (time.time() - start_time) * n_posts / loop_posts
+
+    start_time = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        voronoi = finder.voronoi_neighbours(edges, map_posts_to_nodes)
+    voronoi_time = time.time() - start_time
+
+    print("{:<12} {:>10}".format("engine", "wall"))
+    print("{:<12} {:>10.3f} (extrapolated from {} posts)".format("front", front_time, loop_posts))
+    print("{:<12} {:>10.3f}".format("voronoi", voronoi_time))
+    print("speed-up {:.0f}x, {:.1f} neighbours per post".format(
+        front_time / voronoi_time, sum(len(v) for v in voronoi.values()) / n_posts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Graph creation benchmark on synthetic map data")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    haversine = subparsers.add_parser("haversine", help="nearest node for every post, Python loop vs NumPy kernel")
+    haversine.add_argument("--nodes", type=int, default=100000)
+    haversine.add_argument("--posts", type=int, default=1000)
+    haversine.add_argument("--loop-posts", type=int, default=10)
+    haversine.add_argument("--chunk-size", type=int, default=1024)
+    haversine.add_argument("--seed", type=int, default=0)
+    spatial = subparsers.add_parser("spatial", help="nearest node for every post, NumPy kernel vs spatial index")
+    spatial.add_argument("--nodes", type=int, default=100000)
+    spatial.add_argument("--posts", type=int, default=1000)
+    spatial.add_argument("--chunk-size", type=int, default=1024)
+    spatial.add_argument("--seed", type=int, default=0)
+    osm = subparsers.add_parser("osm", help="SAX parser vs streaming parser on a synthetic .osm file")
+    osm.add_argument("--nodes", type=int, default=1000000)
+    osm.add_argument("--road-share", type=float, default=0.3)
+    osm.add_argument("--parser", nargs="+", default=["sax", "stream", "pbf"])
+    osm.add_argument("--workers", type=int, default=1)
+    osm.add_argument("--seed", type=int, default=0)
+    neighbours = subparsers.add_parser("neighbours", help="neighbouring posts, front search vs multi-source Dijkstra")
+    neighbours.add_argument("--side", type=int, default=100)
+    neighbours.add_argument("--posts", type=int, default=100)
+    neighbours.add_argument("--loop-posts", type=int, default=5)
+    neighbours.add_argument("--eps", type=float, default=1.0)
+    neighbours.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.benchmark == "haversine":
+        run_haversine(args.nodes, args.posts, args.loop_posts, args.chunk_size, args.seed)
+    elif args.benchmark == "spatial":
+        run_spatial(args.nodes, args.posts, args.chunk_size, args.seed)
+    elif args.benchmark == "osm":
+        run_osm(args.nodes, args.road_share, args.parser, args.workers, args.seed)
+    elif args.benchmark == "neighbours":
+        run_neighbours(args.side, args.posts, args.loop_posts, args.eps, args.seed)
+
+
+if __name__ == '__main__':
+    main()
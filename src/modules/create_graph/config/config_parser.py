@@ -104,6 +104,60 @@ class ConfigParser():
         # Get the number of partitions used for graph split by partitioner
         return self.json_config["graph_partitions"]
 
+    def _get_use_case_params(self, section, use_case):
+        # Use case values of a config section override its defaults
+        section_params = self.json_config[section]
+        params = dict(section_params["default"])
+        params.update(section_params.get(use_case, {}))
+        return params
+
+    def get_vrp_solver_params(self, use_case):
+        # Solver limits for VRP.vrp: time_limit (s), mip_gap, threads, MILP backend and symmetry breaking
+        return self._get_use_case_params("vrp_solver", use_case)
+
+    def get_vrp_cache_params(self):
+        # VRP solution cache: max_size entries, path of the pickle file for persistence (null keeps it in memory)
+        return dict(self.json_config["vrp_cache"])
+
+    def get_vrp_workers(self, use_case):
+        # Number of processes solving the partitions of a request in parallel, 1 solves them in turn
+        workers = self.json_config["vrp_workers"]
+        return workers.get(use_case, workers["default"])
+
+    def get_vrp_reduction(self, use_case):
+        # Solve the MILP on the metric closure of the nodes with demand and vehicle starts
+        reduction = self.json_config["vrp_reduction"]
+        return reduction.get(use_case, reduction["default"])
+
+    def get_vrp_engine(self, use_case):
+        # VRP engine used by VrpProcessor: "milp" (VRP.vrp), "routing" (RoutingVRP.vrp) or "heuristic" (HeuristicVRP.vrp)
+        engines = self.json_config["vrp_engine"]
+        return engines.get(use_case, engines["default"])
+
+    def get_routing_solver_params(self, use_case):
+        # Search parameters for RoutingVRP.vrp: time_limit (s) of guided local search, guided false stops at the first
+        # local optimum
+        return self._get_use_case_params("routing_solver", use_case)
+
+    def get_heuristic_solver_params(self, use_case):
+        # Search parameters for HeuristicVRP.vrp: seed, restarts and time_limit (s)
+        return self._get_use_case_params("heuristic_solver", use_case)
+
+    def get_insertion_params(self, use_case):
+        # Fast path for single ad-hoc orders: enabled and the largest route cost increase accepted before a full solve.
+        # The increase is in edge cost units, metres of road on the OSM graphs: 5000 accepts a 5 km detour
+        return self._get_use_case_params("insertion", use_case)
+
+    def get_osm_pbf_workers(self):
+        # Number of processes decoding the blobs of .pbf maps, 1 decodes them in turn. Maps are read as PBF when
+        # the map_basic path ends with .pbf
+        return self.json_config["osm_pbf_workers"]
+
+    def get_neighbours_engine(self):
+        # Search for neighbouring posts: "voronoi" (one multi-source Dijkstra from all posts) or "front" (eps limited
+        # search and front from every post in turn)
+        return self.json_config["neighbours_engine"]
+
     def get_logger_file(self):
         # Get the number of partitions used for graph split by partitioner
         return self.json_config["logger_file_location"]
\ No newline at end of file
@@ -122,7 +122,8 @@ class JsonGraphCreator():
         start_time = time.time()
         osmHandler = DataHandler(
             config_parser.get_basic_map(use_case_graph),
-            {config_parser.get_post_loc_type(use_case_graph): config_parser.get_csv_path(use_case_graph)}
+            {config_parser.get_post_loc_type(use_case_graph): config_parser.get_csv_path(use_case_graph)},
+            config_parser.get_osm_pbf_workers()
         )
         print("Pre-step  {}".format(time.time() - start_time))
 
@@ -143,10 +144,16 @@ class JsonGraphCreator():
         tmpRes = []
 
         finder = NeighboursFinder(None)
+        voronoi = None
+        if config_parser.get_neighbours_engine() == "voronoi":
+            voronoi = finder.voronoi_neighbours(roadWays, map_posts_to_nodes)
 
         for postId, nodeId in map_posts_to_nodes.items():
 
-            res = finder.search_near_posts(roadNodes, roadWays, ways, nodeId, map_posts_to_nodes, config_parser.get_eps(use_case_graph))
+            if voronoi is not None:
+                res = voronoi[postId]
+            else:
+                res = finder.search_near_posts(roadNodes, roadWays, ways, nodeId, map_posts_to_nodes, config_parser.get_eps(use_case_graph))
             print('PostID ' + str(postId) + ' Node: ' + str(nodeId) + ' r: ' + str(res))
 
             tmpRes.append((postId, nodeId, res))
@@ -156,17 +163,17 @@ class JsonGraphCreator():
                 postEdge.add((map_posts_to_nodes[res_id], nodeId, dist))
                 # print(res_id)
 
-            for k, v in roadNodes.items():
-                if v.post_id != None:
-                    d = {'address': v.address,
-                         'lat': v.lat,
-                         'lon': v.lon,
-                         'uuid': v.post.uuid,
-                         # 'node_id': v.node_id,
-                         # 'post_id': v.post_id
-                         }
-                    postNode[k] = v.__dict__
-                    postNodePlain[k] = d
+        for k, v in roadNodes.items():
+            if v.post_id != None:
+                d = {'address': v.address,
+                     'lat': v.lat,
+                     'lon': v.lon,
+                     'uuid': v.post.uuid,
+                     # 'node_id': v.node_id,
+                     # 'post_id': v.post_id
+                     }
+                postNode[k] = v.__dict__
+                postNodePlain[k] = d
         # print final graph
         #if len(postEdge) != 0:
         #    (not_labeled_G, labeled_G, colors) = self.graph_viz(roadNodes, ways)
@@ -1,10 +1,11 @@
-import sys
+import os
+import time
 
-import xml.sax
-from .parse_osm import OsmParsers
+from .parse_pbf import PbfParser
+from .stream_osm import OsmStreamParser
 from .parse_posts import PostHandler
 from ..pojo.search_node import SearchNode
-from ..utils import utils
+from ...utils.spatial_index import SpatialIndex
 
 
 class DataHandler():
@@ -19,17 +20,14 @@ class DataHandler():
         '''
 
         postsNodes = []
-        for post in self.posts:
-            minDist = sys.maxsize
-            nodeKey = ""
-            for key, node in nodesL.items():
-                tmpDist = utils.calcDistance(post.latitude, post.longitude, node.lat, node.lon)
-                if minDist > tmpDist:
-                    minDist = tmpDist
-                    nodeKey = key
-
+        keys = list(nodesL.keys())
+        nodes_index = SpatialIndex([nodesL[key].lat for key in keys], [nodesL[key].lon for key in keys])
+        indexes, distances = nodes_index.query_many([post.latitude for post in self.posts],
+                                                    [post.longitude for post in self.posts])
+        for post, idx, dist in zip(self.posts, indexes, distances):
+            nodeKey = keys[idx]
             tmpNode = nodesL[nodeKey]
-            if utils.calcDistance(post.latitude, post.longitude, tmpNode.lat, tmpNode.lon) < 2:
+            if dist < 2:
 
                 postsNodes.append(nodeKey)
                 tmpNode.add_post(post.address, post)
@@ -42,37 +40,34 @@ class DataHandler():
         self.posts = post_handler.read_postal_offices(post_path)
 
 
+    @staticmethod
+    def topology_path(osm_path):
+        """Parsed road network of the map is stored next to the map file"""
+        return os.path.splitext(osm_path)[0] + '_topology.npz'
+
+    def read_road_network(self, osm_path):
+        """Road network of the map from its topology snapshot when the map did not change, otherwise parsed from
+        the map and stored in the snapshot"""
+        start_time = time.time()
+        handler = PbfParser(workers=self.pbf_workers) if osm_path.endswith(".pbf") else OsmStreamParser()
+        key = handler.topology_key(osm_path)
+        snapshot_path = self.topology_path(osm_path)
+        if handler.load_snapshot(snapshot_path, key):
+            print("Loaded road network of {} from {} in {:.3f}s".format(osm_path, snapshot_path,
+                                                                       time.time() - start_time))
+        else:
+            handler.parse(osm_path)
+            handler.save_snapshot(snapshot_path, key)
+            print("Stored road network of {} in {}".format(osm_path, snapshot_path))
+        return handler
+
     def retrieve_road_topology(self, osm_path, post_path):
 
         self.retrive_posts(post_path)
 
-        parser = xml.sax.make_parser()
-        parser.setFeature(xml.sax.handler.feature_namespaces, 0)
-
-        # parse osm files
-        handler = OsmParsers()
-        parser.setContentHandler(handler)
-        parser.parse(osm_path)
-
-        self.ways = handler.ways
-        self.nodes = handler.nodes
-
-        ###
-        #print(self.nodes)
-        transformed_ids = {}
-        cnt = 0
-        self.new_nodes = {}
-        for node_id, node_value in self.nodes.items():
-            transformed_ids[node_id] = cnt
-            node_value.id = cnt
-            self.new_nodes[cnt] = node_value
-            cnt += 1
-
-        for way in self.ways:
-            nodes = way.get_all_nodes()
-            way.add_path(transformed_ids[nodes[0]], transformed_ids[nodes[1]])
-        ###
-        self.nodes = self.new_nodes
+        # parse osm or pbf file, nodes are numbered by their position in the file and only road nodes are kept
+        handler = self.read_road_network(osm_path)
+        self.nodes, self.ways = handler.nodes_and_ways()
 
         #print(self.ways)
         nodes_filtered = {}
@@ -118,8 +113,9 @@ class DataHandler():
         self.modified_nodes = nodesDict
 
 
-    def __init__(self, osm_path, posts_path):
-        # create_graph an XMLReader
+    def __init__(self, osm_path, posts_path, pbf_workers=1):
+        # road topology from an .osm or .osm.pbf file, pbf blobs are decoded by pbf_workers processes
+        self.pbf_workers = pbf_workers
         self.retrieve_road_topology(osm_path, posts_path)
 
 
@@ -3,6 +3,11 @@ from ..utils import utils
 from .pojo.way import Way
 from .pojo.node import Node
 
+# highway values of the ways kept as roads
+ROADS = {"motorway", "trunk", "primary", "secondary", "tertiary", "unclassified", "residential", "service",
+         "living_street", "motorway_link", "trunk_link", "primary_link", "secondary_link", "tertiary_link",
+         "motorway_junction"}
+
 class OsmParsers(xml.sax.ContentHandler):
     '''
         OsmParsers parse OSM data to nodes and ways. Nodes are represents as dictionary in order to fast accesss to it.
@@ -14,9 +19,7 @@ class OsmParsers(xml.sax.ContentHandler):
         self.ways = []
         self.tmpWays = []
         self.tags = {}
-        self.roads = {"motorway", "trunk", "primary", "secondary", "tertiary", "unclassified", "residential", "service",
-                      "living_street", "motorway_link", "trunk_link", "primary_link", "secondary_link", "tertiary_link",
-                      "motorway_junction"}
+        self.roads = set(ROADS)
         #self.roads = {"motorway", "trunk", "primary", "secondary", "tertiary", "residential", "service",
         #              "living_street", "motorway_link", "trunk_link", "primary_link", "secondary_link", "tertiary_link",
         #              "motorway_junction"}
@@ -0,0 +1,302 @@
+import lzma
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .parse_osm import ROADS
+from .stream_osm import OsmStreamParser
+
+# wire types of the protobuf encoding
+WIRE_VARINT = 0
+WIRE_64BIT = 1
+WIRE_LENGTH = 2
+WIRE_32BIT = 5
+
+# referenced node ids of the second pass, set once per process
+_referenced = None
+
+
+def read_varint(buf, pos):
+    """Varint starting at pos, returns the value and the position after it"""
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def iter_fields(buf):
+    """(field number, wire type, value) of a protobuf message, value is an int for varints and a memoryview of the
+    bytes for length delimited fields"""
+    buf = memoryview(buf)
+    pos = 0
+    while pos < len(buf):
+        key, pos = read_varint(buf, pos)
+        field, wire_type = key >> 3, key & 0x7
+        if wire_type == WIRE_VARINT:
+            value, pos = read_varint(buf, pos)
+        elif wire_type == WIRE_LENGTH:
+            length, pos = read_varint(buf, pos)
+            value = buf[pos:pos + length]
+            pos += length
+        elif wire_type == WIRE_64BIT:
+            value = buf[pos:pos + 8]
+            pos += 8
+        elif wire_type == WIRE_32BIT:
+            value = buf[pos:pos + 4]
+            pos += 4
+        else:
+            raise ValueError('Unsupported protobuf wire type {}'.format(wire_type))
+        yield field, wire_type, value
+
+
+def unpack_varints(buf):
+    """Packed repeated varint field as an uint64 array, decoded with NumPy"""
+    data = np.frombuffer(buf, dtype=np.uint8)
+    if len(data) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    shifts = (np.arange(len(data)) - np.repeat(starts, ends - starts + 1)) * 7
+    return np.add.reduceat((data & 0x7f).astype(np.uint64) << shifts.astype(np.uint64), starts)
+
+
+def zigzag(values):
+    """Signed values of zigzag encoded sint64"""
+    values = np.asarray(values, dtype=np.uint64)
+    return (values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(np.int64)
+
+
+def zigzag_int(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def read_blob_index(pbf_path):
+    """(type, offset, size) of every blob in the file, only the headers are read"""
+    blobs = []
+    with open(pbf_path, "rb") as pbf_file:
+        while True:
+            length = pbf_file.read(4)
+            if len(length) < 4:
+                break
+            header = pbf_file.read(struct.unpack(">I", length)[0])
+            blob_type, size = None, 0
+            for field, _, value in iter_fields(header):
+                if field == 1:
+                    blob_type = bytes(value).decode()
+                elif field == 3:
+                    size = value
+            blobs.append((blob_type, pbf_file.tell(), size))
+            pbf_file.seek(size, 1)
+    return blobs
+
+
+def read_blob(pbf_path, offset, size):
+    """Uncompressed content of the blob at offset"""
+    with open(pbf_path, "rb") as pbf_file:
+        pbf_file.seek(offset)
+        blob = pbf_file.read(size)
+    for field, _, value in iter_fields(blob):
+        if field == 1:
+            return bytes(value)
+        if field == 3:
+            return zlib.decompress(value)
+        if field == 4:
+            return lzma.decompress(value)
+        if field in (5, 6, 7):
+            raise ValueError('Unsupported PBF blob compression, field {}'.format(field))
+    raise ValueError('PBF blob has no data')
+
+
+def primitive_block(data):
+    """String table, granularity, lat and lon offsets and the primitive groups of a PrimitiveBlock"""
+    strings, groups = [], []
+    granularity, lat_offset, lon_offset = 100, 0, 0
+    for field, _, value in iter_fields(data):
+        if field == 1:
+            strings = [bytes(s).decode() for f, _, s in iter_fields(value) if f == 1]
+        elif field == 2:
+            groups.append(value)
+        elif field == 17:
+            granularity = value
+        elif field == 19:  # int64, negative values are two's complement
+            lat_offset = value - (1 << 64) if value >= 1 << 63 else value
+        elif field == 20:
+            lon_offset = value - (1 << 64) if value >= 1 << 63 else value
+    return strings, granularity, lat_offset, lon_offset, groups
+
+
+def _dense_ids(dense):
+    ids = lats = lons = None
+    for field, _, value in iter_fields(dense):
+        if field == 1:
+            ids = np.cumsum(zigzag(unpack_varints(value)))
+        elif field == 8:
+            lats = np.cumsum(zigzag(unpack_varints(value)))
+        elif field == 9:
+            lons = np.cumsum(zigzag(unpack_varints(value)))
+    empty = np.zeros(0, dtype=np.int64)
+    return (ids if ids is not None else empty, lats if lats is not None else empty,
+            lons if lons is not None else empty)
+
+
+def _node(node):
+    node_id = lat = lon = 0
+    for field, _, value in iter_fields(node):
+        if field == 1:
+            node_id = zigzag_int(value)
+        elif field == 8:
+            lat = zigzag_int(value)
+        elif field == 9:
+            lon = zigzag_int(value)
+    return node_id, lat, lon
+
+
+def read_packed(buf):
+    """Packed repeated varint field as a list, for short fields where NumPy costs more than it saves"""
+    values = []
+    pos = 0
+    while pos < len(buf):
+        value, pos = read_varint(buf, pos)
+        values.append(value)
+    return values
+
+
+def decode_ways_blob(pbf_path, offset, size, roads=ROADS):
+    """First pass on one blob: OSM ids of the consecutive node pairs of accepted highway ways, number of ways,
+    number of nodes. The refs of all accepted ways are decoded together"""
+    strings, _, _, _, groups = primitive_block(read_blob(pbf_path, offset, size))
+    road_values = {i for i, s in enumerate(strings) if s in roads}
+    highway = strings.index("highway") if "highway" in strings else -1
+    refs = []
+    n_ways = n_nodes = 0
+    for group in groups:
+        for field, _, value in iter_fields(group):
+            if field == 1:
+                n_nodes += 1
+            elif field == 2:
+                for dense_field, _, dense_value in iter_fields(value):
+                    if dense_field == 1:  # one varint per node
+                        n_nodes += int(np.count_nonzero(np.frombuffer(dense_value, dtype=np.uint8) < 0x80))
+            elif field == 3:
+                n_ways += 1
+                keys = vals = way_refs = None
+                for way_field, _, way_value in iter_fields(value):
+                    if way_field == 2:
+                        keys = read_packed(way_value)
+                    elif way_field == 3:
+                        vals = read_packed(way_value)
+                    elif way_field == 8:
+                        way_refs = way_value
+                if keys is not None and way_refs is not None and len(way_refs) > 0 and highway in keys and \
+                        vals[keys.index(highway)] in road_values:
+                    refs.append(bytes(way_refs))
+
+    empty = np.zeros(0, dtype=np.int64)
+    if not refs:
+        return empty, empty, n_ways, n_nodes
+    # refs are delta coded within every way: cumulative sum over all ways minus the sum before each way
+    lengths = np.array([np.count_nonzero(np.frombuffer(r, dtype=np.uint8) < 0x80) for r in refs])
+    deltas = zigzag(unpack_varints(b''.join(refs)))
+    ids = np.cumsum(deltas)
+    way_starts = np.cumsum(lengths) - lengths
+    ids -= np.repeat(ids[way_starts] - deltas[way_starts], lengths)
+    # pairs of consecutive nodes in the same way
+    same_way = np.ones(len(ids) - 1, dtype=bool)
+    same_way[way_starts[1:] - 1] = False
+    return ids[:-1][same_way], ids[1:][same_way], n_ways, n_nodes
+
+
+def _init_nodes_worker(referenced):
+    global _referenced
+    _referenced = referenced
+
+
+def decode_nodes_blob(pbf_path, offset, size, position):
+    """Second pass on one blob: referenced nodes with their position among all nodes of the file and coordinates,
+    position is the number of nodes in the blobs before"""
+    strings, granularity, lat_offset, lon_offset, groups = primitive_block(read_blob(pbf_path, offset, size))
+    ids, lats, lons = [], [], []
+    for group in groups:
+        plain = []
+        for field, _, value in iter_fields(group):
+            if field == 1:
+                plain.append(_node(value))
+            elif field == 2:
+                dense_ids, dense_lats, dense_lons = _dense_ids(value)
+                ids.append(dense_ids)
+                lats.append(dense_lats)
+                lons.append(dense_lons)
+        if plain:
+            ids.append(np.array([n[0] for n in plain], dtype=np.int64))
+            lats.append(np.array([n[1] for n in plain], dtype=np.int64))
+            lons.append(np.array([n[2] for n in plain], dtype=np.int64))
+    if not ids:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0), np.zeros(0)
+    ids, lats, lons = np.concatenate(ids), np.concatenate(lats), np.concatenate(lons)
+    keep = np.flatnonzero(np.isin(ids, _referenced))
+    # coordinates are in nanodegrees, dividing the exact integers rounds the same as the decimal degrees in XML
+    return (ids[keep], position + keep, (lat_offset + granularity * lats[keep]) / 1e9,
+            (lon_offset + granularity * lons[keep]) / 1e9)
+
+
+class PbfParser(OsmStreamParser):
+    '''
+        OSM PBF parser with the same two passes and result as OsmStreamParser. Blobs are decompressed and decoded
+        independently, with workers > 1 they are decoded by a pool of processes.
+    '''
+
+    def __init__(self, roads=ROADS, workers=1):
+        super().__init__(roads)
+        self.workers = workers
+        # (offset, size) of the data blobs, number of ways and nodes in each
+        self.blobs = []
+        self.blob_ways = []
+        self.blob_nodes = []
+
+    def _map(self, function, *args, referenced=None):
+        if self.workers > 1:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_nodes_worker,
+                                     initargs=(referenced,)) as executor:
+                return list(executor.map(function, *args))
+        _init_nodes_worker(referenced)
+        try:
+            return list(map(function, *args))
+        finally:
+            _init_nodes_worker(None)
+
+    def _read_ways(self, osm_path):
+        index = read_blob_index(osm_path)
+        self.blobs = [(offset, size) for blob_type, offset, size in index if blob_type == "OSMData"]
+        results = self._map(decode_ways_blob, [osm_path] * len(self.blobs), [b[0] for b in self.blobs],
+                            [b[1] for b in self.blobs], [self.roads] * len(self.blobs))
+        self.blob_ways = [n_ways for _, _, n_ways, _ in results]
+        self.blob_nodes = [n_nodes for _, _, _, n_nodes in results]
+        # nodes come before the ways when no blob with nodes follows a blob with ways
+        first_way = next((i for i, n in enumerate(self.blob_ways) if n > 0), len(self.blobs))
+        nodes_sorted = not any(self.blob_nodes[first_way + 1:])
+        empty = np.zeros(0, dtype=np.int64)
+        starts = np.concatenate([r[0] for r in results]) if results else empty
+        ends = np.concatenate([r[1] for r in results]) if results else empty
+        return starts, ends, sum(self.blob_ways), nodes_sorted
+
+    def _read_nodes(self, osm_path, referenced, nodes_sorted):
+        # only blobs with nodes are decoded again, so sorted files stop at the ways without nodes_sorted
+        blobs = [i for i, n in enumerate(self.blob_nodes) if n > 0]
+        positions = np.concatenate(([0], np.cumsum(self.blob_nodes)))
+        results = self._map(decode_nodes_blob, [osm_path] * len(blobs), [self.blobs[i][0] for i in blobs],
+                            [self.blobs[i][1] for i in blobs], [int(positions[i]) for i in blobs],
+                            referenced=referenced)
+        if not results:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0), np.zeros(0), 0
+        return (np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results]),
+                np.concatenate([r[2] for r in results]), np.concatenate([r[3] for r in results]),
+                int(positions[-1]))
@@ -0,0 +1,216 @@
+import hashlib
+import os
+import resource
+import time
+import xml.parsers.expat
+from array import array
+
+import numpy as np
+
+from ..utils import utils
+from .parse_osm import ROADS
+from .pojo.way import Way
+from .pojo.node import Node
+
+# arrays of the parsed road network stored in topology snapshots
+TOPOLOGY_ARRAYS = ("node_ids", "node_positions", "lats", "lons", "way_start", "way_end", "distances")
+
+
+def peak_rss_mb():
+    """Peak resident set size of the process in MB. VmHWM of /proc starts again after exec, ru_maxrss (KB on Linux)
+    keeps the value of the parent process"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class _StopParsing(Exception):
+    pass
+
+
+class OsmStreamParser:
+    '''
+        Streaming OSM parser that keeps only the nodes of road ways. The first pass over the file collects the node
+        references of accepted highway ways, the second pass keeps the coordinates of the referenced nodes. Everything
+        is held in NumPy arrays, Node and Way objects are created only for the road network on request.
+    '''
+
+    def __init__(self, roads=ROADS, batch_size=65536):
+        self.roads = set(roads)
+        self.batch_size = batch_size
+        # road nodes in file order: OSM id, position among all nodes of the file, coordinates
+        self.node_ids = np.zeros(0, dtype=np.int64)
+        self.node_positions = np.zeros(0, dtype=np.int64)
+        self.lats = np.zeros(0)
+        self.lons = np.zeros(0)
+        # road segments in file order: indexes into the node arrays and haversine length in km
+        self.way_start = np.zeros(0, dtype=np.int64)
+        self.way_end = np.zeros(0, dtype=np.int64)
+        self.distances = np.zeros(0)
+        self.stats = {}
+
+    @staticmethod
+    def _parse_file(osm_path, start_handler, end_handler=None):
+        """Run an expat parser over the file, a handler raising _StopParsing ends the pass early"""
+        parser = xml.parsers.expat.ParserCreate()
+        parser.StartElementHandler = start_handler
+        if end_handler is not None:
+            parser.EndElementHandler = end_handler
+        with open(osm_path, "rb") as osm_file:
+            try:
+                parser.ParseFile(osm_file)
+            except _StopParsing:
+                pass
+
+    def _read_ways(self, osm_path):
+        """First pass: OSM ids of the consecutive node pairs of accepted highway ways. Also tells if all nodes come
+        before the ways, as in files sorted the OSM way"""
+        starts, ends = array('q'), array('q')
+        state = {"refs": None, "highway": None, "ways": 0, "nodes_sorted": True}
+
+        def start_element(name, attrs):
+            if name == "nd":
+                if state["refs"] is not None:
+                    state["refs"].append(int(attrs["ref"]))
+            elif name == "tag":
+                if state["refs"] is not None and attrs.get("k") == "highway":
+                    state["highway"] = attrs.get("v")
+            elif name == "way":
+                state["refs"] = []
+                state["highway"] = None
+                state["ways"] += 1
+            elif name == "node" and state["ways"] > 0:
+                state["nodes_sorted"] = False
+
+        def end_element(name):
+            if name == "way":
+                refs = state["refs"]
+                if state["highway"] in self.roads and len(refs) > 1:
+                    starts.extend(refs[:-1])
+                    ends.extend(refs[1:])
+                state["refs"] = None
+
+        self._parse_file(osm_path, start_element, end_element)
+        return (np.frombuffer(starts, dtype=np.int64), np.frombuffer(ends, dtype=np.int64), state["ways"],
+                state["nodes_sorted"])
+
+    def _read_nodes(self, osm_path, referenced, nodes_sorted):
+        """Second pass: coordinates of the referenced nodes, file positions count every node with coordinates.
+        Nodes are checked against the sorted referenced ids a batch at a time, the pass ends at the first way when
+        all nodes come before the ways"""
+        ids, positions, lats, lons = array('q'), array('q'), array('d'), array('d')
+        batch = {"ids": array('q'), "lats": array('d'), "lons": array('d'), "position": 0}
+
+        def flush():
+            batch_ids = np.frombuffer(batch["ids"], dtype=np.int64)
+            keep = np.flatnonzero(np.isin(batch_ids, referenced))
+            ids.extend(batch_ids[keep].tolist())
+            positions.extend((batch["position"] - len(batch_ids) + keep).tolist())
+            lats.extend(np.frombuffer(batch["lats"])[keep].tolist())
+            lons.extend(np.frombuffer(batch["lons"])[keep].tolist())
+            batch["ids"], batch["lats"], batch["lons"] = array('q'), array('d'), array('d')
+
+        def start_element(name, attrs):
+            if name == "node":
+                if "id" in attrs and "lat" in attrs and "lon" in attrs:
+                    batch["ids"].append(int(attrs["id"]))
+                    batch["lats"].append(float(attrs["lat"]))
+                    batch["lons"].append(float(attrs["lon"]))
+                    batch["position"] += 1
+                    if len(batch["ids"]) == self.batch_size:
+                        flush()
+            elif name == "way" and nodes_sorted:
+                raise _StopParsing
+
+        self._parse_file(osm_path, start_element)
+        flush()
+        return (np.frombuffer(ids, dtype=np.int64), np.frombuffer(positions, dtype=np.int64),
+                np.frombuffer(lats), np.frombuffer(lons), batch["position"])
+
+    def parse(self, osm_path):
+        start_time = time.time()
+        starts, ends, n_ways, nodes_sorted = self._read_ways(osm_path)
+        referenced = np.unique(np.concatenate((starts, ends)))
+        ids, positions, lats, lons, n_nodes = self._read_nodes(osm_path, referenced, nodes_sorted)
+
+        # the first node with an id wins
+        _, first = np.unique(ids, return_index=True)
+        first.sort()
+        self.node_ids, self.node_positions = ids[first], positions[first]
+        self.lats, self.lons = lats[first], lons[first]
+
+        # segments between nodes missing from the file are left out
+        order = np.argsort(self.node_ids)
+        sorted_ids = self.node_ids[order]
+        start_idx = np.minimum(np.searchsorted(sorted_ids, starts), max(len(sorted_ids) - 1, 0))
+        end_idx = np.minimum(np.searchsorted(sorted_ids, ends), max(len(sorted_ids) - 1, 0))
+        found = (sorted_ids[start_idx] == starts) & (sorted_ids[end_idx] == ends) if len(sorted_ids) else \
+            np.zeros(len(starts), dtype=bool)
+        if not found.all():
+            print("Skipped {} road segments with nodes missing from the map".format(int((~found).sum())))
+        self.way_start = order[start_idx[found]]
+        self.way_end = order[end_idx[found]]
+        self.distances = utils.haversine(self.lats[self.way_start], self.lons[self.way_start],
+                                         self.lats[self.way_end], self.lons[self.way_end])
+
+        elapsed = time.time() - start_time
+        self.stats = {
+            "nodes": n_nodes,
+            "ways": n_ways,
+            "road_nodes": len(self.node_ids),
+            "road_segments": len(self.way_start),
+            "time": elapsed,
+            "elements_per_s": (n_nodes + n_ways) / elapsed if elapsed > 0 else 0,
+            "peak_rss_mb": peak_rss_mb()
+        }
+        print("Parsed {} nodes and {} ways, kept {} road nodes and {} segments in {:.3f}s "
+              "({:.0f} elements/s, peak RSS {:.1f} MB)".format(
+                  n_nodes, n_ways, self.stats["road_nodes"], self.stats["road_segments"], elapsed,
+                  self.stats["elements_per_s"], self.stats["peak_rss_mb"]))
+        return self
+
+    def topology_key(self, osm_path):
+        """Hash of the map file and the accepted highway values, a snapshot is used only for the same key"""
+        digest = hashlib.sha256()
+        with open(osm_path, "rb") as osm_file:
+            for chunk in iter(lambda: osm_file.read(1 << 20), b""):
+                digest.update(chunk)
+        digest.update(",".join(sorted(self.roads)).encode())
+        return digest.hexdigest()
+
+    def save_snapshot(self, snapshot_path, key):
+        """Store the parsed road network in an .npz file"""
+        np.savez(snapshot_path, key=np.array(key), **{name: getattr(self, name) for name in TOPOLOGY_ARRAYS})
+
+    def load_snapshot(self, snapshot_path, key):
+        """Load the road network stored for the same key, returns False when there is no such snapshot"""
+        if not os.path.exists(snapshot_path):
+            return False
+        with np.load(snapshot_path) as snapshot:
+            if "key" not in snapshot or str(snapshot["key"]) != key:
+                return False
+            for name in TOPOLOGY_ARRAYS:
+                setattr(self, name, snapshot[name])
+        return True
+
+    def nodes_and_ways(self):
+        """Road nodes {id: Node} and segments [Way] as OsmParsers gives them after DataHandler renumbers nodes by
+        their position in the file"""
+        nodes = {}
+        for node_id, lat, lon in zip(self.node_positions.tolist(), self.lats.tolist(), self.lons.tolist()):
+            node = Node()
+            node.add_node(node_id, lat, lon)
+            nodes[node_id] = node
+        ways = []
+        for start, end, distance in zip(self.node_positions[self.way_start].tolist(),
+                                        self.node_positions[self.way_end].tolist(), self.distances.tolist()):
+            way = Way()
+            way.add_path(start, end)
+            way.add_distance(distance)
+            ways.append(way)
+        return nodes, ways
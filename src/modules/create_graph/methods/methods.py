@@ -5,6 +5,7 @@ import pandas as pd
 from sklearn.cluster import KMeans
 
 from ..config.config_parser import ConfigParser
+from ...utils.spatial_index import SpatialIndex
 
 config_parser = ConfigParser()
 url = "https://graphhopper.com/api/1/vrp?key=e8a55308-9419-4814-81f1-6250efe25b5c"
@@ -97,26 +98,6 @@ def proccess_elta_event(proc_event, data, use_case_graph):
     elif proc_event == 'pickupRequest' or proc_event == 'brokenVehicle':
         return elta_map_parcels(data, use_case_graph)
 
-def find_min_pickup(coords, posts_nparray):
-    import sys
-    posts = []
-    lat_cord,lon_cord = coords
-    for i, post in enumerate(posts_nparray):
-        posts.append([i, post])
-    cur_min = sys.maxsize
-    label = -1
-    for post in posts:
-        lat = float(lat_cord) - float(post[1][0])
-        lon = float(lon_cord) - float(post[1][1])
-        distance = (lat * lat) + (lon * lon)
-        if distance < cur_min:
-            cur_min = distance
-            label = post[0]
-    if label == -1:
-        raise Exception("Error in mapping parcels to nodes")
-
-    return label
-
 def elta_clustering(orig_data, use_case_graph):
     nClusters = 20
     data = copy.deepcopy(orig_data)
@@ -142,9 +123,13 @@ def elta_clustering(orig_data, use_case_graph):
             data['orders'][row[0]][row[2] + '_location'] = data['orders'][row[0]][row[2]]
             data['orders'][row[0]][row[2]] = str(row['labels'])
 
-    for el in data['orders']:
-        mapped_location = find_min_pickup(el['pickup'], centers)
-        el['pickup'] = str(mapped_location)
+    # nearest cluster center of every pickup, one index for all orders
+    if len(data['orders']) > 0:
+        centers_index = SpatialIndex(centers[:, 0], centers[:, 1])
+        mapped_locations, _ = centers_index.query_many([float(el['pickup'][0]) for el in data['orders']],
+                                                       [float(el['pickup'][1]) for el in data['orders']])
+        for el, mapped_location in zip(data['orders'], mapped_locations):
+            el['pickup'] = str(mapped_location)
 
     ## print clusters
     # df.plot.scatter(x=3, y=4, c=labels, s=10, cmap='viridis')
@@ -187,25 +172,10 @@ def elta_clustering(orig_data, use_case_graph):
     return data, clos
 
 def find_min(use_case_graph, lat_cord, lon_cord):
-    elta = config_parser.get_csv_path(use_case_graph)
-    posts = []
-    with open(elta) as csv_file:
-        csv_reader = csv.reader(csv_file, delimiter=',')
-        for row in csv_reader:
-            posts.append([row[1], (row[2], row[3])])
-    import sys
-    cur_min = sys.maxsize
-    label = -1
-    for post in posts:
-        lat = float(lat_cord) - float(post[1][0])
-        lon = float(lon_cord) - float(post[1][1])
-        distance = (lat * lat) + (lon * lon)
-        if distance < cur_min:
-            cur_min = distance
-            label = post[0]
-    if label == -1:
+    posts_index = SpatialIndex.from_csv(config_parser.get_csv_path(use_case_graph))
+    if len(posts_index) == 0:
         raise Exception("Error in mapping parcels to nodes")
-
+    label, _ = posts_index.query(float(lat_cord), float(lon_cord))
     return label
 
 def elta_map_parcels(orig_data, use_case_graph):
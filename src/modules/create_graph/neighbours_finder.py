@@ -1,4 +1,5 @@
 import copy
+import heapq
 import math
 import time
 
@@ -334,3 +335,67 @@ class NeighboursFinder():
          # (not_labeled_G, labeled_G, colors) = self.graph_viz(node_id_node_map, ways, key_node_id)
           #self.drawGraph((not_labeled_G, labeled_G, colors), map_posts_to_nodes)
         return self.__second_step_alg(node_id_node_map, node_id_edge_map, origin_node_id)
+
+    @staticmethod
+    def voronoi_neighbours(node_id_edge_map, map_posts_to_nodes):
+        """Neighbouring posts of every post from one multi-source Dijkstra grown from all posts at once (network
+        Voronoi). Every road node is labelled with its nearest post, two posts are neighbours when an edge joins their
+        regions or a node is equally far from both. The distance is the shortest path between the posts over such an
+        edge or node. Returns {post_id: [(post_id, dist_km)]} sorted by distance, the same pairs search_near_posts
+        gives for one origin"""
+        start_time = time.time()
+        dist = {}
+        label = {}
+        ties = []
+        heap = []
+        for post_id, node_id in map_posts_to_nodes.items():
+            dist[node_id] = 0
+            label[node_id] = post_id
+            heap.append((0, node_id, post_id))
+        heapq.heapify(heap)
+
+        while len(heap) > 0:
+            node_dist, node_id, post_id = heapq.heappop(heap)
+            if node_dist > dist[node_id] or label[node_id] != post_id:
+                continue
+            for neighbour_id, edge in node_id_edge_map.get(node_id, {}).items():
+                neighbour_dist = node_dist + edge["weight"]
+                if neighbour_dist < dist.get(neighbour_id, math.inf):
+                    dist[neighbour_id] = neighbour_dist
+                    label[neighbour_id] = post_id
+                    heapq.heappush(heap, (neighbour_dist, neighbour_id, post_id))
+                elif neighbour_dist == dist[neighbour_id] and label[neighbour_id] != post_id:
+                    ties.append((neighbour_id, neighbour_dist, post_id))
+
+        adjacency = {}
+
+        def add(post_a, post_b, post_dist):
+            if post_dist < adjacency.get((post_a, post_b), math.inf):
+                adjacency[(post_a, post_b)] = post_dist
+                adjacency[(post_b, post_a)] = post_dist
+
+        # boundary edges between two regions
+        for node_id, neighbours in node_id_edge_map.items():
+            if node_id not in label:
+                continue
+            for neighbour_id, edge in neighbours.items():
+                if neighbour_id in label and label[neighbour_id] != label[node_id]:
+                    add(label[node_id], label[neighbour_id], dist[node_id] + edge["weight"] + dist[neighbour_id])
+        # nodes reached from several posts at the same distance, a tie is kept only at the final distance of the node
+        tied_posts = {}
+        for node_id, node_dist, post_id in ties:
+            if node_dist == dist[node_id]:
+                tied_posts.setdefault(node_id, {label[node_id]}).add(post_id)
+        for node_id, post_ids in tied_posts.items():
+            post_ids = sorted(post_ids)
+            for i, post_a in enumerate(post_ids):
+                for post_b in post_ids[i + 1:]:
+                    add(post_a, post_b, 2 * dist[node_id])
+
+        results = {post_id: [] for post_id in map_posts_to_nodes}
+        for (post_a, post_b), post_dist in adjacency.items():
+            results[post_a].append((post_b, post_dist))
+        for post_id in results:
+            results[post_id].sort(key=lambda x: x[1])
+        print("Runtime Voronoi neighbours of {} posts: {}".format(len(map_posts_to_nodes), time.time() - start_time))
+        return results
@@ -1,6 +1,17 @@
+import os
+import tempfile
 import unittest
+from unittest import mock
+
+import numpy as np
+
 import modules.create_graph.pojo.search_node as search_node
 import modules.create_graph.neighbours_finder as neighbour_alg
+from modules.create_graph.benchmark import write_osm_fixture, write_pbf_fixture
+from modules.create_graph.data_parser.data_handler import DataHandler
+from modules.create_graph.data_parser.parse_pbf import PbfParser
+from modules.create_graph.data_parser.stream_osm import OsmStreamParser
+from modules.create_graph.utils import utils
 
 class TestCreateGraph(unittest.TestCase):
 
@@ -292,10 +303,115 @@ class TestCreateGraph(unittest.TestCase):
 
     def test_specific_graph(self):
         nodes_dict, edges_dict = self.syntetic_graph3_construction()
+        posts = {node.post_id: node_id for node_id, node in nodes_dict.items() if node.is_post}
 
         finder = neighbour_alg.NeighboursFinder()
-        result =finder.search_near_posts(nodes_dict, edges_dict, 0, 8)
+        result =finder.search_near_posts(nodes_dict, edges_dict, None, 0, posts, 8)
 
         print(result)
         #self.assertLessEqual(result, [])
 
+    def test_voronoi_neighbours_match_front_search(self):
+        nodes, edges = self.syntetic_graph1_construction()
+        posts = {node.post_id: node_id for node_id, node in nodes.items() if node.is_post}
+        voronoi = neighbour_alg.NeighboursFinder.voronoi_neighbours(edges, posts)
+        front = neighbour_alg.NeighboursFinder().search_near_posts(nodes, edges, None, posts["A0"], posts, 0.5)
+        self.assertEqual([post_id for post_id, _ in voronoi["A0"]], ["A1", "A5", "A2"])
+        self.assertEqual([post_id for post_id, _ in front], ["A1", "A5", "A2"])
+        for (_, voronoi_dist), (_, front_dist) in zip(voronoi["A0"], front):
+            self.assertAlmostEqual(voronoi_dist, front_dist)
+        # adjacency is symmetric, A1 and A2 share a road of 0.5
+        neighbours = dict(voronoi["A1"])
+        self.assertAlmostEqual(neighbours["A0"], 0.7)
+        self.assertAlmostEqual(neighbours["A2"], 0.5)
+
+        # A1, A0 and A6 are equally far from node 4
+        nodes, edges = self.syntetic_graph3_construction()
+        posts = {node.post_id: node_id for node_id, node in nodes.items() if node.is_post}
+        voronoi = neighbour_alg.NeighboursFinder.voronoi_neighbours(edges, posts)
+        front = neighbour_alg.NeighboursFinder().search_near_posts(nodes, edges, None, posts["A0"], posts, 1)
+        self.assertEqual({post_id for post_id, _ in voronoi["A0"]}, {post_id for post_id, _ in front})
+        self.assertIn(("A6", 8), voronoi["A1"])
+
+
+class TestHaversine(unittest.TestCase):
+
+    def test_vectorized_haversine_matches_scalar(self):
+        rng = np.random.default_rng(0)
+        lats, lons = rng.uniform(42, 47, 200), rng.uniform(13, 20, 200)
+        post_lats, post_lons = rng.uniform(42, 47, 30), rng.uniform(13, 20, 30)
+        scalar = np.array([[utils.calcDistance(a, b, c, d) for c, d in zip(lats, lons)]
+                           for a, b in zip(post_lats, post_lons)])
+        self.assertTrue(np.allclose(utils.haversine_matrix(post_lats, post_lons, lats, lons), scalar))
+        self.assertTrue(np.allclose(utils.haversine(post_lats[0], post_lons[0], lats, lons), scalar[0]))
+
+        indexes, distances = utils.nearest(lats, lons, post_lats, post_lons, chunk_size=7)
+        self.assertTrue(np.array_equal(indexes, np.argmin(scalar, axis=1)))
+        self.assertTrue(np.allclose(distances, scalar.min(axis=1)))
+
+
+class TestOsmParsers(unittest.TestCase):
+
+    def test_streaming_osm_parser_keeps_road_nodes(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            osm_path = os.path.join(tmp_dir, "map.osm")
+            with open(osm_path, "w") as osm_file:
+                osm_file.write("""<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="10" lat="45.0" lon="15.0"/>
+  <node id="11" lat="45.1" lon="15.0"><tag k="amenity" v="post_office"/></node>
+  <node id="12" lat="45.2" lon="15.0"/>
+  <node id="13" lat="45.3" lon="15.0"/>
+  <way id="1"><nd ref="10"/><nd ref="12"/><nd ref="14"/><tag k="highway" v="residential"/></way>
+  <way id="2"><nd ref="11"/><nd ref="13"/><tag k="building" v="yes"/></way>
+  <node id="14" lat="45.4" lon="15.0"/>
+  <way id="3"><nd ref="12"/><nd ref="99"/><tag k="highway" v="primary"/></way>
+</osm>
+""")
+            parser = OsmStreamParser().parse(osm_path)
+        self.assertEqual(parser.node_ids.tolist(), [10, 12, 14])
+        self.assertEqual(parser.stats["nodes"], 5)
+        self.assertEqual(parser.stats["ways"], 3)
+
+        # nodes are numbered by their position in the file, the segment to the missing node 99 is left out
+        nodes, ways = parser.nodes_and_ways()
+        self.assertEqual(sorted(nodes), [0, 2, 4])
+        self.assertEqual([way.ids for way in ways], [(0, 2), (2, 4)])
+        self.assertAlmostEqual(ways[0].distance, utils.calcDistance(45.0, 15.0, 45.2, 15.0))
+
+    def test_pbf_parser_matches_osm_parser(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            osm_path, pbf_path = os.path.join(tmp_dir, "map.osm"), os.path.join(tmp_dir, "map.osm.pbf")
+            write_osm_fixture(osm_path, 3000, 0.4, 0)
+            write_pbf_fixture(pbf_path, 3000, 0.4, 0, block_size=500)
+            osm = OsmStreamParser().parse(osm_path)
+            for workers in (1, 2):
+                pbf = PbfParser(workers=workers).parse(pbf_path)
+                for key in ("node_ids", "node_positions", "lats", "lons", "way_start", "way_end", "distances"):
+                    self.assertTrue(np.array_equal(getattr(pbf, key), getattr(osm, key)), key)
+                self.assertEqual(pbf.stats["nodes"], osm.stats["nodes"])
+                self.assertEqual(pbf.stats["ways"], osm.stats["ways"])
+
+    def test_road_topology_snapshot_skips_parsing(self):
+        def parse(parser, path):
+            raise AssertionError("map parsed again")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            osm_path, posts_path = os.path.join(tmp_dir, "map.osm"), os.path.join(tmp_dir, "posts.csv")
+            write_osm_fixture(osm_path, 400, 0.5, 0)
+            with open(posts_path, "w") as posts_file:
+                posts_file.write("Kapele,S1,45.93,15.67\nGloboko,S2,44.5,16.0\n")
+            parsed = DataHandler(osm_path, {"posts": posts_path})
+            self.assertTrue(os.path.exists(DataHandler.topology_path(osm_path)))
+
+            with mock.patch.object(OsmStreamParser, "parse", parse):
+                loaded = DataHandler(osm_path, {"posts": posts_path})
+                self.assertEqual(loaded.modified_ways, parsed.modified_ways)
+                self.assertEqual([(n.node_id, n.post_id, n.lat, n.lon) for n in loaded.modified_nodes.values()],
+                                 [(n.node_id, n.post_id, n.lat, n.lon) for n in parsed.modified_nodes.values()])
+
+                # a changed map is parsed again
+                with open(osm_path, "a") as osm_file:
+                    osm_file.write("<!-- changed -->\n")
+                with self.assertRaisesRegex(AssertionError, "map parsed again"):
+                    DataHandler(osm_path, {"posts": posts_path})
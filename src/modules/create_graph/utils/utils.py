@@ -1,5 +1,10 @@
 from math import radians, cos, sin, asin, sqrt, atan2
 
+import numpy as np
+
+# approximate radius of earth in km
+EARTH_RADIUS = 6373.0
+
 
 def calcDistance(lat1, lon1, lat2, lon2):
     # Code coppied form: http://stackoverflow.com/questions/4913349/haversine-formula-in-python-bearing-and-distance-between-two-gps-points
@@ -8,7 +13,7 @@ def calcDistance(lat1, lon1, lat2, lon2):
     on the earth (specified in decimal degrees)
     """
     # convert decimal degrees to radians
-    R = 6373.0
+    R = EARTH_RADIUS
     lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
 
     dlon = lon2 - lon1
@@ -19,3 +24,42 @@ def calcDistance(lat1, lon1, lat2, lon2):
 
     distance = R * c
     return distance
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    Great circle distance in km between points given in decimal degrees, same formula as calcDistance.
+    Arguments are NumPy arrays (or scalars) that broadcast against each other: a point and arrays give one to many
+    distances, a column and row arrays give many to many distances.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=float)) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return EARTH_RADIUS * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def haversine_matrix(lats1, lons1, lats2, lons2):
+    """Distances between every point of the first and every point of the second set, len(lats1) x len(lats2)"""
+    return haversine(np.asarray(lats1, dtype=float)[:, None], np.asarray(lons1, dtype=float)[:, None],
+                     np.asarray(lats2, dtype=float)[None, :], np.asarray(lons2, dtype=float)[None, :])
+
+
+def unit_vectors(lats, lons):
+    """Points given in decimal degrees as unit vectors in 3D, n x 3"""
+    lats, lons = np.radians(np.asarray(lats, dtype=float)), np.radians(np.asarray(lons, dtype=float))
+    return np.column_stack((np.cos(lats) * np.cos(lons), np.cos(lats) * np.sin(lons), np.sin(lats)))
+
+
+def nearest(lats, lons, query_lats, query_lons, chunk_size=1024):
+    """
+    Index of the nearest point (lats, lons) and the distance to it for every query point.
+    The great circle distance shrinks as the dot product of the points' unit vectors grows, so the nearest points are
+    found with a matrix product, chunk_size queries at a time, and only their distances are computed with haversine.
+    """
+    lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+    query_lats, query_lons = np.atleast_1d(query_lats).astype(float), np.atleast_1d(query_lons).astype(float)
+    points = unit_vectors(lats, lons)
+    queries = unit_vectors(query_lats, query_lons)
+    indexes = np.zeros(len(queries), dtype=np.int64)
+    for start in range(0, len(queries), chunk_size):
+        indexes[start:start + chunk_size] = np.argmax(queries[start:start + chunk_size] @ points.T, axis=1)
+    return indexes, haversine(query_lats, query_lons, lats[indexes], lons[indexes])
@@ -0,0 +1,244 @@
+"""
+Benchmark of the CVRP engine on the bundled graphs, with instances built from demo/examples requests.
+Run from the src folder:
+    python -m modules.cvrp.benchmark formulations
+    python -m modules.cvrp.benchmark backends --backend CBC CP_SAT
+    python -m modules.cvrp.benchmark engines
+    python -m modules.cvrp.benchmark reduction
+    python -m modules.cvrp.benchmark symmetry --vehicles 4 6 8
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+from .processor.vrp_processor import VrpProcessor, SLO_CRO_USE_CASE
+from .closure import MetricClosure
+from .heuristic import HeuristicVRP
+from .routing import RoutingVRP
+from .vrp import VRP, FORMULATION_CLASSIC, FORMULATION_COMPACT, BACKENDS
+from ..create_graph.methods import methods
+from ..demo.api_poc import LocationParcelMap
+from ..partitioning.graph_partitioning_preprocess import GraphPreprocessing
+from ..utils.input_output import InputOutputTransformer
+
+EXAMPLES_DIR = './modules/demo/examples'
+EXAMPLES = [
+    "20201023_Miha_test_samples/PS_HP_ad-hoc.json",
+    "20201023_Miha_test_samples/PS_HP_ad-hoc_cycled.json",
+    "20201023_Miha_test_samples/PS_HP_brokenvehicle.json",
+    "20201023_Miha_test_samples/PS_HP_daily_plan_SLO.json",
+    "20201023_Miha_test_samples/PS_HP-crossborder.json",
+    "20201023_Miha_test_samples/test1.json",
+    "20200925_Aziz_Mousas/brokenvehicle-25092020-15_parcels.json",
+    "20201023_Miha_test_samples/elta-adhoc-request.json",
+    "20201023_Miha_test_samples/elta-brokenVehicle.json",
+    "20201023_Miha_test_samples/elta-daily-request.json",
+    "20200910_Aziz_Mousas/20200910-VehicleBreakdown_ELTA.json",
+]
+
+
+def load_instances(examples=EXAMPLES):
+    """Parse example requests the same way the API does and return a list of (name, vrp input, partition) per plan"""
+    processors = {}
+    instances = []
+    for example in examples:
+        with open(os.path.join(EXAMPLES_DIR, example)) as request_file:
+            received_request = json.load(request_file)
+        if received_request["organization"] in (SLO_CRO_USE_CASE, "PS", "HP"):
+            use_case_graph = "SLO-CRO_crossborder"
+        else:
+            use_case_graph = "ELTA_urban1"
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            data = InputOutputTransformer.parse_received_recommendation_message(
+                received_request, LocationParcelMap(), use_case_graph)
+            use_case = data["useCase"]
+            evt_type = data["eventType"]
+            if use_case == SLO_CRO_USE_CASE:
+                if evt_type == "crossBorder":
+                    data["orders"] = [dict(parcel, currentLocation=clo["currentLocation"])
+                                      for clo in data["clos"] for parcel in clo["parcels"]]
+            else:
+                data = methods.proccess_elta_event(evt_type, data, use_case_graph)
+                if evt_type is None:
+                    data = data[0]
+
+            # same as RecReq.init_vrp, the processor is keyed by the use case graph
+            if use_case_graph not in processors:
+                processors[use_case_graph] = VrpProcessor(
+                    GraphPreprocessing.extract_graph_processors(use_case_graph), use_case_graph)
+            processor = processors[use_case_graph]
+            vehicles = processor.parse_vehicles(data["clos"])
+            deliveries = processor.parse_deliveries(evt_type, data["clos"], data["orders"], use_case)
+            plans = processor.make_plans(vehicles, deliveries, evt_type)
+
+        for i, plan in enumerate(plans):
+            if len(plan.deliveries) == 0 or len(plan.vehicles) == 0:
+                continue
+            instances.append(("{}#{}".format(os.path.basename(example), i), processor.vrp_input(plan),
+                              plan.partition))
+    return instances
+
+
+def run_formulations(instances, formulations):
+    """Solve every instance with each formulation, report model size, objective and timings"""
+    print("{:<45} {:<8} {:>8} {:>8} {:>9} {:>12} {:>8} {:>8}".format(
+        "instance", "model", "vars", "rows", "nonzeros", "objective", "build", "solve"))
+    for name, vrp_input, _ in instances:
+        for formulation in formulations:
+            stats = {}
+            with contextlib.redirect_stdout(io.StringIO()):
+                _, _, obj_val = VRP.vrp(*vrp_input, stats=stats, formulation=formulation)
+            print("{:<45} {:<8} {:>8} {:>8} {:>9} {:>12.1f} {:>8.3f} {:>8.3f}".format(
+                name, formulation, stats["n_variables"], stats["n_constraints"], stats["n_nonzeros"], obj_val,
+                stats["build_time"], stats["solve_time"]))
+
+
+def run_backends(instances, backends, formulation, time_limit, threads):
+    """Solve every instance on each MILP backend, report objective, status and wall time"""
+    print("{:<45} {:<8} {:>12} {:<10} {:>8} {:>8}".format(
+        "instance", "backend", "objective", "status", "gap", "wall"))
+    for name, vrp_input, _ in instances:
+        for backend in backends:
+            stats = {}
+            start_time = time.time()
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    _, _, obj_val = VRP.vrp(*vrp_input, stats=stats, formulation=formulation,
+                                            time_limit=time_limit, threads=threads, backend=backend)
+            except ValueError as error:
+                print("{:<45} {:<8} {}".format(name, backend, error))
+                continue
+            print("{:<45} {:<8} {:>12.1f} {:<10} {:>8.4f} {:>8.3f}".format(
+                name, backend, obj_val, stats["status"], stats["gap"], time.time() - start_time))
+
+
+def run_engines(instances, formulation, time_limit):
+    """Solve every instance with the MILP, the routing engine and the heuristic, report objective and wall time"""
+    print("{:<45} {:<8} {:>12} {:<12} {:>8}".format("instance", "engine", "objective", "status", "wall"))
+    for name, vrp_input, partition in instances:
+        for engine in ("milp", "routing", "heuristic"):
+            stats = {}
+            start_time = time.time()
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    if engine == "milp":
+                        _, _, obj_val = VRP.vrp(*vrp_input, stats=stats, formulation=formulation,
+                                                time_limit=time_limit)
+                    elif engine == "routing":
+                        _, _, obj_val = RoutingVRP.vrp(partition.cost_matrix(), *vrp_input[1:4], stats=stats,
+                                                       time_limit=time_limit)
+                    else:
+                        _, _, obj_val = HeuristicVRP.vrp(partition.cost_matrix(), *vrp_input[1:4], stats=stats,
+                                                         time_limit=time_limit)
+            except ValueError as error:
+                print("{:<45} {:<8} {}".format(name, engine, error))
+                continue
+            print("{:<45} {:<8} {:>12.1f} {:<12} {:>8.3f}".format(
+                name, engine, obj_val, stats["status"], time.time() - start_time))
+
+
+def run_reduction(instances, formulation):
+    """Solve every instance on the whole partition and on the metric closure of its relevant nodes"""
+    print("{:<45} {:<8} {:>6} {:>8} {:>8} {:>12} {:>8}".format(
+        "instance", "graph", "nodes", "vars", "rows", "objective", "wall"))
+    for name, vrp_input, partition in instances:
+        for graph in ("full", "closure"):
+            stats = {}
+            start_time = time.time()
+            with contextlib.redirect_stdout(io.StringIO()):
+                if graph == "full":
+                    n_nodes = len(partition.nodes)
+                    _, _, obj_val = VRP.vrp(*vrp_input, stats=stats, formulation=formulation)
+                else:
+                    closure = MetricClosure(partition, vrp_input[1], vrp_input[3])
+                    n_nodes = len(closure.nodes)
+                    _, _, obj_val = VRP.vrp(*closure.vrp_input(vrp_input[2]), stats=stats, formulation=formulation)
+            print("{:<45} {:<8} {:>6} {:>8} {:>8} {:>12.1f} {:>8.3f}".format(
+                name, graph, n_nodes, stats["n_variables"], stats["n_constraints"], obj_val,
+                time.time() - start_time))
+
+
+def fleet_instances(use_case_graph, n_vehicles, seeds):
+    """Daily plan like instances with identical vans at the first post: random demand on every node,
+    capacities leave 15% slack over the total demand"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        partition = GraphPreprocessing.extract_graph_processors(use_case_graph)[0]
+    costs = [e.cost for e in partition.edges]
+    instances = []
+    for n in n_vehicles:
+        for seed in seeds:
+            rng = np.random.default_rng(seed)
+            demand = rng.integers(0, 6, len(partition.nodes)).astype(float)
+            demand[0] = 0
+            capacity = [math.ceil(demand.sum() / n * 1.15)] * n
+            instances.append(("{} {} vans seed {}".format(use_case_graph, n, seed),
+                              (partition.incident_matrix, demand, capacity, [[0]] * n, costs)))
+    return instances
+
+
+def run_symmetry(instances, formulations, time_limit):
+    """Solve every instance with and without symmetry breaking on identical vehicles"""
+    print("{:<35} {:<8} {:<9} {:>12} {:<10} {:>8}".format(
+        "instance", "model", "symmetry", "objective", "status", "solve"))
+    for name, vrp_input in instances:
+        for formulation in formulations:
+            for symmetry_breaking in (False, True):
+                stats = {}
+                with contextlib.redirect_stdout(io.StringIO()):
+                    _, _, obj_val = VRP.vrp(*vrp_input, stats=stats, formulation=formulation, time_limit=time_limit,
+                                            symmetry_breaking=symmetry_breaking)
+                print("{:<35} {:<8} {:<9} {:>12.1f} {:<10} {:>8.3f}".format(
+                    name, formulation, str(symmetry_breaking), obj_val, stats["status"], stats["solve_time"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CVRP benchmark on bundled graphs and example requests")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    formulations = subparsers.add_parser("formulations", help="classic vs compact MILP formulation")
+    formulations.add_argument("--formulation", nargs="+", default=[FORMULATION_CLASSIC, FORMULATION_COMPACT])
+    backends = subparsers.add_parser("backends", help="CBC vs SCIP vs CP-SAT on the same instances")
+    backends.add_argument("--backend", nargs="+", default=list(BACKENDS))
+    backends.add_argument("--formulation", default=FORMULATION_COMPACT)
+    backends.add_argument("--time-limit", type=float, default=60)
+    backends.add_argument("--threads", type=int, default=None)
+    engines = subparsers.add_parser("engines", help="incidence matrix MILP vs routing engine vs heuristic")
+    engines.add_argument("--formulation", default=FORMULATION_COMPACT)
+    engines.add_argument("--time-limit", type=float, default=2)
+    reduction = subparsers.add_parser("reduction", help="whole partition vs metric closure of the relevant nodes")
+    reduction.add_argument("--formulation", default=FORMULATION_COMPACT)
+    symmetry = subparsers.add_parser("symmetry", help="load ordering of identical vehicles on generated fleets")
+    symmetry.add_argument("--use-case-graph", default="ELTA_urban1")
+    symmetry.add_argument("--vehicles", type=int, nargs="+", default=[4, 6, 8])
+    symmetry.add_argument("--seeds", type=int, default=3)
+    symmetry.add_argument("--formulation", nargs="+", default=[FORMULATION_CLASSIC, FORMULATION_COMPACT])
+    symmetry.add_argument("--time-limit", type=float, default=60)
+    args = parser.parse_args()
+
+    if args.benchmark == "symmetry":
+        run_symmetry(fleet_instances(args.use_case_graph, args.vehicles, range(args.seeds)), args.formulation,
+                     args.time_limit)
+        return
+
+    start_time = time.time()
+    instances = load_instances()
+    print("Loaded {} instances in {:.3f}s".format(len(instances), time.time() - start_time))
+
+    if args.benchmark == "formulations":
+        run_formulations(instances, args.formulation)
+    elif args.benchmark == "backends":
+        run_backends(instances, args.backend, args.formulation, args.time_limit, args.threads)
+    elif args.benchmark == "engines":
+        run_engines(instances, args.formulation, args.time_limit)
+    elif args.benchmark == "reduction":
+        run_reduction(instances, args.formulation)
+
+
+if __name__ == '__main__':
+    main()
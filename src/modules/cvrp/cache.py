@@ -0,0 +1,85 @@
+import copy
+import hashlib
+import json
+import os
+import pickle
+from collections import OrderedDict
+
+import numpy as np
+from scipy import sparse
+
+
+class VrpCache:
+    """
+    LRU cache of VRP.vrp solutions keyed by a fingerprint of the whole solver input: incidence matrix, edge costs,
+    dropoff, capacities, start locations and solver parameters. Resent requests (retries, replayed daily plans)
+    return the stored solution instead of solving again. With path set, entries are kept in a pickle file and
+    loaded on start.
+    """
+
+    def __init__(self, max_size=128, path=None):
+        self.max_size = max_size
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if path is not None and os.path.exists(path):
+            with open(path, 'rb') as cache_file:
+                self.entries = pickle.load(cache_file)
+            print('Loaded {} VRP solutions from {}'.format(len(self.entries), path))
+
+    @staticmethod
+    def fingerprint(graph_incidence_mat, demand, capacity_vec, start_loc_vec, edges_length, **params):
+        """Stable hash of a VRP.vrp call, the same input gives the same key in every process"""
+        E = sparse.csr_matrix(graph_incidence_mat, dtype=float)
+        E.sort_indices()
+        digest = hashlib.sha256()
+        digest.update(np.asarray(E.shape, dtype=np.int64).tobytes())
+        for array in (E.indptr, E.indices):
+            digest.update(np.asarray(array, dtype=np.int64).tobytes())
+        for array in (E.data, demand, capacity_vec, edges_length):
+            digest.update(np.asarray(array, dtype=float).tobytes())
+        digest.update(json.dumps([[int(node) for node in locations] for locations in start_loc_vec]).encode())
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def solve(self, vrp, *vrp_input, stats=None, **params):
+        """Return the cached solution of vrp(*vrp_input, **params) or solve and store it"""
+        key = self.fingerprint(*vrp_input, **params)
+        hit = key in self.entries
+        if hit:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            result, solve_stats = self.entries[key]
+            print('VRP cache hit {}, hits: {}, misses: {}'.format(key[:12], self.hits, self.misses))
+        else:
+            self.misses += 1
+            solve_stats = {}
+            result = vrp(*vrp_input, stats=solve_stats, **params)
+            self.entries[key] = (result, solve_stats)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+            self.save()
+        if stats is not None:
+            stats.update(solve_stats)
+            stats["cache_hit"] = hit
+        return copy.deepcopy(result)
+
+    def counters(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}
+
+    def record(self, hit):
+        """Count a lookup made by the cache of a pool worker"""
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def save(self):
+        """Write entries to path, through a temporary file so a crash does not leave a broken cache"""
+        if self.path is None:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as cache_file:
+            pickle.dump(self.entries, cache_file)
+        os.replace(tmp_path, self.path)
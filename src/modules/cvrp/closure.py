@@ -0,0 +1,74 @@
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+
+
+class MetricClosure:
+    """
+    Complete graph over the relevant nodes of a partition (vehicle starts, mandatory nodes and nodes with demand),
+    every edge weighted by the shortest path between its ends. The MILP is solved on this graph, so its size depends
+    on the demand and not on the size of the map. Solutions are expanded back to the edges and nodes of the partition.
+    """
+
+    def __init__(self, graph, dropoff, start_loc_vec):
+        self.n_graph_nodes = len(graph.nodes)
+        self.n_graph_edges = len(graph.edges)
+
+        # cheapest partition edge for every connected pair of nodes, used to expand paths back to edges
+        self.graph_edge = {}
+        for j, e in enumerate(graph.edges):
+            key = (graph.index_from_id(e.start), graph.index_from_id(e.end))
+            if key not in self.graph_edge or e.cost < graph.edges[self.graph_edge[key]].cost:
+                self.graph_edge[key] = j
+
+        relevant = {node for node, demand in enumerate(dropoff) if demand > 0}
+        for locations in start_loc_vec:
+            relevant.update(locations)
+        self.nodes = sorted(relevant)
+        position = {node: pos for pos, node in enumerate(self.nodes)}
+
+        self.dist, self.predecessors = csgraph.dijkstra(graph.cost_matrix(), directed=True, indices=self.nodes,
+                                                        return_predecessors=True)
+        # edges of the closure: (from position, to position) for every reachable pair
+        self.edges = [(a, b) for a in range(len(self.nodes)) for b in range(len(self.nodes))
+                      if a != b and np.isfinite(self.dist[a, self.nodes[b]])]
+        rows = [a for a, _ in self.edges]
+        self.incident_matrix = sparse.csr_matrix((np.ones(len(self.edges)), (rows, range(len(self.edges)))),
+                                                 shape=(len(self.nodes), len(self.edges)))
+        self.costs = [self.dist[a, self.nodes[b]] for a, b in self.edges]
+        self.dropoff = [dropoff[node] for node in self.nodes]
+        self.start_loc = [[position[node] for node in locations] for locations in start_loc_vec]
+
+    def vrp_input(self, capacity):
+        """VRP.vrp input on the closure: incidence matrix, dropoff, capacities, start locations, costs"""
+        return self.incident_matrix, self.dropoff, capacity, self.start_loc, self.costs
+
+    def reduce_loads(self, loads):
+        """Per vehicle loads on the partition nodes restricted to the closure nodes"""
+        return [[row[node] for node in self.nodes] for row in loads]
+
+    def node_path(self, a, b):
+        """Partition node indexes on the shortest path from closure node a to closure node b"""
+        path = [self.nodes[b]]
+        while path[-1] != self.nodes[a]:
+            path.append(self.predecessors[a, path[-1]])
+        return path[::-1]
+
+    def expand(self, routes, Omatrix):
+        """Map edge usage and dropped load per vehicle from the closure back to the partition edges and nodes"""
+        graph_routes = []
+        graph_Omatrix = []
+        for C_row, O_row in zip(routes, Omatrix):
+            graph_C_row = [0] * self.n_graph_edges
+            for j, count in enumerate(C_row):
+                if count == 0:
+                    continue
+                path = self.node_path(*self.edges[j])
+                for u, v in zip(path[:-1], path[1:]):
+                    graph_C_row[self.graph_edge[(u, v)]] += count
+            graph_O_row = [0] * self.n_graph_nodes
+            for pos, load in enumerate(O_row):
+                graph_O_row[self.nodes[pos]] = load
+            graph_routes.append(graph_C_row)
+            graph_Omatrix.append(graph_O_row)
+        return graph_routes, graph_Omatrix
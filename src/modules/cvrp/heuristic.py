@@ -0,0 +1,359 @@
+import time
+
+import numpy as np
+
+from .routing import RoutingVRP
+
+# moves must improve the route length by more than this to be applied
+EPSILON = 1e-7
+
+
+class HeuristicVRP:
+    """
+    CVRP heuristic for fast replanning: Clarke-Wright savings construction followed by 2-opt, or-opt/relocate and
+    exchange local search on the shortest-path distance matrix. Moves are evaluated for all positions at once with
+    numpy, improving moves are applied best first. Restarts perturb the best solution with a seeded generator,
+    so the same input and seed always give the same routes.
+    """
+
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def vrp(cost_matrix, demand, capacity_vec, start_loc_vec, seed=0, restarts=30, max_iterations=1000,
+            time_limit=None, initial=None, stats=None):
+        """Solve the CVRP on the graph given by cost_matrix (sparse, cost of edge from node i to node j).
+        Takes and returns the same data as RoutingVRP.vrp: ordered routes of node indices per vehicle (start
+        excluded), load dropped per vehicle and node (Omatrix) and the objective value. The first node of
+        start_loc_vec[k] is the start of vehicle k, wherever it is in graph order.
+        time_limit (seconds) bounds the local search, the construction is always completed.
+        initial is the load per vehicle and node of the current plan: that load starts on its vehicle and only the
+        rest of the demand goes through the savings construction, so a replan repairs the current plan."""
+        start_time = time.time()
+        # Data validity
+        if len(start_loc_vec) != len(capacity_vec):
+            raise ValueError('Number of vehicles & number of start locations not match!')
+        if sum(capacity_vec) < sum(demand):
+            raise ValueError('Total vehicles capacity to low!')
+        if cost_matrix.shape[0] != len(demand):
+            raise ValueError('Number of nodes in dispatch and cost matrix dont match!')
+
+        n_cycles = len(capacity_vec)
+        n_nodes = len(demand)
+        starts = [locations[0] for locations in start_loc_vec]
+        visit_nodes, visit_demand, visit_vehicle = RoutingVRP.make_visits(demand, capacity_vec, start_loc_vec)
+
+        # location 0..n_cycles-1 are vehicle starts, the rest are visits
+        location_nodes = starts + visit_nodes
+        dist = RoutingVRP.location_distances(cost_matrix, location_nodes)
+        location_demand = np.array([0] * n_cycles + visit_demand, dtype=float)
+        pinned = np.array([-1] * n_cycles + visit_vehicle, dtype=np.int64)
+        capacity = np.array(capacity_vec, dtype=float)
+        preferred = np.array([-1] * n_cycles + HeuristicVRP._initial_vehicles(visit_nodes, visit_demand,
+                                                                              visit_vehicle, initial), dtype=np.int64)
+
+        routes = HeuristicVRP._savings(dist, location_demand, pinned, capacity, preferred)
+        construction_cost = HeuristicVRP._cost(dist, routes)
+        build_time = time.time() - start_time
+
+        solvetime = time.time()
+        deadline = solvetime + time_limit if time_limit is not None else None
+        best, iterations = HeuristicVRP._improve(dist, routes, location_demand, pinned, capacity, max_iterations,
+                                                 deadline)
+        best_cost = HeuristicVRP._cost(dist, best)
+        rng = np.random.default_rng(seed)
+        for _ in range(restarts):
+            if deadline is not None and time.time() > deadline:
+                break
+            candidate = HeuristicVRP._perturb(best, location_demand, pinned, capacity, rng)
+            candidate, restart_iterations = HeuristicVRP._improve(dist, candidate, location_demand, pinned, capacity,
+                                                                  max_iterations, deadline)
+            iterations += restart_iterations
+            candidate_cost = HeuristicVRP._cost(dist, candidate)
+            if candidate_cost < best_cost - EPSILON:
+                best, best_cost = candidate, candidate_cost
+        endsolve = time.time() - solvetime
+        status = "TIME_LIMIT" if deadline is not None and time.time() > deadline else "LOCAL_OPTIMUM"
+        print("Heuristic search took: {}, status: {}".format(endsolve, status))
+
+        routes = []
+        Omatrix = []
+        for k, route in enumerate(best):
+            nodes = []
+            O_row = [0] * n_nodes
+            for location in route[1:-1]:
+                node = location_nodes[location]
+                O_row[node] += int(location_demand[location])
+                if not nodes or nodes[-1] != node:
+                    nodes.append(node)
+            routes.append(nodes)
+            Omatrix.append(O_row)
+
+        if stats is not None:
+            stats.update({
+                "n_visits": len(visit_nodes),
+                "build_time": build_time,
+                "solve_time": endsolve,
+                "status": status,
+                "construction_cost": construction_cost,
+                "iterations": iterations
+            })
+
+        print("Heuristic VRP total execution took: {}".format(time.time() - start_time))
+        return routes, Omatrix, best_cost
+
+    @staticmethod
+    def _cost(dist, routes):
+        return float(sum(dist[route[:-1], route[1:]].sum() for route in routes))
+
+    @staticmethod
+    def _initial_vehicles(visit_nodes, visit_demand, visit_vehicle, initial):
+        """Vehicle that holds each visit in the current plan, -1 for new demand"""
+        preferred = [-1] * len(visit_nodes)
+        if initial is None:
+            return preferred
+        remaining = np.array(initial, dtype=float)
+        for visitN, (node, visit_load, vehicle) in enumerate(zip(visit_nodes, visit_demand, visit_vehicle)):
+            if vehicle >= 0 or visit_load == 0:
+                continue
+            holders = np.flatnonzero(remaining[:, node] > 0)
+            if len(holders) > 0:
+                preferred[visitN] = int(holders[0])
+                remaining[holders[0], node] -= visit_load
+        return preferred
+
+    @staticmethod
+    def _savings(dist, location_demand, pinned, capacity, preferred):
+        """Clarke-Wright savings construction. Pinned visits and visits of the current plan (preferred) are placed
+        on their vehicle first. The other visits are merged into chains by savings against the closest vehicle
+        start, chains are then inserted into vehicle routes at their cheapest feasible position."""
+        n_cycles = len(capacity)
+        routes = [[k, k] for k in range(n_cycles)]
+        loads = np.zeros(n_cycles)
+        for location in np.flatnonzero(pinned >= 0):
+            k = pinned[location]
+            HeuristicVRP._insert_chain(dist, routes, loads, capacity, [location], location_demand[location], [k])
+        placed = pinned >= 0
+        for location in np.flatnonzero(preferred >= 0):
+            placed[location] = HeuristicVRP._insert_chain(dist, routes, loads, capacity, [location],
+                                                          location_demand[location], [preferred[location]])
+        free = n_cycles + np.flatnonzero(~placed[n_cycles:])
+        if len(free) == 0:
+            return routes
+
+        # savings of serving j right after i instead of returning to the closest start in between
+        to_start = dist[np.ix_(free, np.arange(n_cycles))].min(axis=1)
+        from_start = dist[np.ix_(np.arange(n_cycles), free)].min(axis=0)
+        savings = to_start[:, None] + from_start[None, :] - dist[np.ix_(free, free)]
+        np.fill_diagonal(savings, -np.inf)
+        order = np.argsort(-savings, axis=None, kind="stable")
+
+        chain_of = {location: [location] for location in free}
+        chain_demand = {location: location_demand[location] for location in free}
+        max_capacity = capacity.max()
+        for flat in order:
+            i, j = divmod(int(flat), len(free))
+            if savings[i, j] <= 0:
+                break
+            head, tail = chain_of[free[i]], chain_of[free[j]]
+            # i must end its chain, j must start its chain
+            if head is tail or head[-1] != free[i] or tail[0] != free[j]:
+                continue
+            merged_demand = chain_demand[head[0]] + chain_demand[tail[0]]
+            if merged_demand > max_capacity:
+                continue
+            head.extend(tail)
+            chain_demand[head[0]] = merged_demand
+            for location in tail:
+                chain_of[location] = head
+
+        chains = {id(chain): chain for chain in chain_of.values()}.values()
+        chains = sorted(chains, key=lambda chain: (-chain_demand[chain[0]], chain[0]))
+        for chain in chains:
+            if not HeuristicVRP._insert_chain(dist, routes, loads, capacity, chain, chain_demand[chain[0]],
+                                              range(n_cycles)):
+                # no vehicle can take the whole chain, place its visits one by one
+                for location in chain:
+                    if not HeuristicVRP._insert_chain(dist, routes, loads, capacity, [location],
+                                                      location_demand[location], range(n_cycles)):
+                        raise ValueError('Heuristic could not place demand of location {} in any vehicle!'
+                                         .format(location))
+        return routes
+
+    @staticmethod
+    def _insert_chain(dist, routes, loads, capacity, chain, chain_demand, vehicles):
+        """Insert chain at the cheapest position of a vehicle with enough free capacity, False if there is none"""
+        best = None
+        for k in vehicles:
+            if loads[k] + chain_demand > capacity[k]:
+                continue
+            route = np.array(routes[k])
+            delta = dist[route[:-1], chain[0]] + dist[chain[-1], route[1:]] - dist[route[:-1], route[1:]]
+            position = int(np.argmin(delta))
+            if best is None or delta[position] < best[0] - EPSILON:
+                best = (delta[position], k, position)
+        if best is None:
+            return False
+        _, k, position = best
+        routes[k][position + 1:position + 1] = list(chain)
+        loads[k] += chain_demand
+        return True
+
+    @staticmethod
+    def _improve(dist, routes, location_demand, pinned, capacity, max_iterations, deadline):
+        """Best improvement local search over 2-opt, or-opt/relocate and exchange moves"""
+        routes = [list(route) for route in routes]
+        iterations = 0
+        while iterations < max_iterations:
+            if deadline is not None and time.time() > deadline:
+                break
+            loads = np.array([location_demand[route].sum() for route in routes])
+            moves = [HeuristicVRP._best_two_opt(dist, routes),
+                     HeuristicVRP._best_or_opt(dist, routes, loads, location_demand, pinned, capacity),
+                     HeuristicVRP._best_exchange(dist, routes, loads, location_demand, pinned, capacity)]
+            moves = [move for move in moves if move is not None]
+            if not moves:
+                break
+            delta, apply, args = min(moves, key=lambda move: move[0])
+            if delta > -EPSILON:
+                break
+            apply(routes, *args)
+            iterations += 1
+        return routes, iterations
+
+    @staticmethod
+    def _best_two_opt(dist, routes):
+        """Reverse route[i+1..j], the reversed part is priced with backward arc costs since the graph is directed"""
+        best = None
+        for r, route in enumerate(routes):
+            n = len(route)
+            if n < 4:
+                continue
+            route = np.array(route)
+            forward = np.concatenate(([0.0], np.cumsum(dist[route[:-1], route[1:]])))
+            backward = np.concatenate(([0.0], np.cumsum(dist[route[1:], route[:-1]])))
+            i, j = np.meshgrid(np.arange(n - 1), np.arange(n - 1), indexing="ij")
+            valid = j >= i + 2
+            i, j = i[valid], j[valid]
+            old = forward[j + 1] - forward[i]
+            new = dist[route[i], route[j]] + backward[j] - backward[i + 1] + dist[route[i + 1], route[j + 1]]
+            delta = new - old
+            m = int(np.argmin(delta))
+            if best is None or delta[m] < best[0]:
+                best = (delta[m], HeuristicVRP._apply_two_opt, (r, int(i[m]), int(j[m])))
+        return best
+
+    @staticmethod
+    def _apply_two_opt(routes, r, i, j):
+        routes[r][i + 1:j + 1] = routes[r][i + 1:j + 1][::-1]
+
+    @staticmethod
+    def _best_or_opt(dist, routes, loads, location_demand, pinned, capacity):
+        """Move a segment of 1 to 3 visits to the best arc of any route (relocate is the single visit case)"""
+        arc_from, arc_to, arc_route, arc_pos = HeuristicVRP._arcs(routes)
+        arc_cost = dist[arc_from, arc_to]
+        best = None
+        for length in (1, 2, 3):
+            seg_route, seg_pos = [], []
+            for r, route in enumerate(routes):
+                for p in range(1, len(route) - length):
+                    seg_route.append(r)
+                    seg_pos.append(p)
+            if not seg_route:
+                continue
+            seg_route = np.array(seg_route)
+            seg_pos = np.array(seg_pos)
+            # locations at each position of the segments, not the vehicle start locations
+            seg_locations = [np.array([routes[r][p + t] for r, p in zip(seg_route, seg_pos)]) for t in range(length)]
+            prev = np.array([routes[r][p - 1] for r, p in zip(seg_route, seg_pos)])
+            after = np.array([routes[r][p + length] for r, p in zip(seg_route, seg_pos)])
+            first, last = seg_locations[0], seg_locations[-1]
+            seg_demand = sum(location_demand[loc] for loc in seg_locations)
+            seg_pinned = np.any([pinned[loc] >= 0 for loc in seg_locations], axis=0)
+
+            remove = dist[prev, after] - dist[prev, first] - dist[last, after]
+            insert = dist[arc_from[None, :], first[:, None]] + dist[last[:, None], arc_to[None, :]] - arc_cost[None, :]
+            delta = remove[:, None] + insert
+
+            same = arc_route[None, :] == seg_route[:, None]
+            # arcs touching the segment would give back the same route
+            touching = same & (arc_pos[None, :] >= seg_pos[:, None] - 1) & (arc_pos[None, :] <= seg_pos[:, None]
+                                                                               + length - 1)
+            fits = loads[arc_route][None, :] + seg_demand[:, None] <= capacity[arc_route][None, :] + EPSILON
+            valid = ~touching & (same | (fits & ~seg_pinned[:, None]))
+            delta[~valid] = np.inf
+            s, a = np.unravel_index(int(np.argmin(delta)), delta.shape)
+            if np.isfinite(delta[s, a]) and (best is None or delta[s, a] < best[0]):
+                best = (delta[s, a], HeuristicVRP._apply_or_opt,
+                        (int(seg_route[s]), int(seg_pos[s]), length, int(arc_route[a]), int(arc_pos[a])))
+        return best
+
+    @staticmethod
+    def _apply_or_opt(routes, r, p, length, target, position):
+        segment = routes[r][p:p + length]
+        del routes[r][p:p + length]
+        if target == r and position >= p + length:
+            position -= length
+        routes[target][position + 1:position + 1] = segment
+
+    @staticmethod
+    def _best_exchange(dist, routes, loads, location_demand, pinned, capacity):
+        """Swap two visits of different routes"""
+        vis_route, vis_pos, vis, prev, after = [], [], [], [], []
+        for r, route in enumerate(routes):
+            for p in range(1, len(route) - 1):
+                if pinned[route[p]] < 0:
+                    vis_route.append(r)
+                    vis_pos.append(p)
+                    vis.append(route[p])
+                    prev.append(route[p - 1])
+                    after.append(route[p + 1])
+        if len(vis) < 2:
+            return None
+        vis_route, vis, prev, after = map(np.array, (vis_route, vis, prev, after))
+        u, v = vis[:, None], vis[None, :]
+        delta = (dist[prev[:, None], v] + dist[v, after[:, None]] - dist[prev[:, None], u] - dist[u, after[:, None]]
+                 + dist[prev[None, :], u] + dist[u, after[None, :]] - dist[prev[None, :], v] - dist[v, after[None, :]])
+        demand_u, demand_v = location_demand[u], location_demand[v]
+        route_u, route_v = vis_route[:, None], vis_route[None, :]
+        valid = ((route_u < route_v)
+                 & (loads[route_u] - demand_u + demand_v <= capacity[route_u] + EPSILON)
+                 & (loads[route_v] - demand_v + demand_u <= capacity[route_v] + EPSILON))
+        delta = np.where(valid, delta, np.inf)
+        a, b = np.unravel_index(int(np.argmin(delta)), delta.shape)
+        if not np.isfinite(delta[a, b]):
+            return None
+        return delta[a, b], HeuristicVRP._apply_exchange, (int(vis_route[a]), vis_pos[a], int(vis_route[b]), vis_pos[b])
+
+    @staticmethod
+    def _apply_exchange(routes, r, p, q, t):
+        routes[r][p], routes[q][t] = routes[q][t], routes[r][p]
+
+    @staticmethod
+    def _arcs(routes):
+        arc_from, arc_to, arc_route, arc_pos = [], [], [], []
+        for r, route in enumerate(routes):
+            arc_from += route[:-1]
+            arc_to += route[1:]
+            arc_route += [r] * (len(route) - 1)
+            arc_pos += range(len(route) - 1)
+        return np.array(arc_from), np.array(arc_to), np.array(arc_route), np.array(arc_pos)
+
+    @staticmethod
+    def _perturb(routes, location_demand, pinned, capacity, rng):
+        """Move up to half of the free visits (at least 3) to random feasible positions"""
+        routes = [list(route) for route in routes]
+        loads = np.array([location_demand[route].sum() for route in routes])
+        free = [location for route in routes for location in route[1:-1] if pinned[location] < 0]
+        if not free:
+            return routes
+        strength = min(max(3, len(free) // 2), len(free))
+        for location in rng.choice(free, size=strength, replace=False):
+            r = next(r for r, route in enumerate(routes) if location in route[1:-1])
+            routes[r].remove(location)
+            loads[r] -= location_demand[location]
+            feasible = [k for k in range(len(routes)) if loads[k] + location_demand[location] <= capacity[k] + EPSILON]
+            k = feasible[rng.integers(len(feasible))]
+            routes[k].insert(int(rng.integers(1, len(routes[k]))), location)
+            loads[k] += location_demand[location]
+        return routes
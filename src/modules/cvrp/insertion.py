@@ -0,0 +1,50 @@
+import numpy as np
+
+
+class InsertionVRP:
+    """
+    Cheapest insertion of a single pickup and delivery pair into the vehicles' current routes.
+    A single ad-hoc order only adds one parcel to the fleet, instead of solving the whole VRP again the parcel is
+    inserted where it increases the route cost the least and the other stops keep their order.
+    """
+
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def insert(dist, routes, pickup, delivery, volume, capacity_vec, dropped):
+        """Find the cheapest feasible insertion of the pickup and delivery locations into open routes.
+        dist is the distance matrix of the locations, routes[k] lists the locations visited by vehicle k in order,
+        the first one is its start. The pickup is inserted after stop i and the delivery after stop j >= i (right after
+        the pickup when i == j). capacity_vec[k] is the free capacity of vehicle k at its start and dropped[k][i] the
+        volume it drops at stop i, the pickup is feasible where the free capacity after the drops fits the volume.
+        Returns (vehicle, i, j, cost increase) or None when there is no feasible insertion."""
+        dist = np.asarray(dist, dtype=float)
+        best = None
+        for k, route in enumerate(routes):
+            route = np.asarray(route, dtype=np.int64)
+            # cost of the arc leaving every stop, the last stop of an open route has none
+            has_next = np.arange(len(route)) < len(route) - 1
+            following = np.append(route[1:], route[-1])
+            arc = np.where(has_next, dist[route, following], 0)
+            insert_pickup = dist[route, pickup] + np.where(has_next, dist[pickup, following], 0) - arc
+            insert_delivery = dist[route, delivery] + np.where(has_next, dist[delivery, following], 0) - arc
+
+            delta = insert_pickup[:, None] + insert_delivery[None, :]
+            delta[np.tril_indices(len(route), -1)] = np.inf  # delivery before the pickup
+            delta[np.diag_indices(len(route))] = dist[route, pickup] + dist[pickup, delivery] + \
+                np.where(has_next, dist[delivery, following], 0) - arc
+
+            free = capacity_vec[k] + np.cumsum(np.asarray(dropped[k], dtype=float))
+            delta[free < volume, :] = np.inf
+            if not np.isfinite(delta).any():
+                continue
+            i, j = np.unravel_index(np.argmin(delta), delta.shape)
+            if best is None or delta[i, j] < best[3]:
+                best = (k, int(i), int(j), float(delta[i, j]))
+        return best
+
+    @staticmethod
+    def apply(route, pickup, delivery, i, j):
+        """Route with the pickup inserted after stop i and the delivery after stop j"""
+        return list(route[:i + 1]) + [pickup] + list(route[i + 1:j + 1]) + [delivery] + list(route[j + 1:])
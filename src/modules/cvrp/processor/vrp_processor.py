@@ -1,7 +1,14 @@
-from math import inf
+from concurrent.futures import ProcessPoolExecutor
+import time
 
+import numpy as np
 import requests
 import copy
+from ..cache import VrpCache
+from ..closure import MetricClosure
+from ..heuristic import HeuristicVRP
+from ..insertion import InsertionVRP
+from ..routing import RoutingVRP
 from ..vrp import VRP
 from ...create_graph.config.config_parser import ConfigParser
 from ...utils.structures.deliveries import Deliveries
@@ -19,7 +26,40 @@ SLO_CRO_USE_CASE = "SLO-CRO"
 CROATIA = "CRO"
 SLOVENIA = "SLO"
 
+ENGINE_MILP = "milp"
+ENGINE_ROUTING = "routing"
+ENGINE_HEURISTIC = "heuristic"
+
+# replans that start from the vehicles' remaining plans
+WARM_START_EVENTS = ("brokenVehicle", "pickupRequest")
+
 config_parser = ConfigParser()
+# shared by all processors, a processor is created for every request
+vrp_cache = VrpCache(**config_parser.get_vrp_cache_params())
+# process pools for per-partition solving, one per use case: (graphs the workers were started with, pool)
+_pools = {}
+_worker_processor = None
+
+
+def _init_worker(graphs, use_case):
+    global _worker_processor
+    _worker_processor = VrpProcessor(graphs, use_case)
+
+
+def _solve_in_worker(partition_idx, plan_input, initial):
+    """Solve a plan in a pool worker, plan_input holds dropoff, capacities and start locations"""
+    partition = _worker_processor.graphs[partition_idx]
+    vrp_input = (partition.incident_matrix, *plan_input, [e.cost for e in partition.edges])
+    return _worker_processor.solve_plan(partition, vrp_input, initial)
+
+
+def shutdown_pools(use_case=None):
+    """Stop the worker pool of a use case, all pools without use_case. Needed when the graphs of a use case are
+    rebuilt, workers keep the graphs they were started with"""
+    for pool_use_case in [use_case] if use_case is not None else list(_pools):
+        if pool_use_case in _pools:
+            _pools.pop(pool_use_case)[1].shutdown()
+
 
 class VrpProcessor:
     """Processes a request for routing
@@ -31,6 +71,16 @@ class VrpProcessor:
         self.vrp = VRP()
         self.graphs = graphs
         self.use_case = use_case
+        self.solver_params = config_parser.get_vrp_solver_params(use_case)
+        self.reduce_graph = config_parser.get_vrp_reduction(use_case)
+        self.routing = RoutingVRP()
+        self.routing_params = config_parser.get_routing_solver_params(use_case)
+        self.heuristic = HeuristicVRP()
+        self.heuristic_params = config_parser.get_heuristic_solver_params(use_case)
+        self.engine = config_parser.get_vrp_engine(use_case)
+        self.workers = config_parser.get_vrp_workers(use_case)
+        self.insertion = InsertionVRP()
+        self.insertion_params = config_parser.get_insertion_params(use_case)
 
     def map_vehicles(self, vehicles):
         """Assign vehicles to partitions"""
@@ -38,10 +88,8 @@ class VrpProcessor:
 
         for v in vehicles:
             for i in range(len(self.graphs)):
-                graph = self.graphs[i]
-                for node in graph.nodes:
-                    if v.start_node == node.id:
-                        map_v[i].append(v)
+                if self.graphs[i].index_from_id(v.start_node) is not None:
+                    map_v[i].append(v)
         return map_v
 
     def map_deliveries(self, deliveries):
@@ -49,11 +97,8 @@ class VrpProcessor:
         delivery_parts = [[] for _ in self.graphs]
         for d in deliveries:
             for i in range(len(self.graphs)):
-                graph = self.graphs[i]
-                nodes = graph.nodes
-                for n in nodes:
-                    if n.id == d.target:
-                        delivery_parts[i].append(d)
+                if self.graphs[i].index_from_id(d.target) is not None:
+                    delivery_parts[i].append(d)
         print(sum([len(x) for x in delivery_parts]), len(deliveries))
         # TODO: THis doesnt pass, because the len of expected deliveries is
         # less than the number of deliveries now when brokenVehicle event occurred.
@@ -66,28 +111,26 @@ class VrpProcessor:
         """Computer VRP input vector, how much volume will be dropped off on each node"""
         dropoff = [0] * len(graph.nodes)
         for d in deliveries:
-            node = graph.node_from_id(d.target)
-            idx = graph.nodes.index(node)
+            idx = graph.index_from_id(d.target)
+            if idx is None:
+                raise ValueError('Node {} not in the graph'.format(d.target))
             dropoff[idx] += d.volume
         return dropoff
 
     @staticmethod
     def map_start_nodes(graph, vehicles):
-        """Compute VRP input list of vectors where do the vehicles start"""
+        """Compute VRP input list of vectors where do the vehicles start, the start node is the first index of
+        each vector and the parcel targets of the vehicle follow it"""
         indexes = []
         for v in vehicles:
-            index = []
-            for i in range(len(graph.nodes)):
-                if graph.nodes[i].id == v.start_node:
-                    index.append(i)
-                for parcel in v.parcels:
-                    if graph.nodes[i].id == parcel.target:
-                        index.append(i)
-            indexes.append(index)
+            # start node first, then parcel targets in graph order, nodes outside the graph are left out
+            start = graph.index_from_id(v.start_node)
+            targets = {graph.index_from_id(p.target) for p in v.parcels} - {start, None}
+            indexes.append(([start] if start is not None else []) + sorted(targets))
         return indexes
 
-    def process(self, vehicles, deliveries_object, event_type, use_case_graph):
-        """Process routing request with N vehicles and M deliveries, to produce a list of routing plans"""
+    def make_plans(self, vehicles, deliveries_object, event_type):
+        """Map vehicles and deliveries to partitions, one Plan per partition"""
         deliveries_all = deliveries_object.origin + deliveries_object.req
         deliveries_req = deliveries_object.req
 
@@ -109,8 +152,178 @@ class VrpProcessor:
             # mapping all data to partitions
             plans = [Plan(vehicle_map[i], delivery_map[i], delivery_map_req[i], self.graphs[i]) for i in
                      range(len(self.graphs))]
+        return plans
+
+    def vrp_input(self, plan):
+        """Compute VRP input vectors for a plan: incidence matrix, dropoff, capacities, start locations, costs"""
+        partition = plan.partition
+        dropoff = self.map_dropoff(partition, plan.deliveries)
+        capacity = [v.capacity for v in plan.vehicles]
+        start_loc = self.map_start_nodes(partition, plan.vehicles)
+        costs = [e.cost for e in partition.edges]
+        return partition.incident_matrix, dropoff, capacity, start_loc, costs
+
+    def remaining_loads(self, plan):
+        """Load per vehicle and node of the vehicles' remaining plans: parcels already on the vehicles"""
+        return [self.map_dropoff(plan.partition, v.parcels) for v in plan.vehicles]
+
+    def solve_milp(self, partition, vrp_input, stats, initial=None):
+        """Solve VRP.vrp on the metric closure of the relevant nodes when graph reduction is enabled and the closure
+        has fewer edges than the partition, otherwise on the whole partition. Results are on the partition nodes.
+        Solutions are cached by their input, a resent request is answered without solving. initial loads of the
+        remaining plans are passed as MIP hint.
+        The closure needs at least 3 nodes, the MILP visits a node over two of its outgoing edges."""
+        if self.reduce_graph:
+            closure = MetricClosure(partition, vrp_input[1], vrp_input[3])
+            if 2 < len(closure.nodes) and len(closure.edges) < len(partition.edges):
+                print('Solving on metric closure: {} nodes, {} edges'.format(len(closure.nodes), len(closure.edges)))
+                hint = closure.reduce_loads(initial) if initial is not None else None
+                computed_routes, dispatch, objc = vrp_cache.solve(self.vrp.vrp, *closure.vrp_input(vrp_input[2]),
+                                                                  stats=stats, hint=hint, **self.solver_params)
+                computed_routes, dispatch = closure.expand(computed_routes, dispatch)
+                return computed_routes, dispatch, objc
+        return vrp_cache.solve(self.vrp.vrp, *vrp_input, stats=stats, hint=initial, **self.solver_params)
+
+    def solve_plan(self, partition, vrp_input, initial=None):
+        """Solve the VRP of one plan with the configured engine, the MILP is the fallback of the other engines.
+        initial holds the loads of the vehicles' remaining plans for a warm start (MILP hint, heuristic construction).
+        Returns visiting orders (None for the MILP), dispatch, objective value and solver stats with plan_time"""
+        start_time = time.time()
+        stats = {}
+        orders = None
+        if self.engine in (ENGINE_ROUTING, ENGINE_HEURISTIC):
+            if self.engine == ENGINE_ROUTING:
+                engine, params = self.routing, self.routing_params
+            else:
+                engine, params = self.heuristic, dict(self.heuristic_params, initial=initial)
+            try:
+                orders, dispatch, objc = engine.vrp(partition.cost_matrix(), *vrp_input[1:4], stats=stats, **params)
+            except ValueError as error:
+                print('{} engine failed, falling back to MILP: {}'.format(self.engine, error))
+        if orders is None:
+            computed_routes, dispatch, objc = self.solve_milp(partition, vrp_input, stats, initial)
+        stats["plan_time"] = time.time() - start_time
+        return orders, dispatch, objc, stats
+
+    def solve_plans(self, plans, warm_start=False):
+        """Solve independent plans, in a process pool when more than one worker is configured. Workers get the
+        graphs once when the pool starts and only receive the plan vectors, results keep the order of plans. The pool
+        is started again when the processor's graphs are not the ones of the running pool.
+        With warm_start the solvers start from the vehicles' remaining plans."""
+        vrp_inputs = [self.vrp_input(plan) for plan in plans]
+        initials = [self.remaining_loads(plan) if warm_start else None for plan in plans]
+        if self.workers <= 1 or len(plans) <= 1:
+            return [self.solve_plan(plan.partition, vrp_input, initial)
+                    for plan, vrp_input, initial in zip(plans, vrp_inputs, initials)]
+
+        # a processor with other graphs (rebuilt after new CLOs) gets a new pool
+        if self.use_case in _pools and _pools[self.use_case][0] is not self.graphs:
+            shutdown_pools(self.use_case)
+        if self.use_case not in _pools:
+            _pools[self.use_case] = (self.graphs, ProcessPoolExecutor(max_workers=self.workers,
+                                                                      initializer=_init_worker,
+                                                                      initargs=(self.graphs, self.use_case)))
+        pool = _pools[self.use_case][1]
+        futures = [pool.submit(_solve_in_worker, self.graphs.index(plan.partition), vrp_input[1:4], initial)
+                   for plan, vrp_input, initial in zip(plans, vrp_inputs, initials)]
+        solutions = [future.result() for future in futures]
+        # workers have their own caches, their lookups are counted here too
+        for solution in solutions:
+            if "cache_hit" in solution[3]:
+                vrp_cache.record(solution[3]["cache_hit"])
+        return solutions
+
+    @staticmethod
+    def cache_stats():
+        """Hits, misses and size of the VRP solution cache, lookups of pool workers included"""
+        return vrp_cache.counters()
+
+    @staticmethod
+    def remaining_route(graph, vehicle):
+        """Node indexes of the vehicle's remaining plan: its start and the targets of its parcels in unload order"""
+        route = []
+        for node_id in [vehicle.start_node] + [parcel.target for parcel in vehicle.parcels]:
+            idx = graph.index_from_id(node_id)
+            if idx is None:
+                raise ValueError('Node {} of vehicle {} not in the partition'.format(node_id, vehicle.name))
+            if idx not in route:
+                route.append(idx)
+        return route
+
+    def insert_order(self, plan):
+        """Fast path for a single ad-hoc order: insert its pickup and delivery into the remaining routes of the plan's
+        vehicles at the cheapest feasible positions, the other stops keep their order.
+        Returns the vehicle the order is assigned to (None for plans without the order) and the route node indexes of
+        every vehicle. Raises ValueError when the order can not be inserted within max_cost_increase."""
+        start_time = time.time()
+        graph = plan.partition
+        routes = [self.remaining_route(graph, v) for v in plan.vehicles]
+        if len(plan.deliveries_req) == 0:
+            return None, routes
+
+        parcel = plan.deliveries_req[0]
+        pickup = graph.index_from_id(parcel.current_location)
+        if pickup is None:
+            raise ValueError('Pickup {} of order {} not in the partition'.format(parcel.current_location, parcel.uuid))
+        delivery = graph.index_from_id(parcel.target)
+        if delivery is None:
+            raise ValueError('Delivery {} of order {} not in the partition'.format(parcel.target, parcel.uuid))
+        location_nodes = sorted({node for route in routes for node in route} | {pickup, delivery})
+        position = {node: pos for pos, node in enumerate(location_nodes)}
+        dist = RoutingVRP.location_distances(graph.cost_matrix(), location_nodes)
+        dropped = [[sum(p.volume for p in v.parcels if p.target == graph.nodes[node].id) for node in route]
+                   for v, route in zip(plan.vehicles, routes)]
+        best = self.insertion.insert(dist, [[position[node] for node in route] for route in routes], position[pickup],
+                                     position[delivery], parcel.volume, [v.capacity for v in plan.vehicles], dropped)
+        if best is None:
+            raise ValueError('No vehicle can take order {}'.format(parcel.uuid))
+        k, i, j, cost = best
+        if cost > self.insertion_params["max_cost_increase"]:
+            raise ValueError('Inserting order {} costs {}, over {}'.format(parcel.uuid, cost,
+                                                                          self.insertion_params["max_cost_increase"]))
+
+        route = self.insertion.apply(routes[k], pickup, delivery, i, j)
+        # the pickup or delivery can be the stop before it
+        routes[k] = [node for n, node in enumerate(route) if n == 0 or node != route[n - 1]]
+        print('Inserted order {} to vehicle {}, cost increase {}, took {}'.format(parcel.uuid, plan.vehicles[k].name,
+                                                                                 cost, time.time() - start_time))
+        return k, routes
+
+    def process_insertion(self, plans, use_case_graph):
+        """Routes of the active plans with a single ad-hoc order inserted into the remaining routes.
+        Returns None when the order needs a full solve, the vehicles are not changed in that case."""
+        insertions = []
+        for i, plan in plans:
+            try:
+                insertions.append(self.insert_order(plan))
+            except ValueError as error:
+                print('Order insertion failed, solving plan {}: {}'.format(i, error))
+                return None
+        if all(vehicle_idx is None for vehicle_idx, _ in insertions):
+            print('No plan with vehicles takes the order, solving')
+            return None
 
         routes = []
+        for (i, plan), (vehicle_idx, plan_routes) in zip(plans, insertions):
+            graph = plan.partition
+            if vehicle_idx is not None:
+                parcel = plan.deliveries_req[0]
+                plan.vehicles[vehicle_idx].parcels.append(parcel)
+                plan.deliveries_req.remove(parcel)
+            for k, (vehicle, route) in enumerate(zip(plan.vehicles, plan_routes)):
+                dispatch = self.map_dropoff(graph, vehicle.parcels)
+                dispatch[route[0]] = 0
+                # the pickup is a stop even if nothing is dropped there
+                stops = {graph.index_from_id(vehicle.parcels[-1].current_location)} if k == vehicle_idx else set()
+                routes.append(self.convert_route([graph.nodes[node] for node in route], dispatch, graph, vehicle,
+                                                 use_case_graph, stops))
+        return routes
+
+    def process(self, vehicles, deliveries_object, event_type, use_case_graph):
+        """Process routing request with N vehicles and M deliveries, to produce a list of routing plans"""
+        plans = self.make_plans(vehicles, deliveries_object, event_type)
+
+        active = []
         for i, plan in enumerate(plans):
             partition = plan.partition
             if len(plan.deliveries) == 0 or len(plan.vehicles) == 0:
@@ -121,36 +334,40 @@ class VrpProcessor:
             print('Starting planning for {} vehicles to deliver {} packages. Node len: {}'.format(len(plan.vehicles),
                                                                                                   len(plan.deliveries),
                                                                                                   len(partition.nodes)))
+            active.append((i, plan))
 
-            # compute input vectors
-            dropoff = self.map_dropoff(plan.partition, plan.deliveries)
-            capacity = [v.capacity for v in plan.vehicles]
-            start_loc = self.map_start_nodes(partition, plan.vehicles)
-            costs = [e.cost for e in partition.edges]
+        # a single ad-hoc order is inserted into the current routes, the whole fleet is solved only when that fails
+        if event_type == "pickupRequest" and len(deliveries_object.req) == 1 and self.insertion_params["enabled"]:
+            routes = self.process_insertion(active, use_case_graph)
+            if routes is not None:
+                return routes
 
-            computed_routes, dispatch, objc = self.vrp.vrp(partition.incident_matrix, dropoff, capacity, start_loc,
-                                                           costs)
+        # partitions are independent, the solver is bounded by the use case time limit and gap
+        start_time = time.time()
+        solutions = self.solve_plans([plan for _, plan in active], event_type in WARM_START_EVENTS)
+        print('Solved {} plans in {}'.format(len(active), time.time() - start_time))
 
-            # compute routes based on dispatch vectors from VRP. Since VRP output is incomplete/not best,
-            # we add A* routing on top
-            plan_routes = self.make_route(dispatch, partition, plan.vehicles, plan.deliveries_req, event_type, use_case_graph)
+        routes = []
+        for (i, plan), (orders, dispatch, objc, stats) in zip(active, solutions):
+            print('VRP solution for plan {}: status {}, gap {}, cache hit {}, took {}'.format(
+                i, stats["status"], stats.get("gap"), stats.get("cache_hit"), stats["plan_time"]))
+
+            # compute routes based on dispatch vectors from VRP. Since MILP output is incomplete/not best,
+            # we add A* routing on top, the routing and heuristic engines already give the visiting order
+            plan_routes = self.make_route(dispatch, plan.partition, plan.vehicles, plan.deliveries_req, event_type,
+                                          use_case_graph, orders)
             routes += plan_routes
 
         return routes
 
     @staticmethod
     def find_closest_post(loads, start, graph):
-        nodes = graph.nodes
-        min_dist = inf
-        min_idx = -1
-
-        for post_idx, load in enumerate(loads):
-            if load > 0:
-                cur_dist = graph.distance(start, nodes[post_idx])
-                if cur_dist < min_dist:
-                    min_dist = cur_dist
-                    min_idx = post_idx
-        return min_idx
+        """Index of the node with load closest to start by road, -1 when no node has load"""
+        candidates = np.flatnonzero(np.asarray(loads) > 0)
+        if len(candidates) == 0:
+            return -1
+        dist = graph.road_distances(start)
+        return int(candidates[np.argmin(dist[candidates])])
 
     @staticmethod
     def make_route_sequence(route):
@@ -199,7 +416,9 @@ class VrpProcessor:
         else:
             return route
 
-    def make_route(self, loads, graph, vehicles, deliveries_req, event_type, use_case_graph):
+    def make_route(self, loads, graph, vehicles, deliveries_req, event_type, use_case_graph, orders=None):
+        """Build vehicle routes from VRP loads. orders optionally holds the visiting order of node indexes for each
+        vehicle, nodes with load that are not in it are appended by the closest post rule."""
         nodes = graph.nodes
         edges = graph.edges
         print("Building route from VRP output...")
@@ -232,6 +451,8 @@ class VrpProcessor:
                                 deliveries_req.remove(deliveries_req[j])
                                 vehicle_load_diff -= pay_weight
                                 break
+                        else:  # no requested parcel left for this node, the load is carried by another vehicle
+                            break
 
             loads_new.append(self.map_dropoff(graph, vehicle.parcels))
 
@@ -241,11 +462,17 @@ class VrpProcessor:
             vehicle_node_sequence.append(start_node.id)
 
             current_node = start_node
-            vehicle_load[nodes.index(current_node)] -= vehicle_load[nodes.index(current_node)]
+            vehicle_load[graph.index_from_id(current_node.id)] -= vehicle_load[graph.index_from_id(current_node.id)]
             cost_astar = 0
             vehicle_load = list(map(int, vehicle_load))
             dispatch = vehicle_load.copy()
             # variableIDS_list = []
+            if orders is not None:  # visiting order given by the routing or heuristic engine
+                for post_idx in orders[i]:
+                    if vehicle_load[post_idx] > 0:
+                        vehicle_load[post_idx] -= vehicle_load[post_idx]
+                        route.append(nodes[post_idx])
+
             # always find closest post with parcels to pick/drop off.
             # start at closest node
             # get route and clear up any packages on this route
@@ -256,53 +483,54 @@ class VrpProcessor:
 
                 vehicle_load[post_idx] -= vehicle_load[post_idx]  # take/drop all parcels
                 route.append(target)
+                current_node = target  # we are now at new node
 
             #route_ordered = self.make_route_sequence(route)
             #graph.print_path(route_ordered)
             routes.append(route)
-
-            # Extract 'latitude' and 'longitude' from station ID
-            csv_file = config_parser.get_csv_path(use_case_graph)
-            location_station_dict = CloUpdateHandler.extract_location_station_dict(csv_file)
-            station_id = vehicles[i].start_node
-            lat, lon = list(location_station_dict.keys())[list(location_station_dict.values()).index(station_id)]
-
-            # Append route to the list. Also, "start_address" is necessary for each vehicle which we later use for TSP.
-            converted_routes.append(
-                {"UUID": vehicles[i].name,
-                 "start_address": {
-                     "lat": lat,
-                     "lon": lon,
-                     "location_id": station_id
-                 },
-                 "route": self.map_parcels_to_route(route, dispatch, graph, vehicles[i])})
+            converted_routes.append(self.convert_route(route, dispatch, graph, vehicles[i], use_case_graph))
 
         return converted_routes
 
+    def convert_route(self, route, dispatch, graph, vehicle, use_case_graph, stops=()):
+        """Output of a vehicle route: vehicle UUID, start address and the route steps with parcels. stops holds node
+        indexes that are route steps without load"""
+        # Extract 'latitude' and 'longitude' from station ID
+        csv_file = config_parser.get_csv_path(use_case_graph)
+        location_station_dict = CloUpdateHandler.extract_location_station_dict(csv_file)
+        station_id = vehicle.start_node
+        lat, lon = list(location_station_dict.keys())[list(location_station_dict.values()).index(station_id)]
+
+        # "start_address" is necessary for each vehicle which we later use for TSP.
+        return {"UUID": vehicle.name,
+                "start_address": {
+                    "lat": lat,
+                    "lon": lon,
+                    "location_id": station_id
+                },
+                "route": self.map_parcels_to_route(route, dispatch, graph, vehicle, stops)}
+
     @staticmethod
-    def map_parcels_to_route(route, loads, graph, vehicle):
+    def map_parcels_to_route(route, loads, graph, vehicle, stops=()):
         """Maps parcels UUIDs to the vehicle route: existing parcels on hte vehicles + additional parcels alocated
-        loads_diff: position of addtional parcels to the vehicles routes from adhoc order"""
+        loads_diff: position of addtional parcels to the vehicles routes from adhoc order
+        stops: node indexes that are route steps even without load, as the pickup of an inserted order"""
         nodes = graph.nodes
         converted_route = []
         parcel_list= vehicle.parcels
         parcel_list_pickup = parcel_list.copy()
         step_num = 1  # ittreation index for rank field
 
-        if len(route) == 1 and loads[nodes.index(route[0])] == 0:
+        if len(route) == 1 and loads[graph.index_from_id(route[0].id)] == 0:
             return []
 
         # map parcel UUIDs to route
         for idx, node in enumerate(route):
-            node_idx = None
-            for i, n in enumerate(nodes):
-                if n.id == node.id:
-                    node_idx = i
-                    break
+            node_idx = graph.index_from_id(node.id)
             vehicle_parcels_unload = [x.uuid for x in parcel_list if x.target == node.id]
             vehicle_parcels_load = [x.uuid for x in parcel_list_pickup if x.current_location == node.id]
 
-            if (int(loads[node_idx]) > 0 or idx == 0):
+            if (int(loads[node_idx]) > 0 or idx == 0 or node_idx in stops):
                 converted_route.append({
                     "id": step_num,
                     "rank": step_num,
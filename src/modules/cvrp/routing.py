@@ -0,0 +1,152 @@
+import math
+import time
+
+import numpy as np
+from ortools.constraint_solver import pywrapcp, routing_enums_pb2
+from scipy.sparse import csgraph
+
+# routing solver works on integer arcs, edge costs are kept with 3 decimals (see Edge)
+COST_SCALE = 1000
+
+
+class RoutingVRP:
+    """
+    CVRP engine on top of the OR-Tools routing library.
+    Instead of the edge-cycle MILP over the incidence matrix it solves on the shortest-path distance matrix of the
+    vehicle start nodes and the nodes with demand, and returns ordered routes.
+    """
+
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def vrp(cost_matrix, demand, capacity_vec, start_loc_vec, time_limit=None, guided=True, stats=None):
+        """Solve the CVRP on the graph given by cost_matrix (sparse, cost of edge from node i to node j).
+        demand, capacity_vec and start_loc_vec have the same meaning as in VRP.vrp: the first node of
+        start_loc_vec[k] is the start of vehicle k, the others are mandatory locations of vehicle k.
+        Guided local search keeps improving the solution until time_limit (seconds), with guided=False greedy descent
+        stops in the first local optimum.
+        Returns routes as ordered lists of node indices visited by each vehicle (start excluded), load dropped per
+        vehicle and node (Omatrix, same as VRP.vrp) and the objective value."""
+        start_time = time.time()
+        # Data validity
+        if len(start_loc_vec) != len(capacity_vec):
+            raise ValueError('Number of vehicles & number of start locations not match!')
+        if sum(capacity_vec) < sum(demand):
+            raise ValueError('Total vehicles capacity to low!')
+        if cost_matrix.shape[0] != len(demand):
+            raise ValueError('Number of nodes in dispatch and cost matrix dont match!')
+
+        n_cycles = len(capacity_vec)
+        n_nodes = len(demand)
+        starts = [locations[0] for locations in start_loc_vec]
+
+        # visits: graph node, demand and the vehicle it is pinned to (-1 for any vehicle)
+        visit_nodes, visit_demand, visit_vehicle = RoutingVRP.make_visits(demand, capacity_vec, start_loc_vec)
+
+        # location 0..n_cycles-1 are vehicle starts, the rest are visits
+        location_nodes = starts + visit_nodes
+        arc_cost = np.rint(RoutingVRP.location_distances(cost_matrix, location_nodes) * COST_SCALE)\
+            .astype(np.int64).tolist()
+        location_demand = [0] * n_cycles + visit_demand
+
+        manager = pywrapcp.RoutingIndexManager(len(location_nodes), n_cycles, list(range(n_cycles)),
+                                               list(range(n_cycles)))
+        routing = pywrapcp.RoutingModel(manager)
+
+        def transit(from_index, to_index):
+            return arc_cost[manager.IndexToNode(from_index)][manager.IndexToNode(to_index)]
+
+        def load(from_index):
+            return location_demand[manager.IndexToNode(from_index)]
+
+        transit_index = routing.RegisterTransitCallback(transit)
+        routing.SetArcCostEvaluatorOfAllVehicles(transit_index)
+        demand_index = routing.RegisterUnaryTransitCallback(load)
+        routing.AddDimensionWithVehicleCapacity(demand_index, 0, [max(int(c), 0) for c in capacity_vec], True,
+                                                'Capacity')
+        for visitN, vehicle in enumerate(visit_vehicle):
+            if vehicle >= 0:
+                routing.VehicleVar(manager.NodeToIndex(n_cycles + visitN)).SetValues([vehicle])
+
+        search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+        search_parameters.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
+        if guided:
+            search_parameters.local_search_metaheuristic = \
+                routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
+        else:
+            search_parameters.local_search_metaheuristic = \
+                routing_enums_pb2.LocalSearchMetaheuristic.GREEDY_DESCENT
+        search_parameters.time_limit.FromMilliseconds(int((time_limit if time_limit is not None else 5) * 1000))
+        build_time = time.time() - start_time
+
+        solvetime = time.time()
+        assignment = routing.SolveWithParameters(search_parameters)
+        endsolve = time.time() - solvetime
+        status = routing_enums_pb2.RoutingSearchStatus.Value.Name(routing.status())
+        if assignment is None:
+            raise ValueError('Routing solver found no feasible solution, status: {}'.format(status))
+        print("Routing solver took: {}, status: {}".format(endsolve, status))
+
+        routes = []
+        Omatrix = []
+        for k in range(n_cycles):
+            route = []
+            O_row = [0] * n_nodes
+            index = assignment.Value(routing.NextVar(routing.Start(k)))
+            while not routing.IsEnd(index):
+                location = manager.IndexToNode(index)
+                node = location_nodes[location]
+                O_row[node] += location_demand[location]
+                if not route or route[-1] != node:
+                    route.append(node)
+                index = assignment.Value(routing.NextVar(index))
+            routes.append(route)
+            Omatrix.append(O_row)
+
+        obj_val = assignment.ObjectiveValue() / COST_SCALE
+
+        if stats is not None:
+            stats.update({
+                "n_visits": len(visit_nodes),
+                "build_time": build_time,
+                "solve_time": endsolve,
+                "status": status
+            })
+
+        print("Routing VRP total execution took: {}".format(time.time() - start_time))
+        return routes, Omatrix, obj_val
+
+    @staticmethod
+    def location_distances(cost_matrix, location_nodes):
+        """Shortest path distances between the given graph nodes, unreachable pairs get a large finite penalty"""
+        relevant = sorted(set(location_nodes))
+        dist = csgraph.dijkstra(cost_matrix, directed=True, indices=relevant)[:, relevant]
+        unreachable = ~np.isfinite(dist)
+        dist[unreachable] = (dist[~unreachable].sum() + 1) * 10
+        position = {node: pos for pos, node in enumerate(relevant)}
+        location_pos = np.array([position[node] for node in location_nodes], dtype=np.int64)
+        return dist[np.ix_(location_pos, location_pos)]
+
+    @staticmethod
+    def make_visits(demand, capacity_vec, start_loc_vec):
+        """Split the problem into visits the routing model can serve with a single vehicle.
+        Node demand is split in chunks not larger than the smallest vehicle capacity, so a node can still be served
+        by several vehicles as in the MILP. Mandatory locations become zero demand visits pinned to their vehicle."""
+        positive = [int(c) for c in capacity_vec if int(c) > 0]
+        chunk = min(positive) if positive else 1
+        visit_nodes, visit_demand, visit_vehicle = [], [], []
+        for node, node_demand in enumerate(demand):
+            remaining = int(math.ceil(node_demand))
+            while remaining > 0:
+                visit_nodes.append(node)
+                visit_demand.append(min(chunk, remaining))
+                visit_vehicle.append(-1)
+                remaining -= chunk
+        for k, locations in enumerate(start_loc_vec):
+            for node in locations[1:]:
+                if node != locations[0]:
+                    visit_nodes.append(node)
+                    visit_demand.append(0)
+                    visit_vehicle.append(k)
+        return visit_nodes, visit_demand, visit_vehicle
@@ -0,0 +1,11 @@
+from modules.demo.graph_processing import GraphProcessor
+from modules.utils.structures.edge import Edge
+from modules.utils.structures.node import Node
+
+
+def line_graph(n_nodes):
+    """0 - 1 - ... - n-1, both directions, cost 1 per edge"""
+    nodes = {str(i): {"uuid": "post{}".format(i), "address": "", "lat": 0, "lon": i} for i in range(n_nodes)}
+    edges = [Edge([i, i + 1, 1], nodes) for i in range(n_nodes - 1)] + \
+            [Edge([i + 1, i, 1], nodes) for i in range(n_nodes - 1)]
+    return GraphProcessor([Node(node) for node in nodes.values()], edges)
@@ -0,0 +1,476 @@
+import os
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+from scipy import sparse
+
+from modules.cvrp.cache import VrpCache
+from modules.cvrp.closure import MetricClosure
+from modules.cvrp.heuristic import HeuristicVRP
+from modules.cvrp.insertion import InsertionVRP
+from modules.cvrp.processor import vrp_processor
+from modules.cvrp.processor.vrp_processor import VrpProcessor, shutdown_pools
+from modules.cvrp.routing import RoutingVRP
+from modules.cvrp.test.graphs import line_graph
+from modules.cvrp.vrp import VRP, FORMULATION_COMPACT, BACKENDS
+from modules.demo.graph_processing import GraphProcessor
+from modules.utils.structures.edge import Edge
+from modules.utils.structures.node import Node
+from modules.utils.structures.parcel import Parcel
+from modules.utils.structures.plan import Plan
+from modules.utils.structures.vehicle import Vehicle
+
+# 4---3
+# |   |
+# 1---2
+# directed edges 12, 21, 23, 32, 34, 43, 41, 14; rows mark the start node of each edge
+SQUARE = [
+    [1, 0, 0, 0, 0, 0, 0, 1],
+    [0, 1, 1, 0, 0, 0, 0, 0],
+    [0, 0, 0, 1, 1, 0, 0, 0],
+    [0, 0, 0, 0, 0, 1, 1, 0],
+]
+SQUARE_COSTS = [1, 1, 2, 2, 1, 1, 2, 2]
+
+# node x node cost of the SQUARE edges
+SQUARE_COST_MATRIX = sparse.csr_matrix((SQUARE_COSTS, ([0, 1, 1, 2, 2, 3, 3, 0], [1, 0, 2, 1, 3, 2, 0, 3])),
+                                       shape=(4, 4))
+
+
+class TestVRP(unittest.TestCase):
+
+    def test_constraints_sparse_and_dense_input_match(self):
+        demand = [0, 2, 3, 1]
+        capacity = [4, 4]
+        start_loc = [[0], [0, 2]]
+
+        A_dense, b_dense = VRP._build_constraints(SQUARE, demand, capacity, start_loc)
+        A_sparse, b_sparse = VRP._build_constraints(sparse.csr_matrix(SQUARE), demand, capacity, start_loc)
+
+        self.assertTrue(sparse.issparse(A_sparse))
+        self.assertEqual(A_sparse.shape, A_dense.shape)
+        self.assertEqual((A_sparse != A_dense).nnz, 0)
+        self.assertTrue(np.array_equal(b_sparse, b_dense))
+
+        n_nodes, n_edges, n_cycles = 4, 8, 2
+        n_cols = 2 * n_nodes * n_cycles + n_edges * n_cycles + n_nodes * n_edges * n_cycles
+        self.assertEqual(A_sparse.shape[1], n_cols)
+        # no explicit zeros: demand of node 0 is zero, its 4.2 coefficients are dropped
+        self.assertTrue(np.all(A_sparse.data != 0))
+
+    def test_vrp_delivers_all_demand(self):
+        demand = [0, 2, 3, 1]
+        capacity = [4, 4]
+        start_loc = [[0], [0]]
+
+        stats = {}
+        routes, dispatch, obj_val = VRP.vrp(SQUARE, demand, capacity, start_loc, SQUARE_COSTS, stats=stats)
+
+        self.assertEqual(len(routes), 2)
+        self.assertEqual(len(dispatch), 2)
+        delivered = np.sum(dispatch, axis=0)
+        self.assertTrue(np.allclose(delivered, demand))
+        for k, row in enumerate(dispatch):
+            self.assertLessEqual(sum(row), capacity[k] + 1e-7)
+        self.assertEqual(obj_val, sum(c * SQUARE_COSTS[j] for row in routes for j, c in enumerate(row)))
+        self.assertEqual(stats["n_variables"], 2 * 8 + 2 * 2 * 4 + 4 * 8 * 2)
+        self.assertGreaterEqual(stats["build_time"], 0)
+        self.assertGreaterEqual(stats["solve_time"], 0)
+
+    def test_compact_formulation_matches_classic(self):
+        demand = [0, 2, 3, 1]
+        capacity = [4, 4]
+        start_loc = [[0], [0, 2]]
+
+        classic_stats, compact_stats = {}, {}
+        _, _, classic_obj = VRP.vrp(SQUARE, demand, capacity, start_loc, SQUARE_COSTS, stats=classic_stats)
+        routes, dispatch, compact_obj = VRP.vrp(SQUARE, demand, capacity, start_loc, SQUARE_COSTS,
+                                                stats=compact_stats, formulation=FORMULATION_COMPACT)
+
+        self.assertEqual(compact_obj, classic_obj)
+        self.assertLess(compact_stats["n_variables"], classic_stats["n_variables"])
+        self.assertTrue(np.allclose(np.sum(dispatch, axis=0), demand))
+
+    def test_vrp_reports_status_and_gap_with_limits(self):
+        demand = [0, 2, 3, 1]
+        capacity = [4, 4]
+        start_loc = [[0], [0]]
+
+        stats = {}
+        _, dispatch, _ = VRP.vrp(SQUARE, demand, capacity, start_loc, SQUARE_COSTS, stats=stats,
+                                 time_limit=10, mip_gap=0.05, threads=1)
+
+        self.assertIn(stats["status"], ("OPTIMAL", "FEASIBLE"))
+        self.assertTrue(0 <= stats["gap"] <= 0.05 + 1e-9)
+        self.assertTrue(np.allclose(np.sum(dispatch, axis=0), demand))
+
+    def test_backends_agree(self):
+        demand = [0, 2, 3, 1]
+        capacity = [4, 4]
+        start_loc = [[0], [0, 2]]
+
+        _, _, cbc_obj = VRP.vrp(SQUARE, demand, capacity, start_loc, SQUARE_COSTS, formulation=FORMULATION_COMPACT)
+        for backend in BACKENDS:
+            with self.subTest(backend=backend):
+                stats = {}
+                _, dispatch, obj_val = VRP.vrp(SQUARE, demand, capacity, start_loc, SQUARE_COSTS, stats=stats,
+                                               formulation=FORMULATION_COMPACT, backend=backend, time_limit=10)
+
+                self.assertEqual(stats["backend"], backend)
+                self.assertEqual(stats["status"], "OPTIMAL")
+                self.assertAlmostEqual(obj_val, cbc_obj)
+                self.assertTrue(np.allclose(np.sum(dispatch, axis=0), demand))
+
+    def test_symmetry_breaking_orders_loads_of_identical_vehicles(self):
+        demand = [0, 2, 3, 1]
+        capacity = [4, 4, 4]
+        start_loc = [[0], [0], [0, 2]]
+        self.assertEqual(VRP.vehicle_classes(capacity, start_loc), [[0, 1], [2]])
+
+        _, _, plain_obj = VRP.vrp(SQUARE, demand, capacity, start_loc, SQUARE_COSTS)
+        _, dispatch, obj_val = VRP.vrp(SQUARE, demand, capacity, start_loc, SQUARE_COSTS, symmetry_breaking=True)
+
+        self.assertEqual(obj_val, plain_obj)
+        self.assertGreaterEqual(sum(dispatch[0]), sum(dispatch[1]))
+        self.assertTrue(np.allclose(np.sum(dispatch, axis=0), demand))
+
+    def test_warm_start_from_remaining_plan(self):
+        demand = [0, 2, 3, 1]
+        capacity = [4, 4]
+        start_loc = [[0], [0]]
+        initial = [[0, 2, 0, 1], [0, 0, 3, 0]]
+
+        # without local search the construction returns the current plan
+        _, dispatch, _ = HeuristicVRP.vrp(SQUARE_COST_MATRIX, demand, capacity, start_loc, restarts=0,
+                                          max_iterations=0, initial=initial)
+        self.assertEqual(dispatch, initial)
+
+        _, _, plain_obj = VRP.vrp(SQUARE, demand, capacity, start_loc, SQUARE_COSTS, backend="SCIP")
+        _, dispatch, obj_val = VRP.vrp(SQUARE, demand, capacity, start_loc, SQUARE_COSTS, backend="SCIP",
+                                       hint=initial)
+        self.assertEqual(obj_val, plain_obj)
+        self.assertTrue(np.allclose(np.sum(dispatch, axis=0), demand))
+        with self.assertRaises(ValueError):
+            VRP.vrp(SQUARE, demand, capacity, start_loc, SQUARE_COSTS, hint=initial[:1])
+
+
+class TestVrpCache(unittest.TestCase):
+
+    def test_vrp_cache_hits_on_same_input_and_persists(self):
+        demand = [0, 2, 3, 1]
+        capacity = [4, 4]
+        start_loc = [[0], [0]]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "vrp_cache.pickle")
+            cache = VrpCache(max_size=1, path=path)
+
+            stats = {}
+            first = cache.solve(VRP.vrp, SQUARE, demand, capacity, start_loc, SQUARE_COSTS, stats=stats)
+            # sparse input with the same nonzeros is the same instance
+            cached_stats = {}
+            second = cache.solve(VRP.vrp, sparse.csr_matrix(SQUARE), demand, capacity, start_loc, SQUARE_COSTS,
+                                 stats=cached_stats)
+            self.assertEqual(second, first)
+            self.assertEqual(cached_stats["status"], stats["status"])
+            self.assertTrue(cached_stats["cache_hit"])
+            self.assertFalse(stats["cache_hit"])
+            self.assertEqual(cache.counters(), {"hits": 1, "misses": 1, "size": 1})
+
+            # different solver parameters are a different instance, the oldest entry is evicted
+            cache.solve(VRP.vrp, SQUARE, demand, capacity, start_loc, SQUARE_COSTS, formulation=FORMULATION_COMPACT)
+            self.assertEqual(cache.counters(), {"hits": 1, "misses": 2, "size": 1})
+
+            reloaded = VrpCache(path=path)
+            reloaded.solve(VRP.vrp, SQUARE, demand, capacity, start_loc, SQUARE_COSTS,
+                           formulation=FORMULATION_COMPACT)
+            self.assertEqual(reloaded.counters(), {"hits": 1, "misses": 0, "size": 1})
+
+
+class TestRoutingVRP(unittest.TestCase):
+
+    def test_routing_engine_serves_demand_and_mandatory_nodes(self):
+        demand = [0, 2, 3, 1]
+        capacity = [4, 4]
+        start_loc = [[0], [0, 2]]
+        cost_matrix = SQUARE_COST_MATRIX
+
+        stats = {}
+        routes, dispatch, obj_val = RoutingVRP.vrp(cost_matrix, demand, capacity, start_loc, time_limit=1,
+                                                   stats=stats)
+
+        self.assertTrue(np.allclose(np.sum(dispatch, axis=0), demand))
+        for k, row in enumerate(dispatch):
+            self.assertLessEqual(sum(row), capacity[k])
+            # every node with load is on the route of the vehicle
+            self.assertTrue(all(node in routes[k] for node, load in enumerate(row) if load > 0))
+        self.assertIn(2, routes[1])
+        # both vehicles leave the depot, a round trip over the square costs 6
+        self.assertGreaterEqual(obj_val, 6)
+        self.assertEqual(stats["status"], "ROUTING_SUCCESS")
+
+    def test_vehicle_starts_from_its_start_node(self):
+        graph = line_graph(5)
+        ids = [node.id for node in graph.nodes]
+        # the vehicle starts after one of its targets in graph order
+        vehicle = Vehicle("vehicle", ids[3], [Parcel("parcel1", ids[1], 1, ids[3]),
+                                               Parcel("parcel2", ids[4], 1, ids[3])], capacity=2)
+        start_loc = VrpProcessor.map_start_nodes(graph, [vehicle])
+        self.assertEqual(start_loc, [[3, 1, 4]])
+
+        routes, dispatch, obj_val = RoutingVRP.vrp(graph.cost_matrix(), [0, 1, 0, 0, 1], [2], start_loc,
+                                                   guided=False)
+        self.assertEqual(sorted(routes[0]), [1, 4])
+        self.assertEqual(dispatch, [[0, 1, 0, 0, 1]])
+        # 3 -> 4 -> 1 -> 3
+        self.assertEqual(obj_val, 6)
+
+
+class TestHeuristicVRP(unittest.TestCase):
+
+    def test_heuristic_matches_routing_engine_and_is_deterministic(self):
+        demand = [0, 2, 3, 1]
+        capacity = [4, 4]
+        start_loc = [[0], [0, 2]]
+
+        _, _, routing_obj = RoutingVRP.vrp(SQUARE_COST_MATRIX, demand, capacity, start_loc, time_limit=1)
+        routes, dispatch, obj_val = HeuristicVRP.vrp(SQUARE_COST_MATRIX, demand, capacity, start_loc, seed=3)
+
+        self.assertEqual(obj_val, routing_obj)
+        self.assertTrue(np.allclose(np.sum(dispatch, axis=0), demand))
+        for k, row in enumerate(dispatch):
+            self.assertLessEqual(sum(row), capacity[k])
+        self.assertIn(2, routes[1])
+        self.assertEqual(HeuristicVRP.vrp(SQUARE_COST_MATRIX, demand, capacity, start_loc, seed=3),
+                         (routes, dispatch, obj_val))
+
+    def test_vehicle_starts_from_its_start_node(self):
+        graph = line_graph(6)
+        ids = [node.id for node in graph.nodes]
+        # the start is neither the lowest nor the highest index of the vehicle
+        vehicle = Vehicle("vehicle", ids[4], [Parcel("parcel1", ids[5], 1, ids[4]),
+                                               Parcel("parcel2", ids[0], 1, ids[4])], capacity=2)
+        start_loc = VrpProcessor.map_start_nodes(graph, [vehicle])
+        self.assertEqual(start_loc, [[4, 0, 5]])
+
+        routes, dispatch, obj_val = HeuristicVRP.vrp(graph.cost_matrix(), [1, 0, 0, 0, 0, 1], [2], start_loc)
+        self.assertEqual(sorted(routes[0]), [0, 5])
+        self.assertEqual(dispatch, [[1, 0, 0, 0, 0, 1]])
+        # 4 -> 5 -> 0 -> 4
+        self.assertEqual(obj_val, 10)
+
+
+class TestGraphProcessor(unittest.TestCase):
+
+    def test_graph_indexes_and_pickles(self):
+        graph = line_graph(4)
+        ids = [node.id for node in graph.nodes]
+        self.assertIs(graph.node_from_id(ids[2]), graph.nodes[2])
+        self.assertEqual(graph.index_from_id(ids[3]), 3)
+        self.assertIsNone(graph.index_from_id("missing"))
+        self.assertEqual(graph.get_cost(graph.nodes[1], graph.nodes[2]), 1)
+        self.assertEqual(graph.get_path(graph.nodes[0], graph.nodes[3]).path, graph.nodes)
+        self.assertEqual(graph.cost_matrix()[1, 2], 1)
+        self.assertEqual(graph.cost_matrix().nnz, 6)
+
+        # indexes are not stored, they are rebuilt on load
+        state = graph.__getstate__()
+        self.assertNotIn("node_map", state)
+        loaded = pickle.loads(pickle.dumps(graph))
+        self.assertEqual([n for n, _ in loaded.adjacency[ids[1]]], [loaded.nodes[2], loaded.nodes[0]])
+
+        # edges to ids that are not nodes are left out of the matrices
+        graph.edges.append(Edge([0, 1, 1], {"0": {"uuid": ids[3]}, "1": {"uuid": "missing"}}))
+        graph.edges.append(Edge([0, 1, 1], {"0": {"uuid": "missing"}, "1": {"uuid": ids[0]}}))
+        graph._build_indexes()
+        graph.make_matrix()
+        self.assertEqual(graph.cost_matrix().nnz, 6)
+        self.assertEqual(graph.incident_matrix.shape, (4, 8))
+        self.assertEqual(graph.adjacency[ids[3]], [(graph.nodes[2], 1)])
+        self.assertNotIn("missing", graph.adjacency)
+
+    def test_sparse_incidence_matrix(self):
+        graph = line_graph(4)
+        self.assertTrue(sparse.issparse(graph.incident_matrix))
+        # edges 01, 12, 23, 10, 21, 32
+        self.assertEqual(graph.dense_incidence_matrix(), [[1, 0, 0, 0, 0, 0],
+                                                          [0, 1, 0, 1, 0, 0],
+                                                          [0, 0, 1, 0, 1, 0],
+                                                          [0, 0, 0, 0, 0, 1]])
+
+        # graphs pickled with the list of lists matrix get the sparse one on load
+        state = graph.__getstate__()
+        state["incident_matrix"] = graph.dense_incidence_matrix()
+        loaded = GraphProcessor.__new__(GraphProcessor)
+        loaded.__setstate__(state)
+        self.assertEqual((loaded.incident_matrix != graph.incident_matrix).nnz, 0)
+
+    def test_map_vehicles_to_nearest_nodes(self):
+        graph = line_graph(4)
+        vehicles = [{"latitude": n.lat + 0.001, "longitude": n.lon} for n in graph.nodes[::-1]]
+        self.assertEqual(graph.map_vehicles(vehicles), graph.nodes[::-1])
+
+    def test_closest_post_by_road_distance(self):
+        graph = line_graph(6)
+        # the shortcut 0 -> 5 makes node 5 the closest to node 0 by road, node 1 by straight line
+        graph.edges.append(Edge([0, 5, 0.5], {str(i): {"uuid": n.id} for i, n in enumerate(graph.nodes)}))
+        graph._build_indexes()
+        self.assertEqual(graph.road_distances(graph.nodes[0]).tolist(), [0, 1, 2, 2.5, 1.5, 0.5])
+
+        loads = [0, 1, 0, 1, 0, 1]
+        self.assertEqual(VrpProcessor.find_closest_post(loads, graph.nodes[0], graph), 5)
+        self.assertEqual(VrpProcessor.find_closest_post(loads, graph.nodes[2], graph), 1)
+        self.assertEqual(VrpProcessor.find_closest_post([0] * 6, graph.nodes[0], graph), -1)
+        # the cost matrix of the single source searches is built once, a changed edge cost builds it again
+        costs = graph.cost_matrix()
+        self.assertIs(graph.cost_matrix(), costs)
+        graph.set_edge_cost(len(graph.edges) - 1, 3.5)
+        self.assertIsNot(graph.cost_matrix(), costs)
+        self.assertEqual(graph.cost_matrix()[0, 5], 3.5)
+        self.assertEqual(VrpProcessor.find_closest_post(loads, graph.nodes[0], graph), 1)
+        graph.shortest_paths()
+        self.assertEqual(VrpProcessor.find_closest_post([0, 1, 0, 1, 0, 0], graph.nodes[5], graph), 3)
+
+    def test_path_searches_match_dijkstra(self):
+        rng = np.random.default_rng(0)
+        nodes = {str(i): {"uuid": "post{}".format(i), "address": "", "lat": rng.random() / 1000,
+                          "lon": rng.random() / 1000} for i in range(30)}
+        edges = [Edge([i, j, rng.integers(1, 10)], nodes) for i in range(30) for j in range(30)
+                 if i != j and rng.random() < 0.15]
+        graph = GraphProcessor([Node(node) for node in nodes.values()], edges)
+        dist = sparse.csgraph.dijkstra(graph.cost_matrix())
+
+        for i, j in rng.integers(0, 30, size=(40, 2)):
+            a, b = graph.nodes[i], graph.nodes[j]
+            if not np.isfinite(dist[i, j]):
+                with self.assertRaises(ValueError):
+                    graph.get_path(a, b)
+                continue
+            for path in (graph._find_shortest(a, b), graph._find_shortest_bidirectional(a, b)):
+                self.assertAlmostEqual(path.cost, dist[i, j])
+                self.assertIs(path.path[0], a)
+                self.assertIs(path.path[-1], b)
+                self.assertAlmostEqual(sum(graph.get_cost(u, v) for u, v in zip(path.path, path.path[1:])),
+                                       path.cost)
+
+        # cached paths are dropped when an edge cost changes
+        a, b = graph.nodes[graph.node_index[edges[0].start]], graph.nodes[graph.node_index[edges[0].end]]
+        self.assertIs(graph.get_path(a, b), graph.get_path(a, b))
+        graph.set_edge_cost(0, 0.5)
+        self.assertEqual(graph.get_path(a, b).cost, 0.5)
+
+
+class TestMetricClosure(unittest.TestCase):
+
+    def test_metric_closure_solves_on_relevant_nodes(self):
+        graph = line_graph(6)
+        demand = [0, 0, 0, 2, 0, 1]
+        capacity = [4]
+        start_loc = [[0]]
+
+        closure = MetricClosure(graph, demand, start_loc)
+        self.assertEqual(closure.nodes, [0, 3, 5])
+        self.assertEqual(closure.costs, [3, 5, 3, 2, 5, 2])
+        self.assertEqual(closure.node_path(0, 1), [0, 1, 2, 3])
+
+        routes, dispatch, obj_val = VRP.vrp(*closure.vrp_input(capacity))
+        routes, dispatch = closure.expand(routes, dispatch)
+
+        self.assertEqual(dispatch, [demand])
+        self.assertEqual(len(routes[0]), len(graph.edges))
+        # every closure edge is expanded into its path on the partition
+        self.assertEqual(obj_val, sum(count * e.cost for count, e in zip(routes[0], graph.edges)))
+
+
+class TestVrpProcessor(unittest.TestCase):
+
+    def test_parallel_plans_match_sequential(self):
+        graphs = [line_graph(6), line_graph(5)]
+        processor = VrpProcessor(graphs, "test")
+        plans = []
+        for graph in graphs:
+            vehicles = [Vehicle("vehicle", graph.nodes[0].id, [], capacity=4)]
+            deliveries = [Parcel("parcel1", graph.nodes[3].id, 2, None),
+                          Parcel("parcel2", graph.nodes[4].id, 1, None)]
+            plans.append(Plan(vehicles, deliveries, deliveries, graph))
+
+        processor.workers = 1
+        sequential = processor.solve_plans(plans)
+        processor.workers = 2
+        counters = VrpProcessor.cache_stats()
+        try:
+            parallel = processor.solve_plans(plans)
+        finally:
+            shutdown_pools()
+        # lookups of the workers are counted in the parent process
+        after = VrpProcessor.cache_stats()
+        self.assertEqual(after["hits"] + after["misses"], counters["hits"] + counters["misses"] + 2)
+
+        self.assertEqual([solution[:3] for solution in parallel], [solution[:3] for solution in sequential])
+        self.assertEqual(parallel[1][1], [[0, 0, 0, 2, 1]])
+        self.assertTrue(all(solution[3]["plan_time"] >= 0 for solution in parallel))
+
+    def test_rebuilt_graphs_get_a_new_pool(self):
+        def solve(graphs):
+            processor = VrpProcessor(graphs, "rebuild")
+            processor.workers = 2
+            plans = []
+            for graph in graphs:
+                vehicles = [Vehicle("vehicle", graph.nodes[0].id, [], capacity=4)]
+                deliveries = [Parcel("parcel1", graph.nodes[-2].id, 2, None),
+                              Parcel("parcel2", graph.nodes[-1].id, 1, None)]
+                plans.append(Plan(vehicles, deliveries, deliveries, graph))
+            return processor.solve_plans(plans)
+
+        try:
+            self.assertEqual(solve([line_graph(5), line_graph(5)])[1][1], [[0, 0, 0, 2, 1]])
+            # the workers of the old pool hold 5 nodes in the second partition
+            self.assertEqual(solve([line_graph(5), line_graph(6)])[1][1], [[0, 0, 0, 0, 2, 1]])
+
+            shutdown_pools("rebuild")
+            self.assertNotIn("rebuild", vrp_processor._pools)
+        finally:
+            shutdown_pools()
+
+    def test_single_order_inserted_into_remaining_routes(self):
+        graph = line_graph(6)
+        ids = [node.id for node in graph.nodes]
+        vehicles = [Vehicle("vehicle1", ids[0], [Parcel("parcel1", ids[2], 1, ids[0])], capacity=1),
+                    Vehicle("vehicle2", ids[5], [Parcel("parcel2", ids[4], 1, ids[5])], capacity=1)]
+        order = Parcel("order", ids[3], 1, ids[1], "order")
+        plan = Plan(vehicles, [order] + [v.parcels[0] for v in vehicles], [order], graph)
+        processor = VrpProcessor([graph], "test")
+
+        # pickup on the way to node 2, delivery one edge after it
+        self.assertEqual(processor.insert_order(plan), (0, [[0, 1, 2, 3], [5, 4]]))
+
+        # the pickup is a step of the route without changing the loads
+        vehicle = Vehicle("vehicle1", ids[0], [vehicles[0].parcels[0], order], capacity=1)
+        dispatch = processor.map_dropoff(graph, vehicle.parcels)
+        steps = processor.map_parcels_to_route([graph.nodes[i] for i in (0, 1, 2, 3)], dispatch, graph, vehicle,
+                                               {1})
+        self.assertEqual(dispatch, [0, 0, 1, 1, 0, 0])
+        self.assertEqual([(step["location"]["station"], step["load"], step["unload"]) for step in steps],
+                         [(ids[0], ["parcel1"], []), (ids[1], ["order"], []), (ids[2], [], ["parcel1"]),
+                          (ids[3], [], ["order"])])
+
+        # a full vehicle can only pick up after its first drop
+        dist = RoutingVRP.location_distances(graph.cost_matrix(), range(6))
+        self.assertEqual(InsertionVRP.insert(dist, [[0, 2], [5, 4]], 1, 3, 1, [0, 1], [[0, 1], [0, 1]]),
+                         (0, 1, 1, 3.0))
+        self.assertIsNone(InsertionVRP.insert(dist, [[0, 2], [5, 4]], 1, 3, 2, [0, 0], [[0, 1], [0, 1]]))
+
+        processor.insertion_params["max_cost_increase"] = 0.5
+        with self.assertRaises(ValueError):
+            processor.insert_order(plan)
+
+        # an order to a node outside the partition is left to the full solve
+        outside = Parcel("outside", "missing", 1, ids[1], "order")
+        with self.assertRaises(ValueError):
+            processor.insert_order(Plan(vehicles, [outside], [outside], graph))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,169 +1,92 @@
 import numpy as np
+from scipy import sparse
 import ortools.linear_solver.pywraplp as pywraplp
 import time
 
 
+FORMULATION_CLASSIC = "classic"
+FORMULATION_COMPACT = "compact"
+
+# MILP backends shipped with OR-Tools, names as accepted by pywraplp.Solver.CreateSolver
+BACKEND_CBC = "CBC"
+BACKEND_SCIP = "SCIP"
+BACKEND_CP_SAT = "CP_SAT"
+BACKENDS = (BACKEND_CBC, BACKEND_SCIP, BACKEND_CP_SAT)
+
+SOLVER_STATUS = {
+    pywraplp.Solver.OPTIMAL: "OPTIMAL",
+    pywraplp.Solver.FEASIBLE: "FEASIBLE",
+    pywraplp.Solver.INFEASIBLE: "INFEASIBLE",
+    pywraplp.Solver.UNBOUNDED: "UNBOUNDED",
+    pywraplp.Solver.ABNORMAL: "ABNORMAL",
+    pywraplp.Solver.NOT_SOLVED: "NOT_SOLVED"
+}
+
+
+class _Triplets:
+    """Collects constraint rows A x <= b as COO triplets, block by block"""
+
+    def __init__(self):
+        self.rows, self.cols, self.vals, self.b = [], [], [], []
+        self.n_rows = 0
+
+    def add_block(self, block_rows, block_cols, block_vals, block_b):
+        """Append one constraint block, rows are local to the block"""
+        self.rows.append(np.asarray(block_rows, dtype=np.int64) + self.n_rows)
+        self.cols.append(np.asarray(block_cols, dtype=np.int64))
+        self.vals.append(np.broadcast_to(np.asarray(block_vals, dtype=float), np.shape(block_rows)))
+        self.b.append(np.asarray(block_b, dtype=float))
+        self.n_rows += len(block_b)
+
+    def to_csr(self, n_cols):
+        A = sparse.coo_matrix((np.concatenate(self.vals), (np.concatenate(self.rows), np.concatenate(self.cols))),
+                              shape=(self.n_rows, n_cols)).tocsr()
+        A.eliminate_zeros()
+        return A, np.concatenate(self.b)
+
+
 class VRP:
     def __init__(self):
         pass
 
     @staticmethod
-    def vrp(graph_incidence_mat, demand, capacity_vec, start_loc_vec, edges_length):
+    def vrp(graph_incidence_mat, demand, capacity_vec, start_loc_vec, edges_length, stats=None,
+            formulation=FORMULATION_CLASSIC, time_limit=None, mip_gap=None, threads=None, backend=BACKEND_CBC,
+            symmetry_breaking=False, hint=None):
+        """Solve the CVRP over the incidence matrix.
+        Returns edge usage per vehicle (routes), load dropped per vehicle and node (Omatrix) and the objective value.
+        formulation selects the classic model with A_i_j_k slacks or the compact model with edge/node indicators,
+        both have the same feasible routes and loads. backend is the OR-Tools MILP solver (CBC, SCIP or CP_SAT).
+        time_limit (seconds), mip_gap (relative) and threads bound the solver, when a limit is hit the best
+        incumbent is returned. symmetry_breaking orders the loads of identical vehicles (same capacity, start and
+        mandatory locations), so the solver does not branch on their permutations. hint is the load per vehicle and
+        node of the current plan (vehicles keep their parcels), passed to the solver as a partial MIP start. SCIP and
+        CP_SAT complete and use it, CBC ignores it. If a dict is passed as stats it
+        is filled with model size, build/solve timings, solver status and the relative gap of the returned solution."""
         start_time = time.time()
         # Data validity
         if len(start_loc_vec) != len(capacity_vec):
             raise ValueError('Number of vehicles & number of start locations not match!')
         if sum(capacity_vec) < sum(demand):
             raise ValueError('Total vehicles capacity to low!')
-        if len(graph_incidence_mat) != len(demand):
+        if np.shape(graph_incidence_mat)[0] != len(demand):
             raise ValueError('Number of nodes in dispatch and incidence matrix dont match!')
-        if len(edges_length) != len(graph_incidence_mat[0]):
+        if len(edges_length) != np.shape(graph_incidence_mat)[1]:
             raise ValueError('Size of edges_length and n_edges do not match!')
-        E = graph_incidence_mat
+        if formulation not in (FORMULATION_CLASSIC, FORMULATION_COMPACT):
+            raise ValueError('Unknown VRP formulation: {}'.format(formulation))
+        if backend not in BACKENDS:
+            raise ValueError('Unknown VRP solver backend: {}'.format(backend))
+        if hint is not None and np.shape(hint) != (len(capacity_vec), len(demand)):
+            raise ValueError('Size of hint and vehicles x nodes do not match!')
+        E = sparse.coo_matrix(graph_incidence_mat)
 
         # Additional Variables
         n_cycles = np.size(capacity_vec)
-        n_edges = len(E[1])
-        n_nodes = len(E)
+        n_nodes, n_edges = E.shape
 
         offset_c = 0
-        offset_k = n_edges * n_cycles
         offset_o = n_cycles * n_edges + n_cycles * n_nodes
-        # number of columns in matrix A1+A2+A3, variables X, K, O
-        offset_a = 2 * n_nodes * n_cycles + n_edges * n_cycles
-
-        # Full A MATRIX
-        # CONSTRAINT IV - UPDATED - there is od number of n_edges on cycles
-        # the right side of the equation should be zeros(n_edges*n_cycles + n_vert*n_cycles)
-        # b variables = size([capacity_vec])= n_cycles*n_edges + n_cycles*n_nodes
-
-        AddRow = sum(len(mandatory_location_list) for mandatory_location_list in start_loc_vec)
-        rows_A1 = 2 * n_nodes * n_cycles + n_nodes * n_cycles + n_edges * n_cycles + AddRow
-        cols_A1 = n_nodes * n_cycles + n_edges * n_cycles
-
-        A1 = np.zeros((rows_A1, cols_A1))
-        b1 = ([0] * (rows_A1 - AddRow)) + ([-1] * AddRow)
-
-        offset_block0 = 0
-        offset_block1 = n_nodes * n_cycles
-        offset_block2 = 2 * n_nodes * n_cycles
-        offset_block3 = 3 * n_nodes * n_cycles
-        offset_block4 = 3 * n_nodes * n_cycles + n_cycles * n_edges
-
-        for k in range(n_cycles):
-            for i in range(n_nodes):
-                for j in range(n_edges):
-                    # C_kj * E_ij - 2K_ki == 0
-                    A1[offset_block0 + k * n_nodes + i, offset_c + k * n_edges + j] = E[i][j]
-                    A1[offset_block1 + k * n_nodes + i, offset_c + k * n_edges + j] = -E[i][j]
-                    A1[offset_block0 + k * n_nodes + i, offset_k + k * n_nodes + i] = -2
-                    A1[offset_block1 + k * n_nodes + i, offset_k + k * n_nodes + i] = 2
-                    # K_ki >= 0
-                    A1[offset_block2 + k * n_nodes + i, offset_k + k * n_nodes + i] = -1
-
-        for k in range(0, n_cycles):
-            for j in range(0, n_edges):
-                A1[offset_block3 + k * n_edges + j, offset_c + k * n_edges + j] = -1
-
-        insert_line = 0
-        for k in range(n_cycles):
-            mandatory_location_list = start_loc_vec[k]
-            for mandatory_node_id in mandatory_location_list:
-                for j in range(n_edges):
-                    A1[offset_block4 + insert_line, offset_c + k * n_edges + j] = -E[mandatory_node_id][j]
-                insert_line = insert_line + 1
-
-        # CONSTRAINT II - A2 - the number of packets delivered on the node is equal to all total demand on the node
-        # number of rows: 2 * num. of n_nodes
-        # number of columns: num. n_nodes * num. of cycles
-        # variables Oki
-        # B vector = [dispatch_vec, -dispatch_vec]
-        b2 = demand + [-val for val in demand] + ([0] *(n_cycles * n_nodes))
-
-        rows_A2 = 2 * n_nodes + n_nodes * n_cycles
-        cols_A2 = n_nodes * n_cycles
-        A2 = np.zeros((rows_A2, cols_A2))
-        for i in range(0, n_nodes):
-            for k in range(0, n_cycles):
-                A2[i, n_nodes * k + i] = 1
-                A2[i + n_nodes, n_nodes * k + i] = -1
-                A2[i * n_cycles + 2 * n_nodes + k, i * n_cycles + k] = -1
-
-        # CONSTRAINT III A3 matrix: sum of load on each vehicles must not exceed vehicle load capacity
-        # variables Oki
-        rows_A3 = n_cycles
-        cols_A3 = n_cycles * n_nodes
-        b3 = capacity_vec.copy()
-        b23 = b2 + b3
-
-        A3 = np.zeros((rows_A3, cols_A3))
-        for k in range(0, n_cycles):  # for each vehicle
-            for i in range(0, n_nodes):  # take the sum of load on enach node (sum on Ow variables)
-                A3[k, i + k * n_nodes] = 1
-        A23 = np.vstack([A2, A3])
-
-        # CONSTRAINT I - total number of all packets delivered is equal to summ of all dispatch_vec
-        n_vars = 2 * n_nodes * n_cycles + n_edges * n_cycles  # number of columns in matrix A1+A2+A3, variables X, K, O
-        n_slacks = n_cycles * n_edges * n_nodes
-
-        cols_A4 = n_vars + n_slacks
-
-        # constraint 4.1. SUM for ijk -> (Eij * Aijk)
-        A41 = np.zeros((n_nodes * n_cycles, n_vars + n_slacks))
-        for k in range(n_cycles):
-            for i in range(n_nodes):
-                rowN = i * n_cycles + k
-                A41[rowN, offset_o + k * n_nodes + i] = 2
-                for j in range(n_edges):
-                    A41[rowN, offset_a + i * n_edges * n_cycles + j * n_cycles + k] = -E[i][j]
-
-        # Adding constraints 4.2.: Aijk - Cki*di <= 0
-
-        A42 = np.zeros((n_slacks, cols_A4))
-        for i in range(0, n_nodes):
-            for j in range(0, n_edges):
-                for k in range(0, n_cycles):
-                    A42[i * n_edges * n_cycles + j * n_cycles + k, n_edges * k + j] = -demand[i]
-                    A42[i * n_edges * n_cycles + j * n_cycles + k,
-                        2 * n_cycles * n_nodes + n_cycles * n_edges + i * n_edges * n_cycles + j * n_cycles + k] = 1
-
-        # constraint 4.3.: Aijk - Oki <= 0
-        A43 = np.zeros((n_slacks, cols_A4))
-
-        offset = 0
-        offset1 = n_edges * n_cycles + n_nodes * n_cycles
-        offset2 = n_edges * n_cycles + 2 * n_nodes * n_cycles
-        for i in range(0, n_nodes):
-            for j in range(0, n_edges):
-                for k in range(0, n_cycles):
-                    # print (offset+i*n_edges*n_cycles+j*n_cycles+k, offset1 + n_nodes*k+i)
-                    A43[offset + i * n_edges * n_cycles + j * n_cycles + k, offset1 + n_nodes * k + i] = -1
-                    A43[
-                        offset + i * n_edges * n_cycles + j * n_cycles + k,
-                        offset2 + i * n_edges * n_cycles + j * n_cycles + k] = 1
-
-        A4 = np.vstack([A41.copy(), A42[0:n_slacks, :]])
-        A4 = np.vstack([A4, A43])
-
-        b4 = [0] * ((n_nodes * n_cycles) + (2 * n_cycles * n_nodes * n_edges))
-
-        # FINAL MATRIX  - A with all constraints
-        # concatenate A1 and A23 = A matrix
-        A1extend = np.c_[A1, np.zeros((len(A1), len(A23[0])))]
-        A23extend = np.c_[np.zeros((len(A23), len(A1[0]))), A23]
-
-
-
-        A123 = np.vstack([A1extend.copy(), A23extend[0:len(A23)]])
-
-        # Final concate A123 & A4
-        A123extend = np.c_[A123, np.zeros((len(A123), n_nodes * n_edges * n_cycles))]
-        timea = time.time()
-        A = np.vstack([A123extend.copy(), A4])
-        endtime = time.time() - timea
-        print("Vstack took: {} for {}".format(endtime, A.shape))
-
-        b = b1 + b23 + b4
 
         # CREATE VARIABLES  X - vector with c11-cnn variables
 
@@ -174,62 +97,55 @@ class VRP:
         # \"Ow\" variables
         Ow = ['O_' + str(k) + '_' + str(i) for k in range(n_cycles) for i in range(n_nodes)]
 
-        # \"Aijk\" variables
-        Aijk = []
-        for i in range(n_nodes):
-            for j in range(n_edges):  # numer of vehicles
-                for k in range(n_cycles):
-                    Aijk.append('A_' + str(i) + '_' + str(j) + '_' + str(k))
+        if formulation == FORMULATION_COMPACT:
+            A, b = VRP._build_compact_constraints(E, demand, capacity_vec, start_loc_vec, symmetry_breaking)
+            # \"U\" edge used and \"Y\" node served indicators
+            U = ['U_' + str(k) + '_' + str(j) for k in range(n_cycles) for j in range(n_edges)]
+            Y = ['Y_' + str(k) + '_' + str(i) for k in range(n_cycles) for i in range(n_nodes)]
+            var_names = C + K + Ow + U + Y
+            # C, K, U and Y variables are integer, U and Y binary, O continuous
+            integer = np.ones(len(var_names), dtype=bool)
+            integer[offset_o:offset_o + len(Ow)] = False
+            upper = np.full(len(var_names), np.inf)
+            upper[offset_o + len(Ow):] = 1
+        else:
+            A, b = VRP._build_constraints(E, demand, capacity_vec, start_loc_vec, symmetry_breaking)
+            # \"Aijk\" variables
+            Aijk = ['A_' + str(i) + '_' + str(j) + '_' + str(k)
+                    for i in range(n_nodes) for j in range(n_edges) for k in range(n_cycles)]
+            var_names = C + K + Ow + Aijk
+            # C and K variables are integer, the rest continuous
+            integer = np.zeros(len(var_names), dtype=bool)
+            integer[:len(C) + len(K)] = True
+            upper = np.full(len(var_names), np.inf)
+
+        # objective: cost of every used edge, for every vehicle
+        costs = np.zeros(len(var_names))
+        costs[offset_c:offset_c + n_cycles * n_edges] = np.tile(np.asarray(edges_length, dtype=float), n_cycles)
 
         # Declaring the solver
-        solver = pywraplp.Solver('SolveIntegerProblem',
-                                 pywraplp.Solver.CBC_MIXED_INTEGER_PROGRAMMING)
-        x_min = 0.0  # lower variables border
-        x_max = solver.infinity()  # Upper variables border
-
-        variables = []
-        for varN, xi_name in enumerate(C):  # declaring objective variables [C1.... Cn]
-            variables.append(solver.IntVar(x_min, x_max, xi_name))
-        for varN, xi_name in enumerate(K):  # declaring slack variables
-            variables.append(solver.IntVar(x_min, x_max, xi_name))
-        for varN, xi_name in enumerate(Ow):  # declaring load dispatch variables
-            variables.append(solver.NumVar(x_min, x_max, xi_name))
-        for varN, xi_name in enumerate(Aijk):  # declaring load dispatch variables
-            variables.append(solver.NumVar(x_min, x_max, xi_name))
-
-        # DECLARE CONSTRAINTS
-        for rowN, row in enumerate(A):
-            left_side = None
-            for colN, coeff in enumerate(row):
-                if coeff == 0:
-                    continue
-                elif left_side is None:
-                    left_side = coeff * variables[colN]
-                else:
-                    left_side += coeff * variables[colN]
-            if left_side is None and b[rowN] < 0:
-                # if left_side is None and b[0,rowN] < 0:
-                raise ValueError('Constraint ' + str(rowN) + ' cannot be satisfied!')
-            if left_side is not None:
-                # solver.Add(left_side <= t[0,rowN])
-                solver.Add(left_side <= b[rowN])
-
-        # DECLARE OBJECTIVE FUNCTION & INVOKE THE SOLVER
-        cost = 0
-        coeffs = edges_length
-        for k in range(n_cycles):
-            for coeffN in range(n_edges):
-                cost += variables[offset_c + k * n_edges + coeffN] * coeffs[offset_c + coeffN]
+        solver = pywraplp.Solver.CreateSolver(backend)
+        if solver is None:
+            raise ValueError('VRP solver backend {} is not available in this OR-Tools build'.format(backend))
+        variables = VRP._declare_model(solver, A, b, var_names, integer, upper, costs)
+        if hint is not None:
+            solver.SetHint(variables[offset_o:offset_o + n_cycles * n_nodes],
+                           np.asarray(hint, dtype=float).ravel().tolist())
+        build_time = time.time() - start_time
+        print("Model build took: {} for {} variables, {} constraints".format(build_time, len(variables),
+                                                                             solver.NumConstraints()))
 
         solvetime = time.time()
-        # run the optimization and check if we got an optimal solution
-        solver.Minimize(cost)
-        result_status = solver.Solve()
-        assert result_status == pywraplp.Solver.OPTIMAL
+        # run the optimization, a feasible incumbent is accepted when a limit stops the search
+        result_status = solver.Solve(VRP._solver_parameters(solver, time_limit, mip_gap, threads))
         endsolve = time.time() - solvetime
-        print("Solver took: {}".format(endsolve))
+        status = SOLVER_STATUS.get(result_status, str(result_status))
+        if result_status not in (pywraplp.Solver.OPTIMAL, pywraplp.Solver.FEASIBLE):
+            raise ValueError('VRP solver found no feasible solution, status: {}'.format(status))
 
         obj_val = solver.Objective().Value()
+        gap = VRP._relative_gap(obj_val, solver.Objective().BestBound())
+        print("Solver took: {}, status: {}, gap: {}".format(endsolve, status, gap))
 
         routes = []
         Omatrix = []
@@ -239,7 +155,7 @@ class VRP:
             C_row = []
             for j in range(n_edges):
                 idx1 = offset_c + n_edges * k + j
-                val1 = int(variables[idx1].solution_value())
+                val1 = int(round(variables[idx1].solution_value()))
                 C_row.append(val1)
             routes.append(C_row)
 
@@ -249,6 +165,268 @@ class VRP:
                 O_row.append(variables[offset_o + n_nodes * k + i].solution_value())
             Omatrix.append(O_row)
 
+        if stats is not None:
+            stats.update({
+                "n_variables": solver.NumVariables(),
+                "n_constraints": solver.NumConstraints(),
+                "n_nonzeros": A.nnz,
+                "build_time": build_time,
+                "solve_time": endsolve,
+                "status": status,
+                "gap": gap,
+                "backend": backend
+            })
+
         # return function - results
         print("VRP total execution took: {}".format(time.time() - start_time))
         return routes, Omatrix, obj_val
+
+    @staticmethod
+    def _solver_parameters(solver, time_limit, mip_gap, threads):
+        """Apply wall-clock limit and thread count on the solver, return MPSolverParameters with the MIP gap"""
+        if time_limit is not None:
+            solver.SetTimeLimit(int(time_limit * 1000))
+        if threads is not None:
+            solver.SetNumThreads(int(threads))
+        parameters = pywraplp.MPSolverParameters()
+        if mip_gap is not None:
+            parameters.SetDoubleParam(pywraplp.MPSolverParameters.RELATIVE_MIP_GAP, float(mip_gap))
+        return parameters
+
+    @staticmethod
+    def _relative_gap(obj_val, best_bound):
+        """Relative gap between the incumbent and the best bound, 0 for a proven optimum"""
+        if abs(obj_val - best_bound) < 1e-9:
+            return 0.0
+        return abs(obj_val - best_bound) / max(abs(obj_val), 1e-9)
+
+    @staticmethod
+    def _declare_model(solver, A, b, var_names, integer, upper, costs):
+        """Declare variables, constraints A x <= b and the minimization objective on the solver.
+        integer and upper are per variable masks/bounds, all variables are non negative. Only the nonzeros of A
+        are visited, one RowConstraint per row with SetCoefficient, no intermediate LinearExpr objects are built."""
+        x_min = 0.0  # lower variables border
+        x_max = solver.infinity()  # Upper variables border
+
+        variables = []
+        for name, is_integer, ub in zip(var_names, integer.tolist(), upper.tolist()):
+            ub = x_max if ub == np.inf else ub
+            if is_integer:
+                variables.append(solver.IntVar(x_min, ub, name))
+            else:
+                variables.append(solver.NumVar(x_min, ub, name))
+
+        # DECLARE CONSTRAINTS
+        A = sparse.csr_matrix(A)
+        indptr, indices, data = A.indptr, A.indices.tolist(), A.data.tolist()
+        row_nnz = np.diff(indptr)
+        empty_infeasible = np.flatnonzero((row_nnz == 0) & (np.asarray(b) < 0))
+        if len(empty_infeasible) > 0:
+            raise ValueError('Constraint ' + str(empty_infeasible[0]) + ' cannot be satisfied!')
+
+        lower = -solver.infinity()
+        for rowN in np.flatnonzero(row_nnz).tolist():
+            constraint = solver.RowConstraint(lower, float(b[rowN]), '')
+            for idx in range(indptr[rowN], indptr[rowN + 1]):
+                constraint.SetCoefficient(variables[indices[idx]], data[idx])
+
+        # DECLARE OBJECTIVE FUNCTION
+        objective = solver.Objective()
+        for colN in np.flatnonzero(costs).tolist():
+            objective.SetCoefficient(variables[colN], float(costs[colN]))
+        objective.SetMinimization()
+        return variables
+
+    @staticmethod
+    def _add_routing_blocks(triplets, E, demand, capacity_vec, start_loc_vec):
+        """Constraint blocks shared by both formulations, on variables [C_k_j, K_k_i, O_k_i]:
+        even edge count on cycles (A1), mandatory locations, demand (A2) and capacity (A3)."""
+        n_cycles = np.size(capacity_vec)
+        n_nodes, n_edges = E.shape
+
+        offset_c = 0
+        offset_k = n_edges * n_cycles
+        offset_o = n_cycles * n_edges + n_cycles * n_nodes
+
+        # nonzeros of the incidence matrix, repeated for every cycle k
+        e_i, e_j, e_v = E.row.astype(np.int64), E.col.astype(np.int64), E.data.astype(float)
+        nnz = len(e_v)
+        k_nnz = np.repeat(np.arange(n_cycles), nnz)
+        i_nnz = np.tile(e_i, n_cycles)
+        j_nnz = np.tile(e_j, n_cycles)
+        v_nnz = np.tile(e_v, n_cycles)
+        k_nodes = np.repeat(np.arange(n_cycles), n_nodes)
+        i_nodes = np.tile(np.arange(n_nodes), n_cycles)
+        ki = k_nodes * n_nodes + i_nodes
+
+        # CONSTRAINT IV - there is even number of edges on cycles for each node
+        # C_kj * E_ij - 2K_ki == 0, split into two <= rows
+        triplets.add_block(np.concatenate([k_nnz * n_nodes + i_nnz, ki]),
+                           np.concatenate([offset_c + k_nnz * n_edges + j_nnz, offset_k + ki]),
+                           np.concatenate([v_nnz, np.full(n_nodes * n_cycles, -2.0)]),
+                           np.zeros(n_nodes * n_cycles))
+        triplets.add_block(np.concatenate([k_nnz * n_nodes + i_nnz, ki]),
+                           np.concatenate([offset_c + k_nnz * n_edges + j_nnz, offset_k + ki]),
+                           np.concatenate([-v_nnz, np.full(n_nodes * n_cycles, 2.0)]),
+                           np.zeros(n_nodes * n_cycles))
+        # K_ki >= 0
+        triplets.add_block(ki, offset_k + ki, -1.0, np.zeros(n_nodes * n_cycles))
+        # C_kj >= 0
+        kj = np.arange(n_cycles * n_edges)
+        triplets.add_block(kj, offset_c + kj, -1.0, np.zeros(n_cycles * n_edges))
+
+        # vehicle k has to visit every mandatory location (start node, parcel targets)
+        E_csr = E.tocsr()
+        mandatory = [(k, node_id) for k in range(n_cycles) for node_id in start_loc_vec[k]]
+        m_rows, m_cols, m_vals = [], [], []
+        for line, (k, node_id) in enumerate(mandatory):
+            row_start, row_end = E_csr.indptr[node_id], E_csr.indptr[node_id + 1]
+            m_rows.append(np.full(row_end - row_start, line))
+            m_cols.append(offset_c + k * n_edges + E_csr.indices[row_start:row_end])
+            m_vals.append(-E_csr.data[row_start:row_end])
+        if mandatory:
+            triplets.add_block(np.concatenate(m_rows), np.concatenate(m_cols), np.concatenate(m_vals),
+                               np.full(len(mandatory), -1.0))
+
+        # CONSTRAINT II - A2 - the number of packets delivered on the node is equal to all total demand on the node
+        # B vector = [dispatch_vec, -dispatch_vec]
+        triplets.add_block(i_nodes, offset_o + ki, 1.0, demand)
+        triplets.add_block(i_nodes, offset_o + ki, -1.0, -demand)
+        # O_ki >= 0
+        triplets.add_block(ki, offset_o + ki, -1.0, np.zeros(n_nodes * n_cycles))
+
+        # CONSTRAINT III A3 matrix: sum of load on each vehicles must not exceed vehicle load capacity
+        triplets.add_block(k_nodes, offset_o + ki, 1.0, capacity_vec)
+
+    @staticmethod
+    def vehicle_classes(capacity_vec, start_loc_vec):
+        """Groups of interchangeable vehicles: same capacity, start node and set of mandatory locations"""
+        classes = {}
+        for k, (capacity, locations) in enumerate(zip(capacity_vec, start_loc_vec)):
+            key = (float(capacity), locations[0] if len(locations) > 0 else None, frozenset(locations[1:]))
+            classes.setdefault(key, []).append(k)
+        return list(classes.values())
+
+    @staticmethod
+    def _add_symmetry_breaking(triplets, n_nodes, n_edges, capacity_vec, start_loc_vec):
+        """Identical vehicles carry non increasing loads: SUM for i -> O_(k+1)i - SUM for i -> O_ki <= 0"""
+        n_cycles = np.size(capacity_vec)
+        offset_o = n_cycles * n_edges + n_cycles * n_nodes
+        pairs = [(k, k_next) for vehicles in VRP.vehicle_classes(capacity_vec, start_loc_vec)
+                 for k, k_next in zip(vehicles[:-1], vehicles[1:])]
+        if not pairs:
+            return
+        rows = np.repeat(np.arange(len(pairs)), 2 * n_nodes)
+        cols = np.concatenate([np.concatenate([offset_o + k_next * n_nodes + np.arange(n_nodes),
+                                               offset_o + k * n_nodes + np.arange(n_nodes)]) for k, k_next in pairs])
+        vals = np.tile(np.concatenate([np.ones(n_nodes), -np.ones(n_nodes)]), len(pairs))
+        triplets.add_block(rows, cols, vals, np.zeros(len(pairs)))
+
+    @staticmethod
+    def _build_constraints(E, demand, capacity_vec, start_loc_vec, symmetry_breaking=False):
+        """Assemble the constraint matrix A (CSR) and right side b of A x <= b straight from COO triplets.
+        Variables are ordered [C_k_j, K_k_i, O_k_i, A_i_j_k], rows follow the blocks A1, A2, A3, A41, A42, A43."""
+        start_time = time.time()
+        E = sparse.coo_matrix(E)
+        n_cycles = np.size(capacity_vec)
+        n_nodes, n_edges = E.shape
+        demand = np.asarray(demand, dtype=float)
+
+        offset_c = 0
+        offset_o = n_cycles * n_edges + n_cycles * n_nodes
+        # number of columns in matrix A1+A2+A3, variables X, K, O
+        offset_a = 2 * n_nodes * n_cycles + n_edges * n_cycles
+        n_vars = offset_a
+        n_slacks = n_cycles * n_edges * n_nodes
+
+        triplets = _Triplets()
+        VRP._add_routing_blocks(triplets, E, demand, capacity_vec, start_loc_vec)
+        if symmetry_breaking:
+            VRP._add_symmetry_breaking(triplets, n_nodes, n_edges, capacity_vec, start_loc_vec)
+
+        # CONSTRAINT I - total number of all packets delivered is equal to summ of all dispatch_vec
+        # constraint 4.1. 2 * O_ki - SUM for j -> (Eij * Aijk) <= 0
+        e_i, e_j, e_v = E.row.astype(np.int64), E.col.astype(np.int64), E.data.astype(float)
+        k_nnz = np.repeat(np.arange(n_cycles), len(e_v))
+        i_nnz = np.tile(e_i, n_cycles)
+        j_nnz = np.tile(e_j, n_cycles)
+        k_nodes = np.repeat(np.arange(n_cycles), n_nodes)
+        i_nodes = np.tile(np.arange(n_nodes), n_cycles)
+        ijk_nnz = i_nnz * n_edges * n_cycles + j_nnz * n_cycles + k_nnz
+        triplets.add_block(np.concatenate([i_nodes * n_cycles + k_nodes, i_nnz * n_cycles + k_nnz]),
+                           np.concatenate([offset_o + k_nodes * n_nodes + i_nodes, offset_a + ijk_nnz]),
+                           np.concatenate([np.full(n_nodes * n_cycles, 2.0), -np.tile(e_v, n_cycles)]),
+                           np.zeros(n_nodes * n_cycles))
+
+        # slack index s = i * n_edges * n_cycles + j * n_cycles + k
+        slack = np.arange(n_slacks)
+        s_i = slack // (n_edges * n_cycles)
+        s_j = (slack // n_cycles) % n_edges
+        s_k = slack % n_cycles
+        # constraint 4.2.: Aijk - Ckj*di <= 0
+        triplets.add_block(np.concatenate([slack, slack]),
+                           np.concatenate([offset_c + s_k * n_edges + s_j, offset_a + slack]),
+                           np.concatenate([-demand[s_i], np.ones(n_slacks)]),
+                           np.zeros(n_slacks))
+        # constraint 4.3.: Aijk - Oki <= 0
+        triplets.add_block(np.concatenate([slack, slack]),
+                           np.concatenate([offset_o + s_k * n_nodes + s_i, offset_a + slack]),
+                           np.concatenate([-np.ones(n_slacks), np.ones(n_slacks)]),
+                           np.zeros(n_slacks))
+
+        A, b = triplets.to_csr(n_vars + n_slacks)
+        print("Constraint assembly took: {} for {} with {} nonzeros".format(time.time() - start_time, A.shape, A.nnz))
+        return A, b
+
+    @staticmethod
+    def _build_compact_constraints(E, demand, capacity_vec, start_loc_vec, symmetry_breaking=False):
+        """Compact formulation without the n_nodes*n_edges*n_cycles A_i_j_k slacks.
+        Variables are ordered [C_k_j, K_k_i, O_k_i, U_k_j, Y_k_i], U_k_j marks an edge used by vehicle k and
+        Y_k_i a node served by vehicle k. Constraint 4 becomes
+            O_ki <= d_i * Y_ki,  2 * Y_ki <= SUM for j -> (Eij * Ukj),  U_kj <= C_kj
+        which, for binary U and Y, allows exactly the (C, K, O) of the classic model: a vehicle can only drop load
+        on a node where it uses at least two different edges."""
+        start_time = time.time()
+        E = sparse.coo_matrix(E)
+        n_cycles = np.size(capacity_vec)
+        n_nodes, n_edges = E.shape
+        demand = np.asarray(demand, dtype=float)
+
+        offset_c = 0
+        offset_o = n_cycles * n_edges + n_cycles * n_nodes
+        offset_u = 2 * n_nodes * n_cycles + n_edges * n_cycles
+        offset_y = offset_u + n_edges * n_cycles
+        n_vars = offset_y + n_nodes * n_cycles
+
+        triplets = _Triplets()
+        VRP._add_routing_blocks(triplets, E, demand, capacity_vec, start_loc_vec)
+        if symmetry_breaking:
+            VRP._add_symmetry_breaking(triplets, n_nodes, n_edges, capacity_vec, start_loc_vec)
+
+        k_nodes = np.repeat(np.arange(n_cycles), n_nodes)
+        i_nodes = np.tile(np.arange(n_nodes), n_cycles)
+        ki = k_nodes * n_nodes + i_nodes
+        # constraint 4.1.: O_ki - d_i * Y_ki <= 0
+        triplets.add_block(np.concatenate([ki, ki]),
+                           np.concatenate([offset_o + ki, offset_y + ki]),
+                           np.concatenate([np.ones(n_nodes * n_cycles), -demand[i_nodes]]),
+                           np.zeros(n_nodes * n_cycles))
+        # constraint 4.2.: 2 * Y_ki - SUM for j -> (Eij * Ukj) <= 0
+        e_i, e_j, e_v = E.row.astype(np.int64), E.col.astype(np.int64), E.data.astype(float)
+        k_nnz = np.repeat(np.arange(n_cycles), len(e_v))
+        i_nnz = np.tile(e_i, n_cycles)
+        j_nnz = np.tile(e_j, n_cycles)
+        triplets.add_block(np.concatenate([ki, k_nnz * n_nodes + i_nnz]),
+                           np.concatenate([offset_y + ki, offset_u + k_nnz * n_edges + j_nnz]),
+                           np.concatenate([np.full(n_nodes * n_cycles, 2.0), -np.tile(e_v, n_cycles)]),
+                           np.zeros(n_nodes * n_cycles))
+        # constraint 4.3.: U_kj - C_kj <= 0
+        kj = np.arange(n_cycles * n_edges)
+        triplets.add_block(np.concatenate([kj, kj]),
+                           np.concatenate([offset_u + kj, offset_c + kj]),
+                           np.concatenate([np.ones(n_cycles * n_edges), -np.ones(n_cycles * n_edges)]),
+                           np.zeros(n_cycles * n_edges))
+
+        A, b = triplets.to_csr(n_vars)
+        print("Constraint assembly took: {} for {} with {} nonzeros".format(time.time() - start_time, A.shape, A.nnz))
+        return A, b
@@ -0,0 +1,195 @@
+import math
+import time
+
+import numpy as np
+from ortools.constraint_solver import pywrapcp, routing_enums_pb2
+from scipy import sparse
+from scipy.sparse import csgraph
+
+from .routing import COST_SCALE
+
+
+class VRPTW:
+    """
+    Vehicle routing with time windows, replaces the MATLAB vrptw_solve of the VRPTW service.
+    Same input as vrptw_solve: the graph is given by its incidence matrix (-1 where an edge starts, 1 where it ends),
+    edge costs per vehicle, edge travel times, vehicle start and end nodes, demand per node, vehicle capacities and
+    opening and closing times of the nodes. Vehicles start at time 0 and can wait for a node to open, every node with
+    demand is served by one vehicle.
+    The OR-Tools routing model works on the shortest paths between the start, end and demand nodes, the routes are
+    expanded back to edge counts per vehicle.
+    """
+
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def vrptw(incidence_mat, cost_mat, edge_time_vec, start_vec, end_vec, distr_vec, capacity_vec, t_start_vec,
+              t_end_vec, time_limit=None, guided=False, stats=None):
+        """Solve the VRPTW, start_vec and end_vec hold 0-based node indexes.
+        Returns the number of times each vehicle drives each edge (vehicles x edges) and the total cost."""
+        start_time = time.time()
+        E = sparse.coo_matrix(incidence_mat)
+        cost_mat = np.atleast_2d(np.asarray(cost_mat, dtype=float))
+        edge_time_vec = np.asarray(edge_time_vec, dtype=float)
+        n_nodes, n_edges = E.shape
+        n_cycles = len(capacity_vec)
+
+        # Data validity
+        if len(start_vec) != n_cycles or len(end_vec) != n_cycles or cost_mat.shape[0] != n_cycles:
+            raise ValueError('Number of vehicles in capacities, start, end locations and costs not match!')
+        if cost_mat.shape[1] != n_edges or len(edge_time_vec) != n_edges:
+            raise ValueError('Number of edges in incidence matrix, costs and times not match!')
+        if not len(distr_vec) == len(t_start_vec) == len(t_end_vec) == n_nodes:
+            raise ValueError('Number of nodes in incidence matrix, distribution and time windows not match!')
+        if sum(capacity_vec) < sum(distr_vec):
+            raise ValueError('Total vehicles capacity to low!')
+
+        edge_start = np.zeros(n_edges, dtype=np.int64)
+        edge_end = np.zeros(n_edges, dtype=np.int64)
+        edge_start[E.col[E.data < 0]] = E.row[E.data < 0]
+        edge_end[E.col[E.data > 0]] = E.row[E.data > 0]
+
+        # location 0..n_cycles-1 are vehicle starts, n_cycles..2*n_cycles-1 vehicle ends, the rest nodes with demand
+        visit_nodes = [node for node, demand in enumerate(distr_vec) if demand > 0]
+        location_nodes = [int(node) for node in start_vec] + [int(node) for node in end_vec] + visit_nodes
+        location_demand = [0] * (2 * n_cycles) + [int(math.ceil(distr_vec[node])) for node in visit_nodes]
+        horizon = int(math.ceil(max(t_end_vec) * COST_SCALE))
+
+        # vehicles have their own edge costs, every vehicle gets its own shortest paths
+        paths = [VRPTW._shortest_paths(edge_start, edge_end, costs, edge_time_vec, n_nodes, location_nodes)
+                 for costs in cost_mat]
+
+        manager = pywrapcp.RoutingIndexManager(len(location_nodes), n_cycles, list(range(n_cycles)),
+                                               list(range(n_cycles, 2 * n_cycles)))
+        routing = pywrapcp.RoutingModel(manager)
+
+        transit_indexes = []
+        for k, (dist, travel, _, _) in enumerate(paths):
+            arc_cost = np.rint(dist * COST_SCALE).astype(np.int64).tolist()
+            arc_time = np.rint(travel * COST_SCALE).astype(np.int64).tolist()
+
+            def cost(from_index, to_index, arc_cost=arc_cost):
+                return arc_cost[manager.IndexToNode(from_index)][manager.IndexToNode(to_index)]
+
+            def transit(from_index, to_index, arc_time=arc_time):
+                return arc_time[manager.IndexToNode(from_index)][manager.IndexToNode(to_index)]
+
+            routing.SetArcCostEvaluatorOfVehicle(routing.RegisterTransitCallback(cost), k)
+            transit_indexes.append(routing.RegisterTransitCallback(transit))
+
+        def load(from_index):
+            return location_demand[manager.IndexToNode(from_index)]
+
+        demand_index = routing.RegisterUnaryTransitCallback(load)
+        routing.AddDimensionWithVehicleCapacity(demand_index, 0, [max(int(c), 0) for c in capacity_vec], True,
+                                                'Capacity')
+        # waiting is allowed, vehicles leave their start at time 0
+        routing.AddDimensionWithVehicleTransits(transit_indexes, horizon, horizon, True, 'Time')
+        time_dimension = routing.GetDimensionOrDie('Time')
+        for location, node in enumerate(location_nodes[2 * n_cycles:], 2 * n_cycles):
+            time_dimension.CumulVar(manager.NodeToIndex(location)).SetRange(
+                int(math.floor(t_start_vec[node] * COST_SCALE)), int(math.ceil(t_end_vec[node] * COST_SCALE)))
+        for k, node in enumerate(end_vec):
+            time_dimension.CumulVar(routing.End(k)).SetRange(
+                int(math.floor(t_start_vec[node] * COST_SCALE)), int(math.ceil(t_end_vec[node] * COST_SCALE)))
+
+        search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+        search_parameters.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
+        if guided:
+            search_parameters.local_search_metaheuristic = \
+                routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
+        else:
+            search_parameters.local_search_metaheuristic = \
+                routing_enums_pb2.LocalSearchMetaheuristic.GREEDY_DESCENT
+        search_parameters.time_limit.FromMilliseconds(int((time_limit if time_limit is not None else 5) * 1000))
+        build_time = time.time() - start_time
+
+        solvetime = time.time()
+        assignment = routing.SolveWithParameters(search_parameters)
+        endsolve = time.time() - solvetime
+        status = routing_enums_pb2.RoutingSearchStatus.Value.Name(routing.status())
+        if assignment is None:
+            raise ValueError('VRPTW solver found no feasible solution, status: {}'.format(status))
+        print("VRPTW solver took: {}, status: {}".format(endsolve, status))
+
+        # expand the routes to the edges of the graph
+        routes = np.zeros((n_cycles, n_edges))
+        position = {node: pos for pos, node in enumerate(sorted(set(location_nodes)))}
+        for k in range(n_cycles):
+            _, _, predecessors, edge_idx = paths[k]
+            index = routing.Start(k)
+            while not routing.IsEnd(index):
+                next_index = assignment.Value(routing.NextVar(index))
+                a = location_nodes[manager.IndexToNode(index)]
+                b = location_nodes[manager.IndexToNode(next_index)]
+                node = b
+                while node != a:
+                    previous = predecessors[position[a], node]
+                    if previous < 0:
+                        raise ValueError('Vehicle {} has no path from node {} to node {}'.format(k, a, b))
+                    routes[k, edge_idx[(previous, node)]] += 1
+                    node = previous
+                index = next_index
+        obj_val = float(np.sum(routes * cost_mat))
+
+        if stats is not None:
+            stats.update({
+                "n_visits": len(visit_nodes),
+                "build_time": build_time,
+                "solve_time": endsolve,
+                "status": status
+            })
+
+        print("VRPTW total execution took: {}".format(time.time() - start_time))
+        return routes.tolist(), obj_val
+
+    @staticmethod
+    def _shortest_paths(edge_start, edge_end, costs, edge_time_vec, n_nodes, location_nodes):
+        """Shortest path costs and travel times along them between the locations, predecessors from every location
+        node and the cheapest edge for every connected pair of nodes. Unreachable pairs get a large finite penalty."""
+        edge_idx = {}
+        for j, key in enumerate(zip(edge_start.tolist(), edge_end.tolist())):
+            if key not in edge_idx or costs[j] < costs[edge_idx[key]]:
+                edge_idx[key] = j
+        rows, cols = zip(*edge_idx) if edge_idx else ((), ())
+        cheapest = list(edge_idx.values())
+        cost_matrix = sparse.csr_matrix((costs[cheapest], (rows, cols)), shape=(n_nodes, n_nodes))
+
+        relevant = sorted(set(location_nodes))
+        dist, predecessors = csgraph.dijkstra(cost_matrix, directed=True, indices=relevant, return_predecessors=True)
+        # travel time along the cheapest path: walk the nodes in order of distance, the predecessor is done first
+        travel = np.zeros_like(dist)
+        for pos in range(len(relevant)):
+            for node in np.argsort(dist[pos]):
+                previous = predecessors[pos, node]
+                if previous >= 0:
+                    travel[pos, node] = travel[pos, previous] + edge_time_vec[edge_idx[(previous, node)]]
+
+        location_pos = [relevant.index(node) for node in location_nodes]
+        dist = dist[np.ix_(location_pos, location_nodes)]
+        travel = travel[np.ix_(location_pos, location_nodes)]
+        unreachable = ~np.isfinite(dist)
+        dist[unreachable] = (dist[~unreachable].sum() + 1) * 10
+        travel[unreachable] = (travel[~unreachable].sum() + 1) * 10
+        return dist, travel, predecessors, edge_idx
+
+    @staticmethod
+    def solve_request(req_json, time_limit=None):
+        """Solve a request of the VRPTW service, node indexes in startV and endV are 1-based as in the MATLAB service"""
+        routes, cost = VRPTW.vrptw(
+            req_json['incidenceMat'],
+            req_json['costMat'],
+            req_json['edgeTimeV'],
+            [node - 1 for node in req_json['startV']],
+            [node - 1 for node in req_json['endV']],
+            req_json['nodeDistributionV'],
+            req_json['vehicleCapacityV'],
+            req_json['nodeOpenV'],
+            req_json['nodeCloseV'],
+            time_limit=time_limit
+        )
+        return {
+            'routes': routes,
+            'cost': cost
+        }
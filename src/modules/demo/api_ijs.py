@@ -1,8 +1,8 @@
 import time
 import requests
 from datetime import datetime
-from math import inf
 import uuid
+import numpy as np
 from flask import Flask, request
 from flask_jsonpify import jsonify
 from flask_restful import Resource, Api
@@ -143,16 +143,13 @@ class VrpProcessor:
 
         return self.make_route(routes, dispatch, nodes, edges, non_broken_vehicles)
 
-    def find_closest_post(self, loads, start, nodes):
-        min_dist = inf
-        min_idx = -1
-        for post_idx, load in enumerate(loads):
-            if load > 0:
-                cur_dist = self.graphProcessor.g.distance(start, nodes[post_idx])
-                if cur_dist < min_dist:
-                    min_dist = cur_dist
-                    min_idx = post_idx
-        return min_idx
+    def find_closest_post(self, loads, start):
+        """Index of the node with load closest to start by road, -1 when no node has load"""
+        candidates = np.flatnonzero(np.asarray(loads) > 0)
+        if len(candidates) == 0:
+            return -1
+        dist = self.graphProcessor.g.road_distances(start)
+        return int(candidates[np.argmin(dist[candidates])])
 
     def make_route(self, graph_routes, loads, nodes, edges, vehicles):
         print("Building route from VRP output...")
@@ -174,8 +171,7 @@ class VrpProcessor:
             # start at closest node
             # get route and clear up any packages on this route
             while sum(vehicle_load) > 1:  # run until all parcels have been delivered
-                post_idx = self.find_closest_post(vehicle_load, current_node,
-                                                  nodes)  # idx of closest post with parcel demand
+                post_idx = self.find_closest_post(vehicle_load, current_node)  # idx of closest post with parcel demand
                 target = nodes[post_idx]  # convert idx to node object
                 vehicle_load[post_idx] -= vehicle_load[post_idx]  # take/drop all parcels
                 partial_path = self.graphProcessor.g.get_path(current_node,
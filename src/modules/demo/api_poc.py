@@ -11,7 +11,7 @@ from .ErrorHandling import ErrorHandling
 from ..create_graph.config.config_parser import ConfigParser
 from ..create_graph.create_graph import JsonGraphCreator
 from ..create_graph.methods import methods
-from ..cvrp.processor.vrp_processor import VrpProcessor
+from ..cvrp.processor.vrp_processor import VrpProcessor, shutdown_pools
 from ..partitioning.graph_partitioning_preprocess import GraphPreprocessing
 from ..utils.clo_update_handler import CloUpdateHandler
 from ..utils.input_output import InputOutputTransformer
@@ -62,6 +62,11 @@ def process_new_CLOs_request(data, use_case_graph):
         pickle_path = config_parser.get_pickle_path(use_case_graph)
         if os.path.exists(pickle_path):
             os.remove(pickle_path)
+        paths_path = GraphPreprocessing.paths_path(pickle_path)
+        if os.path.exists(paths_path):
+            os.remove(paths_path)
+        # pool workers hold the old graphs
+        shutdown_pools(use_case_graph)
 
         # Remove pickle file
         if use_case_graph == "SLO-CRO_crossborder":
@@ -344,6 +349,12 @@ def handle_recommendation_request():
         #return generic_message_received_response
         return generic_message_received_response
 
+@app.route("/api/vrp/cacheStats", methods=['GET'])
+def vrp_cache_stats():
+    """Hits, misses and size of the VRP solution cache"""
+    return jsonify(VrpProcessor.cache_stats())
+
+
 @app.route("/api/clo/newCLOs", methods=['POST'])
 def new_clos():
     ##TODO: needs to be updated for different pilots
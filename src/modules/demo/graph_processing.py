@@ -1,11 +1,23 @@
+import hashlib
+import heapq
+import itertools
 import json
-from queue import PriorityQueue
-from math import sin, cos, sqrt, atan2, radians, inf
+from collections import OrderedDict
+from math import inf
 
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+
+from ..create_graph.utils import utils
+from ..utils.spatial_index import SpatialIndex
 from ..utils.structures.node import Node
 from ..utils.structures.edge import Edge
 from ..utils.structures.path import Path
 
+# number of (start, goal) paths kept by GraphProcessor.get_path
+PATH_CACHE_SIZE = 4096
+
 
 @DeprecationWarning
 class GraphLoader:
@@ -44,8 +56,12 @@ class GraphProcessor:
         self.nodes = nodes
         self.edges = edges
         self.edge_map = self._map_edges()
+        self._build_indexes()
         # self.paths = self._calculate_shortest_paths()
-        self.incident_matrix = []
+        # all pairs shortest path matrices, see shortest_paths
+        self.dist = None
+        self.predecessors = None
+        self.incident_matrix = None
         self.make_matrix()
         print('Loaded graph with', len(nodes), 'nodes,', len(self.edges), 'edges')
 
@@ -59,6 +75,60 @@ class GraphProcessor:
             edge_map[e.start].append(e)
         return edge_map
 
+    def _build_indexes(self):
+        """Build id -> node, id -> index and id -> [(neighbour, cost)] lookups, the first node with an id wins"""
+        self.node_map = {}
+        self.node_index = {}
+        for i, n in enumerate(self.nodes):
+            self.node_map.setdefault(n.id, n)
+            self.node_index.setdefault(n.id, i)
+        self.adjacency = {n.id: [] for n in self.nodes}
+        self.edge_cost = {}
+        # the same on node indexes for the path search, forward and reverse
+        self.neighbours = [[] for _ in self.nodes]
+        self.reverse_neighbours = [[] for _ in self.nodes]
+        for e in self.edges:
+            self.edge_cost.setdefault((e.start, e.end), e.cost)
+            start, end = self.node_index.get(e.start), self.node_index.get(e.end)
+            # edges to or from ids that are not nodes are left out
+            if start is not None and end is not None:
+                self.adjacency[e.start].append((self.node_map[e.end], e.cost))
+                self.neighbours[start].append((end, e.cost))
+                self.reverse_neighbours[end].append((start, e.cost))
+        # node coordinates for the vectorized distances
+        self.lats = np.array([n.lat for n in self.nodes], dtype=float)
+        self.lons = np.array([n.lon for n in self.nodes], dtype=float)
+        # KD-tree of the node coordinates, see get_spatial_index
+        self.spatial_index = None
+        # LRU cache of get_path results, depends on the edge costs
+        self.path_cache = OrderedDict()
+        # sparse cost matrix, see cost_matrix
+        self.cost_csr = None
+
+    def set_edge_cost(self, edge_idx, cost):
+        """Change the cost of an edge, indexes and the cost matrix are rebuilt and computed paths are dropped"""
+        self.edges[edge_idx].cost = round(cost, 3)
+        self._build_indexes()
+        self.dist = None
+        self.predecessors = None
+
+    def __getstate__(self):
+        # indexes are rebuilt on load and path matrices are stored next to the pickle,
+        # pickles keep the same content as before
+        state = self.__dict__.copy()
+        for key in ('node_map', 'node_index', 'adjacency', 'edge_cost', 'neighbours', 'reverse_neighbours',
+                    'lats', 'lons', 'spatial_index', 'path_cache', 'cost_csr', 'dist', 'predecessors'):
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._build_indexes()
+        if not sparse.issparse(self.incident_matrix):  # pickled with the dense list of lists matrix
+            self.make_matrix()
+        self.dist = None
+        self.predecessors = None
+
     @staticmethod
     def _backtrack_path(came_from, goal, start):
         """Produces a list of nodes from A* output by backtracking over nodes"""
@@ -78,43 +148,88 @@ class GraphProcessor:
 
     def _get_neighbours(self, node):
         """Find Node's neighbours from end connection of its edges"""
-        nodes = []
-        for e in self.edge_map[node.id]:
-            nodes.append(next((x for x in self.nodes if x.id == e.end), None))
-        return nodes
+        return [neighbour for neighbour, _ in self.adjacency[node.id]]
 
     def get_cost(self, a, b):
         """Get accurate cost of single edge"""
-        for e in self.edge_map[a.id]:
-            if e.start == a.id and e.end == b.id:
-                return e.cost
+        return self.edge_cost.get((a.id, b.id))
 
     def _find_shortest(self, start, goal):
-        """Executes A* path searching.
+        """Executes A* path searching on node indexes, the heap entries are (priority, counter, node) so ties never
+        compare nodes and stale entries of closed nodes are skipped.
         Returns a list of nodes that form optimal path based on start and target nodes"""
-
-        node_queue = PriorityQueue()
-        node_queue.put((0, start), 0)
-
-        came_from = {start: None}
-        cost_so_far = {start: 0}
-
-        while not node_queue.empty():
-            current = node_queue.get()[1]
-
-            if current == goal:  # path finished
+        start_idx = self.index_from_id(start.id)
+        goal_idx = self.index_from_id(goal.id)
+        # straight line distance to the goal from every node, computed once per search
+        heuristic = utils.haversine(goal.lat, goal.lon, self.lats, self.lons)
+        counter = itertools.count()
+        node_queue = [(0, next(counter), start_idx)]
+
+        came_from = {start_idx: None}
+        cost_so_far = {start_idx: 0}
+        closed = set()
+
+        while node_queue:
+            current = heapq.heappop(node_queue)[2]
+            if current in closed:
+                continue
+            if current == goal_idx:  # path finished
                 break
+            closed.add(current)
 
-            for n in self._get_neighbours(current):
-                new_cost = cost_so_far[current] + self.get_cost(current, n)
+            for n, cost in self.neighbours[current]:
+                if n in closed:
+                    continue
+                new_cost = cost_so_far[current] + cost
+                if n not in cost_so_far or new_cost < cost_so_far[n]:
+                    cost_so_far[n] = new_cost
+                    priority = new_cost + heuristic[n]
+                    heapq.heappush(node_queue, (priority, next(counter), n))
+                    came_from[n] = current
+        if goal_idx not in cost_so_far:
+            raise ValueError('No path from {} to {}'.format(start.id, goal.id))
+        nodes = self._backtrack_path(came_from, goal_idx, start_idx)
+
+        return Path([self.nodes[n] for n in nodes], cost_so_far[goal_idx])
+
+    def _find_shortest_bidirectional(self, start, goal):
+        """Executes bidirectional Dijkstra path searching, forward from start and backward from goal until the
+        searches meet. Returns the same path as _find_shortest, up to paths with equal cost"""
+        start_idx = self.index_from_id(start.id)
+        goal_idx = self.index_from_id(goal.id)
+        counter = itertools.count()
+        # forward and backward search: queue, cost so far, came from, closed nodes, adjacency
+        searches = [([(0, next(counter), start_idx)], {start_idx: 0}, {start_idx: None}, set(), self.neighbours),
+                    ([(0, next(counter), goal_idx)], {goal_idx: 0}, {goal_idx: None}, set(), self.reverse_neighbours)]
+        best_cost, meeting = (0, start_idx) if start_idx == goal_idx else (inf, None)
+
+        while searches[0][0] and searches[1][0]:
+            # stop when no path through the unexplored nodes can be cheaper than the best one found
+            if searches[0][0][0][0] + searches[1][0][0][0] >= best_cost:
+                break
+            side = 0 if searches[0][0][0][0] <= searches[1][0][0][0] else 1
+            node_queue, cost_so_far, came_from, closed, neighbours = searches[side]
+            other_cost = searches[1 - side][1]
+            current = heapq.heappop(node_queue)[2]
+            if current in closed:
+                continue
+            closed.add(current)
+
+            for n, cost in neighbours[current]:
+                new_cost = cost_so_far[current] + cost
                 if n not in cost_so_far or new_cost < cost_so_far[n]:
                     cost_so_far[n] = new_cost
-                    priority = new_cost + self.distance(goal, n)
-                    node_queue.put((priority, n), priority)
+                    heapq.heappush(node_queue, (new_cost, next(counter), n))
                     came_from[n] = current
-        nodes = self._backtrack_path(came_from, goal, start)
+                if n in other_cost and cost_so_far[n] + other_cost[n] < best_cost:
+                    best_cost, meeting = cost_so_far[n] + other_cost[n], n
+        if meeting is None:
+            raise ValueError('No path from {} to {}'.format(start.id, goal.id))
 
-        return Path(nodes, cost_so_far[goal])
+        nodes = self._backtrack_path(searches[0][2], meeting, start_idx)
+        backward = self._backtrack_path(searches[1][2], meeting, goal_idx)
+        nodes += backward[::-1][1:]
+        return Path([self.nodes[n] for n in nodes], best_cost)
 
     def _calculate_shortest_paths(self):
         """Compute paths to all nodes from all nodes in graph. Useful for precomputing paths"""
@@ -138,53 +253,119 @@ class GraphProcessor:
 
     @staticmethod
     def __distance(latitude1, longitude1, latitude2, longitude2):
-        earth_radius = 6373.0
-
-        lat1 = radians(latitude1)
-        lon1 = radians(longitude1)
-        lat2 = radians(latitude2)
-        lon2 = radians(longitude2)
+        return utils.calcDistance(latitude1, longitude1, latitude2, longitude2)
 
-        dlon = lon2 - lon1
-        dlat = lat2 - lat1
-
-        a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
-        c = 2 * atan2(sqrt(a), sqrt(1 - a))
-
-        distance = earth_radius * c
-        return distance
+    def distances(self, lat, lon):
+        """Distances from a geo point to all nodes"""
+        return utils.haversine(lat, lon, self.lats, self.lons)
 
     def node_from_id(self, uuid):
         """Finds a node from its name/uuid"""
+        return self.node_map.get(uuid)
+
+    def index_from_id(self, uuid):
+        """Finds the index of a node in nodes from its name/uuid"""
+        return self.node_index.get(uuid)
+
+    def get_path(self, a, b, bidirectional=False):
+        """finds a path from Node A to Node B, read from the shortest path matrices when they are computed,
+        otherwise searched with A* (or bidirectional Dijkstra). Paths are kept in a LRU cache."""
+        key = (a.id, b.id)
+        if key in self.path_cache:
+            self.path_cache.move_to_end(key)
+            return self.path_cache[key]
+        if self.dist is None:
+            path = self._find_shortest_bidirectional(a, b) if bidirectional else self._find_shortest(a, b)
+        else:
+            path = self._path_from_matrices(a, b)
+        self.path_cache[key] = path
+        if len(self.path_cache) > PATH_CACHE_SIZE:
+            self.path_cache.popitem(last=False)
+        return path
+
+    def _path_from_matrices(self, a, b):
+        """Path from Node A to Node B backtracked over the predecessor matrix"""
+        start = self.index_from_id(a.id)
+        goal = self.index_from_id(b.id)
+        nodes = [goal]
+        while nodes[-1] != start:
+            previous = self.predecessors[start, nodes[-1]]
+            if previous < 0:
+                raise ValueError('No path from {} to {}'.format(a.id, b.id))
+            nodes.append(previous)
+        nodes.reverse()
+        return Path([self.nodes[n] for n in nodes], float(self.dist[start, goal]))
+
+    def road_distance(self, a, b):
+        """Cost of the shortest path from Node A to Node B"""
+        if self.dist is None:
+            return self.get_path(a, b).cost
+        return float(self.dist[self.index_from_id(a.id), self.index_from_id(b.id)])
+
+    def road_distances(self, a):
+        """Costs of the shortest paths from Node A to all nodes, inf for unreachable nodes.
+        A row of the all pairs matrix when it is computed, otherwise a single source Dijkstra"""
+        idx = self.index_from_id(a.id)
+        if self.dist is not None:
+            return self.dist[idx]
+        return csgraph.dijkstra(self.cost_matrix(), directed=True, indices=idx)
+
+    def shortest_paths(self):
+        """Compute all pairs shortest path distances and predecessors on the cost matrix"""
+        self.dist, self.predecessors = csgraph.dijkstra(self.cost_matrix(), directed=True, return_predecessors=True)
+
+    def paths_fingerprint(self):
+        """Hash of the nodes and edges, stored path matrices are used only for the same graph"""
+        digest = hashlib.sha256()
         for n in self.nodes:
-            if n.id == uuid:
-                return n
-
-    def get_path(self, a, b):
-        """finds a path from Node A to Node B"""
-        return self._find_shortest(a, b)
+            digest.update(str(n.id).encode() + b'\0')
+        for e in self.edges:
+            digest.update('{}\0{}\0{}\0'.format(e.start, e.end, e.cost).encode())
+        return digest.hexdigest()
 
     def make_matrix(self):
-        """Build incidence matrix for graph"""
-        self.incident_matrix = []
-
-        for ni, n in enumerate(self.nodes):
-            tmp_arr = [0] * len(self.edges)
-            for ne, e in enumerate(self.edges):
-                if e.start == n.id:
-                    tmp_arr[ne] = 1
-            self.incident_matrix.append(tmp_arr)
+        """Build sparse incidence matrix for graph, 1 in row of the start node of every edge"""
+        rows, cols = [], []
+        for ne, e in enumerate(self.edges):
+            ni = self.index_from_id(e.start)
+            if ni is not None:
+                rows.append(ni)
+                cols.append(ne)
+        self.incident_matrix = sparse.csr_matrix(([1] * len(rows), (rows, cols)),
+                                                 shape=(len(self.nodes), len(self.edges)))
+
+    def dense_incidence_matrix(self):
+        """Incidence matrix as a list of lists, node x edge"""
+        return self.incident_matrix.toarray().tolist()
+
+    def cost_matrix(self):
+        """Sparse node x node matrix with the cheapest edge cost from node i to node j, edges to or from ids that are
+        not nodes are left out. Built once and kept until the indexes are rebuilt, callers must not change it"""
+        if self.cost_csr is not None:
+            return self.cost_csr
+        cheapest = {}  # parallel edges: keep the cheapest one instead of the sum
+        for e in self.edges:
+            key = (self.node_index.get(e.start), self.node_index.get(e.end))
+            if key[0] is None or key[1] is None:
+                continue
+            if key not in cheapest or e.cost < cheapest[key]:
+                cheapest[key] = e.cost
+        rows = [key[0] for key in cheapest]
+        cols = [key[1] for key in cheapest]
+        self.cost_csr = sparse.csr_matrix((list(cheapest.values()), (rows, cols)),
+                                          shape=(len(self.nodes), len(self.nodes)))
+        return self.cost_csr
+
+    def get_spatial_index(self):
+        """Spatial index of the nodes labelled by node index, built on first use"""
+        if self.spatial_index is None:
+            self.spatial_index = SpatialIndex(self.lats, self.lons)
+        return self.spatial_index
 
     def map_vehicles(self, vehicles):
         """Map vehicles to closest node for demo code"""
-        map_trucks = []
-        for truck in vehicles:
-            min_dist = inf
-            node = None
-            for node in self.nodes:
-                dist = self.__distance(truck['latitude'], truck['longitude'], node.lat, node.lon)
-                if dist < min_dist:
-                    min_dist = dist
-                    node = node
-            map_trucks.append(node)
-        return map_trucks
+        if not vehicles:
+            return []
+        indexes, _ = self.get_spatial_index().query_many([truck['latitude'] for truck in vehicles],
+                                                       [truck['longitude'] for truck in vehicles])
+        return [self.nodes[i] for i in indexes]
@@ -1,5 +1,5 @@
 import json
-from math import sin, cos, sqrt, atan2, radians, inf
+from modules.create_graph.utils import utils
 from modules.mockup_demo.mockup_partitioning import MockupPartitioning
 
 class MockupGraph:
@@ -16,24 +16,6 @@ class MockupGraph:
             nodes = data["nodes"]
         return (nodes, edges)
 
-    def __distance(self, latitude1, longitude1, latitude2, longitude2):
-        # approximate radius of earth in km
-        R = 6373.0
-
-        lat1 = radians(latitude1)
-        lon1 = radians(longitude1)
-        lat2 = radians(latitude2)
-        lon2 = radians(longitude2)
-
-        dlon = lon2 - lon1
-        dlat = lat2 - lat1
-
-        a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
-        c = 2 * atan2(sqrt(a), sqrt(1 - a))
-
-        distance = R * c
-        return distance
-
     def get_graph(self):
         node_array = []
         edge_array = []
@@ -55,17 +37,10 @@ class MockupGraph:
         return (node_array, edge_array, incident_matrix)
 
     def map_truck(self, trucks):
-        map_trucks = []
-        for truck in trucks:
-            min = inf
-            id  = inf
-            for key, value in self.nodes.items():
-                dist =self.__distance(truck['latitude'], truck['longitude'], value['lat'], value['lon'])
-                if dist < min:
-                    min = dist
-                    id = value['node_id']
-            map_trucks.append([truck['id'], id])
-        return map_trucks
+        nodes = list(self.nodes.values())
+        indexes, _ = utils.nearest([value['lat'] for value in nodes], [value['lon'] for value in nodes],
+                                   [truck['latitude'] for truck in trucks], [truck['longitude'] for truck in trucks])
+        return [[truck['id'], nodes[idx]['node_id']] for truck, idx in zip(trucks, indexes)]
 
 if __name__ == "__main__":
 
@@ -2,6 +2,8 @@ import json
 import os
 import pickle
 
+import numpy as np
+
 from ..create_graph.config.config_parser import ConfigParser
 from ..create_graph.pojo.pruneG import GraphPrune
 from ..partitioning.post_partitioning import GraphPartitioner
@@ -25,9 +27,49 @@ class GraphPreprocessing:
         graph_path = config_parser.get_graph_path(use_case)
         pickle_path = config_parser.get_pickle_path(use_case)
         partitioner = GraphPreprocessing.init_partitioner(graph_path, pickle_path)
+        GraphPreprocessing.init_shortest_paths(partitioner.graphProcessors,
+                                               GraphPreprocessing.paths_path(pickle_path))
 
         return partitioner.graphProcessors
 
+    @staticmethod
+    def paths_path(pickle_path):
+        """Shortest path matrices of the graphs are stored next to the pickle file"""
+        return os.path.splitext(pickle_path)[0] + '_paths.npz'
+
+    @staticmethod
+    def init_shortest_paths(graph_processors, paths_path):
+        """
+        Method used for loading the all pairs shortest path matrices of the graphs from the file stored next to the
+        pickle or computing them and storing the file. Stored matrices are used only if the graph did not change.
+        :param graph_processors: graphs of the use case
+        :param paths_path: path of the .npz file
+        """
+        stored = {}
+        if os.path.exists(paths_path):
+            with np.load(paths_path) as loadfile:
+                stored = dict(loadfile)
+
+        arrays = {}
+        computed = False
+        for i, graph in enumerate(graph_processors):
+            fingerprint = graph.paths_fingerprint()
+            if 'fingerprint_{}'.format(i) in stored and str(stored['fingerprint_{}'.format(i)]) == fingerprint:
+                graph.dist = stored['dist_{}'.format(i)]
+                graph.predecessors = stored['predecessors_{}'.format(i)]
+            else:
+                graph.shortest_paths()
+                computed = True
+            arrays['fingerprint_{}'.format(i)] = np.array(fingerprint)
+            arrays['dist_{}'.format(i)] = graph.dist
+            arrays['predecessors_{}'.format(i)] = graph.predecessors
+
+        if computed:
+            np.savez(paths_path, **arrays)
+            print('Stored shortest paths of {} graphs'.format(len(graph_processors)))
+        else:
+            print('Loaded shortest paths of {} graphs'.format(len(graph_processors)))
+
     @staticmethod
     def save_graph_file(nodes, edges, graph_path):
         graph = {'nodes': nodes, 'edge': edges}
@@ -1,7 +1,12 @@
+import os
+import tempfile
 import unittest
 
+import numpy as np
 from scipy.sparse import csr_matrix
 
+from modules.cvrp.test.graphs import line_graph
+from modules.partitioning.graph_partitioning_preprocess import GraphPreprocessing
 from modules.partitioning.recursive_bipart import RecursiveBipart
 from modules.partitioning.utils import cut_size_undirected
 
@@ -67,5 +72,31 @@ class TestRecBipartition(unittest.TestCase):
         self.assertEqual(cut, 2.5)
 
 
+class TestShortestPathMatrices(unittest.TestCase):
+
+    def test_matrices_are_stored_and_reused(self):
+        graphs = [line_graph(5), line_graph(3)]
+        a, b = graphs[0].nodes[4], graphs[0].nodes[1]
+        searched = graphs[0].get_path(a, b)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths_path = os.path.join(tmp_dir, "graphs_paths.npz")
+            GraphPreprocessing.init_shortest_paths(graphs, paths_path)
+            path = graphs[0].get_path(a, b)
+            self.assertEqual(path.path, searched.path)
+            self.assertEqual(path.cost, 3)
+            self.assertEqual(searched.cost, 3)
+            self.assertEqual(graphs[0].road_distance(a, b), 3)
+
+            reloaded = [line_graph(5), line_graph(3)]
+            GraphPreprocessing.init_shortest_paths(reloaded, paths_path)
+            self.assertTrue(np.array_equal(reloaded[1].predecessors, graphs[1].predecessors))
+
+            # a changed graph gets new matrices
+            changed = [line_graph(5), line_graph(4)]
+            GraphPreprocessing.init_shortest_paths(changed, paths_path)
+            self.assertEqual(changed[1].dist.shape, (4, 4))
+
+
 if __name__ == "__main__":
     unittest.main()
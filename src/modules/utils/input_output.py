@@ -1,10 +1,8 @@
 import copy
-import csv
 from datetime import datetime
 
-import numpy as np
-
 from ..create_graph.config.config_parser import ConfigParser
+from ..utils.spatial_index import SpatialIndex
 from ..utils.tsp import Tsp
 from ..utils.ConflictNodeOrdering import OrderRelations
 
@@ -489,27 +487,11 @@ class InputOutputTransformer:
             current_lat = location_dict["latitude"]
             current_lon = location_dict["longitude"]
 
-            distances = {}  # Dict of distances between initial location and all the nodes in CSV file
-            # Open file and read line by line
-            with open(csv_file_path, encoding="utf8") as csv_file:
-                csv_reader = csv.reader(csv_file, delimiter=',')
-
-                for row in csv_reader:
-                    id = row[1]
-                    lat = row[2]
-                    lon = row[3]
-
-                    a = np.array((float(lat), float(lon)))
-                    b = np.array((float(current_lat), float(current_lon)))
-
-                    distances[id] = np.linalg.norm(a - b)
-
-                csv_file.close()
-
-                if parcel_id is not None:
-                    transformation_map.map(parcel_id, [current_lat, current_lon])
+            # nearest station from the index of the CSV file, built once per file
+            station, _ = SpatialIndex.from_csv(csv_file_path).query(float(current_lat), float(current_lon))
 
-                station = min(distances, key=distances.get)
+            if parcel_id is not None:
+                transformation_map.map(parcel_id, [current_lat, current_lon])
 
         if station is None and (current_lat is None or current_lon is None):
             raise ValueError("location info should have a non-NULL fields 'station' "
@@ -0,0 +1,72 @@
+import csv
+import os
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from ..create_graph.utils import utils
+
+
+class SpatialIndex:
+    """
+    Nearest neighbour lookups on geo points, a KD-tree over the points as unit vectors in 3D.
+    The straight line (chord) between two unit vectors grows with the great circle distance, so the nearest points
+    in the tree are the nearest points on the earth. Distances are returned in km, the same as utils.haversine.
+    """
+
+    # indexes of station CSV files, path -> (modification time, index)
+    _csv_indexes = {}
+
+    def __init__(self, lats, lons, labels=None):
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        self.labels = list(labels) if labels is not None else None
+        self.tree = cKDTree(utils.unit_vectors(self.lats, self.lons).reshape(-1, 3))
+
+    def __len__(self):
+        return len(self.lats)
+
+    @staticmethod
+    def _chord_to_km(chord):
+        return utils.EARTH_RADIUS * 2 * np.arcsin(np.minimum(chord / 2, 1))
+
+    def _label(self, idx):
+        return self.labels[idx] if self.labels is not None else int(idx)
+
+    def query_many(self, lats, lons, k=1):
+        """Nearest k points of every (lat, lon). Returns the labels (point indexes without labels) and distances in km,
+        a list and an array of len(lats) for k=1, lists of at most k labels and a len(lats) x k array otherwise"""
+        if len(self) == 0:
+            raise ValueError('Spatial index has no points')
+        vectors = utils.unit_vectors(lats, lons).reshape(-1, 3)
+        if k == 1:
+            chord, indexes = self.tree.query(vectors)
+            return [self._label(idx) for idx in indexes], self._chord_to_km(chord)
+        chord, indexes = self.tree.query(vectors, k=list(range(1, min(k, len(self)) + 1)))
+        return [[self._label(idx) for idx in row] for row in indexes], self._chord_to_km(chord)
+
+    def query(self, lat, lon, k=1):
+        """Nearest point (k=1) or the k nearest points of one location: label(s) and distance(s) in km"""
+        labels, distances = self.query_many([lat], [lon], k)
+        return labels[0], distances[0]
+
+    @staticmethod
+    def from_csv(csv_path):
+        """Index of the stations in a CSV file with rows address, id, latitude, longitude, labelled by id.
+        Built once per file and rebuilt when the file changes"""
+        mtime = os.path.getmtime(csv_path)
+        cached = SpatialIndex._csv_indexes.get(csv_path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        labels, lats, lons = [], [], []
+        with open(csv_path, encoding="utf8") as csv_file:
+            for row in csv.reader(csv_file, delimiter=','):
+                if len(row) == 0:
+                    continue
+                labels.append(row[1])
+                lats.append(float(row[2]))
+                lons.append(float(row[3]))
+        index = SpatialIndex(lats, lons, labels)
+        SpatialIndex._csv_indexes[csv_path] = (mtime, index)
+        return index
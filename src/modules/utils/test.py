@@ -1,11 +1,17 @@
+import os
+import tempfile
 import unittest
 
+import numpy as np
 from scipy.sparse import csr_matrix
 
+from modules.create_graph.utils import utils
+
 from modules.partitioning.recursive_bipart import RecursiveBipart
 from modules.partitioning.utils import cut_size_undirected
 
 import modules.utils.ConflictNodeOrdering as node_ordering
+from modules.utils.spatial_index import SpatialIndex
 
 class TestConflictOrdering(unittest.TestCase):
 
@@ -29,5 +35,32 @@ class TestConflictOrdering(unittest.TestCase):
 
 
 
+class TestSpatialIndex(unittest.TestCase):
+
+    def test_queries_match_haversine(self):
+        rng = np.random.default_rng(1)
+        lats, lons = rng.uniform(37, 47, 300), rng.uniform(13, 24, 300)
+        query_lats, query_lons = rng.uniform(37, 47, 40), rng.uniform(13, 24, 40)
+        scalar = utils.haversine_matrix(query_lats, query_lons, lats, lons)
+
+        index = SpatialIndex(lats, lons)
+        labels, distances = index.query_many(query_lats, query_lons)
+        self.assertEqual(labels, np.argmin(scalar, axis=1).tolist())
+        self.assertTrue(np.allclose(distances, scalar.min(axis=1)))
+        labels, distances = index.query(query_lats[0], query_lons[0], k=3)
+        self.assertEqual(labels, np.argsort(scalar[0])[:3].tolist())
+        self.assertTrue(np.allclose(distances, np.sort(scalar[0])[:3]))
+
+    def test_csv_index_is_built_once(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_path = os.path.join(tmp_dir, "posts.csv")
+            with open(csv_path, "w") as csv_file:
+                csv_file.write("Kapele,S1,45.93,15.67\n\nGloboko,S2,45.95,15.63\n")
+            stations = SpatialIndex.from_csv(csv_path)
+            self.assertIs(SpatialIndex.from_csv(csv_path), stations)
+            self.assertEqual(stations.query(45.951, 15.631)[0], "S2")
+            self.assertEqual(stations.query_many([45.93, 45.95], [15.67, 15.63], k=5)[0], [["S1", "S2"], ["S2", "S1"]])
+
+
 if __name__ == "__main__":
     unittest.main()
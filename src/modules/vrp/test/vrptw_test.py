@@ -0,0 +1,39 @@
+import pytest
+
+from modules.cvrp.vrptw import VRPTW
+
+
+def test_vrptw_request_from_readme():
+    req_json = {
+        'incidenceMat': [
+            [-1, -1, 1, 0, 0, 0, 0, 0, 0, 1, 0, 0],
+            [1, 0, -1, -1, 1, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 1, -1, -1, -1, 1, 0, 0, 1, 0],
+            [0, 0, 0, 0, 0, 1, 0, -1, -1, 0, 0, 1],
+            [0, 1, 0, 0, 0, 0, 1, 0, 1, -1, -1, -1]
+        ],
+        'costMat': [[6, 1, 6, 6, 6, 1, 1, 1, 1, 1, 1, 1]] * 2,
+        'edgeTimeV': [1] * 12,
+        'startV': [1, 1],
+        'endV': [1, 1],
+        'nodeDistributionV': [0, 4, 3, 4, 3],
+        'vehicleCapacityV': [10, 10],
+        'nodeOpenV': [0, 0, 0, 0, 0],
+        'nodeCloseV': [10, 10, 10, 10, 10]
+    }
+    response = VRPTW.solve_request(req_json)
+    assert response['cost'] == 17.0
+    # 1 -> 2 -> 1 and 1 -> 5 -> 4 -> 3 -> 5 -> 1, in any vehicle order
+    assert sorted(response['routes']) == [[0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 1.0, 0.0, 1.0, 0.0, 1.0],
+                                          [1.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]]
+
+    # node 3 closes before the cycle over node 4 reaches it, it is served first
+    req_json['nodeCloseV'] = [10, 10, 2, 10, 10]
+    response = VRPTW.solve_request(req_json)
+    route = max(response['routes'], key=sum)
+    assert route[10] == 1 and route[7] == 0
+
+    # node 4 can not be reached at time 1
+    req_json['nodeCloseV'] = [10, 10, 10, 1, 10]
+    with pytest.raises(ValueError):
+        VRPTW.solve_request(req_json)